@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the portfolio solver.
+
+Each subcommand prints a markdown table so results can be pasted into docs
+or commit messages.
+
+Usage:
+    python benchmark.py assembly
+    python benchmark.py assembly --outpost-scale 8 --repeat 20
+    python benchmark.py resolve
+    python benchmark.py presolve
+    python benchmark.py symmetry
+    python benchmark.py startup
+    python benchmark.py async --requests 200 --distinct 16 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+import solve_portfolio as sp
+
+
+BASE_PATH = Path(__file__).resolve().parent.parent
+REGIONS = ["valley_iv", "wuling"]
+
+
+def _time(fn, repeat: int) -> float:
+    """Return the best wall time of ``repeat`` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def _scaled_region(region_id: str, outpost_scale: int) -> sp.RegionData:
+    """Load a region and replicate its outposts ``outpost_scale`` times."""
+    region = sp.load_region_data(region_id, BASE_PATH)
+    if outpost_scale > 1:
+        outposts = []
+        for k in range(outpost_scale):
+            for o in region.outposts:
+                o2 = dict(o)
+                o2["id"] = f"{o['id']}#{k}" if k else o["id"]
+                outposts.append(o2)
+        region.outposts = outposts
+        for p in region.products:
+            p.sold_at = [
+                f"{oid}#{k}" if k else oid
+                for oid in p.sold_at for k in range(outpost_scale)
+            ]
+        region.refresh_product_table()
+    return region
+
+
+def _dense_multi_outpost(region: sp.RegionData, min_interval_hours: float):
+    """
+    The former solve_portfolio_multi_outpost: one np.zeros(n_vars) row per
+    constraint, stacked with np.array and handed to milp dense. Constraints
+    added since (machine counts) are built the same way so both sides solve
+    the same model.
+
+    Returns ``(milp result, A_ub)``. Kept here as the baseline for ``assembly``.
+    """
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    machine_increment = 0.25
+    products = list(region.products)
+    outposts = region.outposts
+    n, m = len(products), len(outposts)
+    battery_indices = [i for i, p in enumerate(products) if p.is_battery]
+    rate_increments = [p.production_rate * machine_increment for p in products]
+    power_increment = 0.25
+    power_rate_increments = [p.production_rate * power_increment for p in products]
+    n_q, n_pw = n, len(battery_indices)
+    n_vars = n_q + n_pw + n * m
+
+    def s_idx(i: int, j: int) -> int:
+        return n_q + n_pw + i * m + j
+
+    c = np.zeros(n_vars)
+    for i, p in enumerate(products):
+        for j, o in enumerate(outposts):
+            if sp._is_sold_at(p, o):
+                c[s_idx(i, j)] = -p.trade_value
+
+    A_ub, b_ub, A_eq, b_eq = [], [], [], []
+    for ore_type in ["originium_ore", "amethyst_ore", "ferrium_ore", "cuprium_ore"]:
+        rate = region.mining_rates.get(ore_type, 0)
+        if rate > 0:
+            row = np.zeros(n_vars)
+            for i, p in enumerate(products):
+                row[i] = getattr(p, ore_type, 0.0) / p.production_rate * rate_increments[i]
+            A_ub.append(row)
+            b_ub.append(rate)
+    pa_supply = region.mining_rates.get("precipitation_acid", 0)
+    if pa_supply > 0:
+        row = np.zeros(n_vars)
+        for i, p in enumerate(products):
+            row[i] = p.precipitation_acid / p.production_rate * rate_increments[i]
+        A_ub.append(row)
+        b_ub.append(pa_supply)
+    row = np.zeros(n_vars)
+    for i, p in enumerate(products):
+        row[i] = p.power_consumption / p.production_rate * rate_increments[i]
+    for bj, bi in enumerate(battery_indices):
+        row[n_q + bj] = -products[bi].battery_power * power_rate_increments[bi]
+    A_ub.append(row)
+    b_ub.append(-region.power_buffer)
+    for bj, bi in enumerate(battery_indices):
+        row = np.zeros(n_vars)
+        row[n_q + bj] = power_increment
+        row[bi] = -machine_increment
+        A_ub.append(row)
+        b_ub.append(0)
+    for i in range(n):
+        row = np.zeros(n_vars)
+        for j in range(m):
+            row[s_idx(i, j)] = 1
+        row[i] = -rate_increments[i]
+        if i in battery_indices:
+            row[n_q + battery_indices.index(i)] = power_rate_increments[i]
+        A_ub.append(row)
+        b_ub.append(0)
+    for i, p in enumerate(products):
+        for j, o in enumerate(outposts):
+            if not sp._is_sold_at(p, o):
+                row = np.zeros(n_vars)
+                row[s_idx(i, j)] = 1
+                A_eq.append(row)
+                b_eq.append(0)
+    # The sparse model's machine-count rows, built the dense way
+    caps = sp._effective_machine_caps(region, None)
+    for machine_id in sorted(caps):
+        coef = region.product_table.machines_per_rate(machine_id) * rate_increments
+        if np.any(coef):
+            row = np.zeros(n_vars)
+            row[:n] = coef
+            A_ub.append(row)
+            b_ub.append(caps[machine_id])
+    if any(p.sewage_consumption > 0 or p.sewage_production > 0 for p in products):
+        row = np.zeros(n_vars)
+        for i, p in enumerate(products):
+            row[i] = (p.sewage_consumption - p.sewage_production) / p.production_rate * rate_increments[i]
+        A_ub.append(row)
+        b_ub.append(0)
+    max_sale_rate = region.storage_limit / (min_interval_hours * 60)
+    for i in range(n):
+        for j in range(m):
+            row = np.zeros(n_vars)
+            row[s_idx(i, j)] = 1
+            A_ub.append(row)
+            b_ub.append(max_sale_rate)
+    for j, o in enumerate(outposts):
+        rate_per_h = o.get("ticket_rate", 0)
+        if rate_per_h > 0:
+            row = np.zeros(n_vars)
+            for i, p in enumerate(products):
+                if sp._is_sold_at(p, o):
+                    row[s_idx(i, j)] = p.trade_value
+            A_ub.append(row)
+            b_ub.append(rate_per_h / 60)
+
+    lower = np.zeros(n_vars)
+    upper = np.full(n_vars, np.inf)
+    for i, p in enumerate(products):
+        upper[i] = p.production_limit / rate_increments[i] if p.production_limit is not None else 10000
+    for bj, bi in enumerate(battery_indices):
+        upper[n_q + bj] = upper[bi] * machine_increment / power_increment
+    integrality = np.zeros(n_vars, dtype=int)
+    integrality[:n_q + n_pw] = 1
+
+    A_ub = np.array(A_ub)
+    constraints = [LinearConstraint(A_ub, -np.inf, np.array(b_ub))]
+    if A_eq:
+        constraints.append(LinearConstraint(np.array(A_eq), np.array(b_eq), np.array(b_eq)))
+    result = milp(c, constraints=constraints, bounds=Bounds(lower, upper), integrality=integrality)
+    return result, A_ub
+
+
+# =============================================================================
+# Benchmarks
+# =============================================================================
+
+def bench_assembly(args: argparse.Namespace) -> None:
+    """The former dense row-list model vs solve_portfolio_multi_outpost, end to end."""
+    print(f"## Constraint assembly (outpost scale ×{args.outpost_scale}, best of {args.repeat})")
+    print("")
+    print("Rows, vars and nnz are those of the former dense inequality matrix.")
+    print("")
+    print("| Region | Rows | Vars | nnz | Sparse (ms) | Dense (ms) | Speedup |")
+    print("|--------|-----:|-----:|----:|------------:|-----------:|--------:|")
+
+    for region_id in REGIONS:
+        region = _scaled_region(region_id, args.outpost_scale)
+        sparse_solve = lambda: sp.solve_portfolio_multi_outpost(region, args.interval)  # noqa: E731
+        dense_solve = lambda: _dense_multi_outpost(region, args.interval)  # noqa: E731
+
+        result, A_ub = dense_solve()
+        assert abs(-result.fun - sparse_solve().ticket_rate) < 1e-6
+        t_sparse = _time(sparse_solve, args.repeat)
+        t_dense = _time(dense_solve, args.repeat)
+        rows, n_vars = A_ub.shape
+        print(f"| {region_id} | {rows} | {n_vars} | {np.count_nonzero(A_ub)} | {t_sparse:.1f} | {t_dense:.1f} "
+              f"| {t_dense / t_sparse:.2f}× |")
+    print("")
+
+
+def bench_resolve(args: argparse.Namespace) -> None:
+    """Per-solve cost of rebuilding the model vs re-solving a compiled PortfolioModel."""
+    intervals = [6.0, 12.0, 24.0, 48.0]
+    print(f"## Re-solve over intervals {intervals} (best of {args.repeat})")
+    print("")
+    print("| Region | Compile (ms) | Rebuild + solve (ms/solve) | Compiled solve (ms/solve) |")
+    print("|--------|-------------:|---------------------------:|--------------------------:|")
+
+    for region_id in REGIONS:
+        region = sp.load_region_data(region_id, BASE_PATH)
+        compile_fn = lambda: sp.compile_portfolio_multi_outpost(region)  # noqa: E731
+        model = compile_fn()
+
+        def rebuild():
+            for h in intervals:
+                sp.solve_portfolio_multi_outpost(region, h)
+
+        def resolve():
+            for h in intervals:
+                model.solve(h)
+
+        t_compile = _time(compile_fn, args.repeat)
+        t_rebuild = _time(rebuild, args.repeat) / len(intervals)
+        t_resolve = _time(resolve, args.repeat) / len(intervals)
+        print(f"| {region_id} | {t_compile:.2f} | {t_rebuild:.2f} | {t_resolve:.2f} |")
+    print("")
+
+
+def bench_presolve(args: argparse.Namespace) -> None:
+    """Branch-and-bound nodes and time with raw vs implied integer bounds, with and without HiGHS presolve."""
+    print(f"## Bound-tightening presolve ({args.interval}h, best of {args.repeat})")
+    print("")
+    print("HiGHS presolve derives most of the implied bounds itself; the last columns turn it off "
+          "to show what the bounds save branch-and-bound on their own.")
+    print("")
+    print("| Region | -i | Nodes (raw) | Nodes (implied) | Raw (ms) | Implied (ms) "
+          "| Nodes (raw, no HiGHS presolve) | Nodes (implied, no HiGHS presolve) |")
+    print("|--------|---:|------------:|----------------:|---------:|-------------:"
+          "|-------------------------------:|-----------------------------------:|")
+
+    for region_id in REGIONS:
+        for increment in (1, 2, 3, 4):
+            scenario = sp.Scenario(region=region_id, interval_hours=args.interval, increment=increment)
+            model = sp.ModelCache(BASE_PATH).model(scenario)
+            nodes = {}
+            times = {}
+            for tighten in (False, True):
+                for presolve in (True, False):
+                    solve = lambda: model.solve(  # noqa: E731
+                        args.interval, bonus_rate=scenario.bonus_rate,
+                        tighten_bounds=tighten, presolve=presolve,
+                    )
+                    nodes[tighten, presolve] = solve().mip_node_count
+                    if presolve:
+                        times[tighten] = _time(solve, args.repeat)
+            print(f"| {region_id} | {increment} | {nodes[False, True]} | {nodes[True, True]} "
+                  f"| {times[False]:.1f} | {times[True]:.1f} | {nodes[False, False]} | {nodes[True, False]} |")
+    print("")
+
+
+def bench_symmetry(args: argparse.Namespace) -> None:
+    """Branch-and-bound nodes and time with and without merging interchangeable columns."""
+    intervals = [6.0, 12.0, 24.0, 48.0, 72.0]
+    print(f"## Symmetry reduction (valley_iv -i {args.increment}, best of {args.repeat})")
+    print("")
+    print("| Interval | Columns | Merged | Nodes (full) | Nodes (merged) | Full (ms) | Merged (ms) | Speedup |")
+    print("|---------:|--------:|-------:|-------------:|---------------:|----------:|------------:|--------:|")
+
+    cache = sp.ModelCache(BASE_PATH)
+    for interval in intervals:
+        scenario = sp.Scenario(region="valley_iv", interval_hours=interval, increment=args.increment)
+        merged = cache.model(scenario)
+        full = replace(merged)  # same arrays, own column_groups cache
+        n = full.n_vars
+        full.__dict__["column_groups"] = (np.arange(n), np.arange(n))
+        n_merged = len(merged.column_groups[0])
+
+        results = {}
+        times = {}
+        for label, model in (("full", full), ("merged", merged)):
+            solve = lambda: model.solve(interval)  # noqa: E731
+            results[label] = solve()
+            times[label] = _time(solve, args.repeat)
+        assert abs(results["full"].ticket_rate - results["merged"].ticket_rate) < 1e-6
+        print(f"| {interval:g}h | {n} | {n_merged} | {results['full'].mip_node_count} "
+              f"| {results['merged'].mip_node_count} | {times['full']:.1f} | {times['merged']:.1f} "
+              f"| {times['full'] / times['merged']:.2f}× |")
+    print("")
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    """Wall time of fresh CLI processes: import, --help, cached and uncached first results."""
+    script_dir = Path(__file__).resolve().parent
+    script = str(script_dir / "solve_portfolio.py")
+
+    def run(cmd: list[str]) -> float:
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, *cmd], cwd=script_dir, check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        return (time.perf_counter() - t0) * 1000
+
+    def row(label: str, cmd: list[str]) -> None:
+        times = sorted(run(cmd) for _ in range(args.repeat))
+        print(f"| {label} | {statistics.median(times):.0f} | {times[0]:.0f} |")
+
+    print(f"## CLI startup (fresh process, {args.repeat} runs)")
+    print("")
+    print("| Command | Median (ms) | Min (ms) |")
+    print("|---------|------------:|---------:|")
+    row("python -c pass", ["-c", "pass"])
+    row("import numpy", ["-c", "import numpy"])
+    row("import scipy.optimize", ["-c", "import scipy.optimize"])
+    row("import solve_portfolio", ["-c", "import solve_portfolio"])
+    row("--help", [script, "--help"])
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for region_id in REGIONS:
+            cmd = [script, region_id, str(args.interval)]
+            run(cmd + ["--cache-dir", cache_dir])  # warm the result cache
+            row(f"{region_id} {args.interval:g}h (cached result)", cmd + ["--cache-dir", cache_dir])
+            row(f"{region_id} {args.interval:g}h (solve)", cmd + ["--no-cache"])
+    print("")
+
+
+def bench_async(args: argparse.Namespace) -> None:
+    """
+    A burst of requests (``--distinct`` scenarios, repeated) answered by one
+    blocking ModelCache inside the event loop vs SolverPool.solve_async.
+    """
+    intervals = np.linspace(6, 96, args.distinct)
+    scenarios = [sp.Scenario(args.region, float(intervals[k % args.distinct])) for k in range(args.requests)]
+
+    async def ticker(lags: list[float], stop: asyncio.Event) -> None:
+        # Largest gap between 1 ms ticks = how long the loop was blocked
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            lags.append((now - last) * 1000)
+            last = now
+
+    async def burst(answer) -> tuple[float, list[float], float]:
+        lags: list[float] = []
+        stop = asyncio.Event()
+        tick = asyncio.create_task(ticker(lags, stop))
+        await asyncio.sleep(0.005)
+        t0 = time.perf_counter()
+
+        async def one(scenario: sp.Scenario) -> float:
+            await answer(scenario)
+            return (time.perf_counter() - t0) * 1000
+
+        latencies = sorted(await asyncio.gather(*(one(s) for s in scenarios)))
+        total = (time.perf_counter() - t0) * 1000
+        stop.set()
+        await tick
+        return total, latencies, max(lags)
+
+    async def run() -> None:
+        cache = sp.ModelCache(BASE_PATH)
+        cache.solve(sp.Scenario(args.region, 24.0))  # compile outside the measurement
+
+        async def blocking(scenario: sp.Scenario) -> None:
+            cache.solve(scenario)
+
+        rows = [("blocking ModelCache.solve", *await burst(blocking))]
+        async with sp.SolverPool(BASE_PATH, workers=args.workers) as pool:
+            # Let every worker compile the model first
+            await asyncio.gather(*(pool.solve_async(sp.Scenario(args.region, 24.0 + k / 7))
+                                   for k in range(pool.workers)))
+            rows.append((f"SolverPool ({pool.workers} workers)", *await burst(pool.solve_async)))
+
+        print(f"## Burst of {args.requests} requests ({args.distinct} distinct {args.region} intervals, no cache)")
+        print("")
+        print("| Path | Total (ms) | p50 latency (ms) | p99 latency (ms) | Max loop stall (ms) |")
+        print("|------|-----------:|-----------------:|-----------------:|--------------------:|")
+        for label, total, latencies, stall in rows:
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            print(f"| {label} | {total:.0f} | {p50:.0f} | {p99:.0f} | {stall:.1f} |")
+        print("")
+
+    asyncio.run(run())
+
+
+# =============================================================================
+# Main
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the portfolio solver")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_asm = sub.add_parser("assembly", help="Sparse vs dense constraint assembly")
+    p_asm.add_argument("--interval", type=float, default=24.0, help="Sale interval in hours")
+    p_asm.add_argument("--outpost-scale", type=int, default=1,
+                       help="Replicate each region's outposts N times to emulate larger models")
+    p_asm.add_argument("--repeat", type=int, default=10, help="Repetitions per measurement")
+    p_asm.set_defaults(func=bench_assembly)
+
+    p_res = sub.add_parser("resolve", help="Model rebuild vs compiled re-solve")
+    p_res.add_argument("--repeat", type=int, default=10, help="Repetitions per measurement")
+    p_res.set_defaults(func=bench_resolve)
+
+    p_pre = sub.add_parser("presolve", help="Raw vs implied integer bounds")
+    p_pre.add_argument("--interval", type=float, default=24.0, help="Sale interval in hours")
+    p_pre.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement")
+    p_pre.set_defaults(func=bench_presolve)
+
+    p_sym = sub.add_parser("symmetry", help="Interchangeable columns merged vs kept apart")
+    p_sym.add_argument("-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+                       help="Machine increment divisor (default: 4)")
+    p_sym.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement")
+    p_sym.set_defaults(func=bench_symmetry)
+
+    p_start = sub.add_parser("startup", help="Import and first-result latency of the CLI")
+    p_start.add_argument("--interval", type=float, default=24.0, help="Sale interval in hours")
+    p_start.add_argument("--repeat", type=int, default=5, help="Runs per command")
+    p_start.set_defaults(func=bench_startup)
+
+    p_async = sub.add_parser("async", help="Blocking solves in the event loop vs SolverPool.solve_async")
+    p_async.add_argument("--region", default="wuling", help="Region to solve (default: wuling)")
+    p_async.add_argument("--requests", type=int, default=200, help="Requests in the burst")
+    p_async.add_argument("--distinct", type=int, default=16, help="Distinct scenarios among them")
+    p_async.add_argument("--workers", type=int, default=None, help="Pool size (default: CPU count)")
+    p_async.set_defaults(func=bench_async)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
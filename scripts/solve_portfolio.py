@@ -8,19 +8,56 @@ trade ticket production rate given resource constraints.
 Usage:
     python solve_portfolio.py valley_iv 24
     python solve_portfolio.py wuling 12
+    python solve_portfolio.py wuling 12 --recipe-level
+    python solve_portfolio.py wuling 12 --machine-cap forge_of_the_sky=12
+    python solve_portfolio.py valley_iv 24 --fast
+    python solve_portfolio.py valley_iv 24 --time-limit 0.5 --mip-gap 0.01
+    python solve_portfolio.py wuling 24 --sensitivity
+    python solve_portfolio.py sweep wuling --interval 6 12 24 --bonus 1.0 1.3 --cardiac-level 1 2
+    python solve_portfolio.py curve valley_iv 6 96
+    python solve_portfolio.py heatmap wuling cuprium_ore 0 360 precipitation_acid 0 480
+    python solve_portfolio.py upgrades wuling ../wuling_upgrades.json --greedy 3
+    python solve_portfolio.py evaluate valley_iv ../valley4_portfolios.json
+    python solve_portfolio.py simulate wuling 12 --schedule ../wuling_schedules.json --logins 8 22 --skip 0.1
+    python solve_portfolio.py serve --port 8765
 """
 
 from __future__ import annotations
 
 import argparse
+import collections
+import functools
+import hashlib
+import itertools
 import json
+import os
+import re
 import sys
-from dataclasses import dataclass, field
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Iterator
 
 import numpy as np
-from scipy.optimize import linprog, milp, OptimizeResult, Bounds, LinearConstraint
+
+# scipy (sparse matrices, linprog, milp) and verify_power (recipe chains) are
+# imported inside the functions that build or solve models, so --help, cached
+# results and formatting don't pay for them
+
+if TYPE_CHECKING:
+    from scipy import sparse
+    from scipy.optimize import OptimizeResult
+
+
+# Mined ores constrained by RegionData.mining_rates (precipitation acid is handled separately)
+ORE_TYPES = ["originium_ore", "amethyst_ore", "ferrium_ore", "cuprium_ore"]
+
+# Product attributes decoded from a solution as resource totals
+RESOURCE_KEYS = ORE_TYPES + ["precipitation_acid", "power_consumption"]
 
 
 # =============================================================================
@@ -49,6 +86,8 @@ class Product:
     sandleaf_consumption: float = 0.0  # sandleaf consumed per minute at production_rate
     sewage_production: float = 0.0  # sewage produced per minute at production_rate (from cuprium refining)
     sewage_consumption: float = 0.0  # net sewage consumed per minute at production_rate
+    # Machines of each type the whole chain occupies at production_rate
+    machine_usage: dict[str, float] = field(default_factory=dict)
     # v1.2: outpost assignment - which outposts can sell this product
     sold_at: list[str] = field(default_factory=list)
     # Secondary currency (for event items like Xiranite Gourd)
@@ -67,6 +106,132 @@ class RegionData:
     outposts: list[dict[str, Any]]
     power_buffer: float = 2000.0  # unit/sec reserved for map facilities
     precipitation_acid_supply: float = 0.0  # /min from Acid Resistant Pump Mk II
+    # Max buildable count per machine type (recipes.json max_count*, CLI overrides)
+    machine_caps: dict[str, float] = field(default_factory=dict)
+    # Raw recipes.json (machines/items/recipes) for the recipe-level model
+    recipes: dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+    # Columnar view of products, built once at load time (rebuild after editing products/outposts)
+    product_table: ProductTable | None = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.product_table is None:
+            self.refresh_product_table()
+
+    def refresh_product_table(self) -> None:
+        self.product_table = ProductTable.from_products(self.products, self.outposts)
+
+
+# Numeric Product attributes stored as columns in ProductTable
+PRODUCT_COLUMNS = [
+    "trade_value",
+    "production_rate",
+    "originium_ore",
+    "amethyst_ore",
+    "ferrium_ore",
+    "cuprium_ore",
+    "precipitation_acid",
+    "power_consumption",
+    "battery_power",
+    "xiranite_consumption",
+    "sandleaf_consumption",
+    "sewage_production",
+    "sewage_consumption",
+    "secondary_currency_value",
+]
+
+
+@dataclass
+class ProductTable:
+    """
+    Columnar (struct-of-arrays) view of a product list.
+
+    Every entry of PRODUCT_COLUMNS is a float array indexed like ``ids``;
+    ``production_limit`` is NaN for unlimited products, ``sold`` is a
+    boolean (product × outpost) matrix over ``outpost_ids`` and
+    ``machine_usage`` is a (machine type × product) matrix over
+    ``machine_types``.
+    """
+    ids: list[str]
+    columns: dict[str, np.ndarray]
+    production_limit: np.ndarray
+    is_battery: np.ndarray
+    outpost_ids: list[str]
+    sold: np.ndarray
+    machine_types: list[str] = field(default_factory=list)
+    machine_usage: np.ndarray = field(default_factory=lambda: np.zeros((0, 0)))
+
+    @classmethod
+    def from_products(cls, products: list[Product], outposts: list[dict[str, Any]]) -> ProductTable:
+        n = len(products)
+        machine_types = sorted({m for p in products for m in p.machine_usage})
+        return cls(
+            ids=[p.id for p in products],
+            columns={
+                name: np.array([getattr(p, name) for p in products], dtype=float)
+                for name in PRODUCT_COLUMNS
+            },
+            production_limit=np.array(
+                [p.production_limit if p.production_limit is not None else np.nan for p in products],
+                dtype=float,
+            ),
+            is_battery=np.array([p.is_battery for p in products], dtype=bool),
+            outpost_ids=[o["id"] for o in outposts],
+            sold=np.array(
+                [[_is_sold_at(p, o) for o in outposts] for p in products], dtype=bool,
+            ).reshape(n, len(outposts)),
+            machine_types=machine_types,
+            machine_usage=np.array(
+                [[p.machine_usage.get(m, 0.0) for p in products] for m in machine_types], dtype=float,
+            ).reshape(len(machine_types), n),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def index(self, product_id: str) -> int | None:
+        try:
+            return self.ids.index(product_id)
+        except ValueError:
+            return None
+
+    @property
+    def battery_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.is_battery)
+
+    def per_rate(self, name: str) -> np.ndarray:
+        """Column ``name`` per 1/min of production (0 where production_rate is 0)."""
+        rate = self.columns["production_rate"]
+        col = self.columns[name]
+        return np.divide(col, rate, out=np.zeros_like(col), where=rate > 0)
+
+    def per_rate_matrix(self, names: list[str]) -> np.ndarray:
+        """Stacked ``per_rate`` rows, shape (len(names), n_products)."""
+        return np.array([self.per_rate(name) for name in names]).reshape(len(names), len(self))
+
+    def machines_per_rate(self, machine: str) -> np.ndarray:
+        """Machines of type ``machine`` per 1/min of each product (zeros if unused)."""
+        if machine not in self.machine_types:
+            return np.zeros(len(self))
+        usage = self.machine_usage[self.machine_types.index(machine)]
+        rate = self.columns["production_rate"]
+        return np.divide(usage, rate, out=np.zeros_like(usage), where=rate > 0)
+
+    def subset(self, mask: np.ndarray) -> ProductTable:
+        """Rows where ``mask`` is True, in the original order."""
+        idx = np.flatnonzero(mask)
+        return ProductTable(
+            ids=[self.ids[i] for i in idx],
+            columns={name: col[idx] for name, col in self.columns.items()},
+            production_limit=self.production_limit[idx],
+            is_battery=self.is_battery[idx],
+            outpost_ids=list(self.outpost_ids),
+            sold=self.sold[idx],
+            machine_types=list(self.machine_types),
+            machine_usage=self.machine_usage[:, idx],
+        )
 
 
 # =============================================================================
@@ -74,7 +239,7 @@ class RegionData:
 # =============================================================================
 
 def load_region_data(region_id: str, base_path: Path) -> RegionData:
-    """Load region data from JSON files and compute resource consumption."""
+    """Load region data from JSON files and derive resource consumption from recipes.json."""
 
     # Map region IDs to file names
     region_files = {
@@ -93,13 +258,10 @@ def load_region_data(region_id: str, base_path: Path) -> RegionData:
 
     region_info = data["region"]
 
-    # Define product specifications based on analysis docs
-    if region_id.lower() in ("valley_iv", "valley4"):
-        products = _build_valley4_products()
-    elif region_id.lower() == "wuling":
-        products = _build_wuling_products()
-    else:
-        raise ValueError(f"Unknown region: {region_id}")
+    # Resource figures come from the recipe chains; trade data from the region JSON
+    products = _build_products(data["products"], load_product_specs(base_path))
+    with open(base_path / "recipes.json", "r", encoding="utf-8") as f:
+        recipes = json.load(f)
 
     return RegionData(
         id=region_info["id"],
@@ -113,239 +275,233 @@ def load_region_data(region_id: str, base_path: Path) -> RegionData:
         # Read from region JSON, fallback to 0 if not specified
         power_buffer=region_info.get("power_buffer", 0.0),
         precipitation_acid_supply=region_info.get("mining_rates", {}).get("precipitation_acid", 0.0),
+        machine_caps=machine_caps(recipes),
+        recipes=recipes,
     )
 
 
-def _build_valley4_products() -> list[Product]:
-    """Build Valley IV product specifications from analysis data."""
-
-    # Production rates: 30/min for 2-sec cycle, 6/min for 10-sec cycle
-    # Resource consumption from valley4_analysis.md (per minute at full rate)
-
-    products = [
-        # Basic materials (power from opt_sample.md at 30/min)
-        Product(
-            id="origocrust", name_ja="結晶外殻", name_en="Origocrust",
-            trade_value=1, production_rate=30.0,
-            originium_ore=30.0, power_consumption=13.0,  # from opt_sample.md
-        ),
-        Product(
-            id="amethyst_bottle", name_ja="紫晶製ボトル", name_en="Amethyst Bottle",
-            trade_value=2, production_rate=30.0,
-            amethyst_ore=60.0, power_consumption=20.0,  # from opt_sample.md
-        ),
-        Product(
-            id="amethyst_part", name_ja="紫晶部品", name_en="Amethyst Part",
-            trade_value=1, production_rate=30.0,
-            amethyst_ore=30.0, power_consumption=25.0,  # from opt_sample.md
-        ),
-        Product(
-            id="ferrium_part", name_ja="鉄製部品", name_en="Ferrium Part",
-            trade_value=1, production_rate=30.0,
-            ferrium_ore=30.0, power_consumption=40.0,  # from opt_sample.md
-        ),
-        Product(
-            id="steel_part", name_ja="鋼製部品", name_en="Steel Part",
-            trade_value=3, production_rate=30.0,
-            ferrium_ore=60.0, power_consumption=80.0,  # from opt_sample.md
-        ),
-
-        # Capsules and Canned Foods (power from opt_sample.md)
-        Product(
-            id="buck_capsule_c", name_ja="蕎花カプセルI", name_en="Buck Capsule C",
-            trade_value=10, production_rate=6.0,
-            amethyst_ore=60.0, power_consumption=137.0,  # from opt_sample.md
-        ),
-        Product(
-            id="buck_capsule_b", name_ja="蕎花カプセルII", name_en="Buck Capsule B",
-            trade_value=27, production_rate=6.0,
-            ferrium_ore=120.0, power_consumption=328.0,  # from opt_sample.md
-        ),
-        Product(
-            id="buck_capsule_a", name_ja="蕎花カプセルIII", name_en="Buck Capsule A",
-            trade_value=70, production_rate=6.0,
-            ferrium_ore=240.0, power_consumption=412.0,  # from opt_sample.md
-        ),
-        Product(
-            id="canned_citrome_c", name_ja="シトローム缶詰I", name_en="Canned Citrome C",
-            trade_value=10, production_rate=6.0,
-            amethyst_ore=60.0, power_consumption=137.0,  # from opt_sample.md
-        ),
-        Product(
-            id="canned_citrome_b", name_ja="シトローム缶詰II", name_en="Canned Citrome B",
-            trade_value=27, production_rate=6.0,
-            ferrium_ore=120.0, power_consumption=328.0,  # from opt_sample.md
-        ),
-        Product(
-            id="canned_citrome_a", name_ja="シトローム缶詰III", name_en="Canned Citrome A",
-            trade_value=70, production_rate=6.0,
-            ferrium_ore=240.0, power_consumption=412.0,  # from opt_sample.md
-        ),
-
-        # Batteries (power from opt_sample.md: HC 1030/2=515, SC 195, LC 78 at 6/min)
-        Product(
-            id="lc_valley_battery", name_ja="小容量谷地バッテリー", name_en="LC Valley Battery",
-            trade_value=16, production_rate=6.0,
-            originium_ore=60.0, amethyst_ore=30.0, power_consumption=78.0,  # from opt_sample.md
-            is_battery=True, battery_power=166.67,  # 1000 power * 40 sec / 240 sec/min
-        ),
-        Product(
-            id="sc_valley_battery", name_ja="中容量谷地バッテリー", name_en="SC Valley Battery",
-            trade_value=30, production_rate=6.0,
-            originium_ore=90.0, ferrium_ore=60.0, power_consumption=195.0,  # from opt_sample.md
-            is_battery=True, battery_power=83.33,  # 500 power * 40 sec / 240 sec/min
-        ),
-        Product(
-            id="hc_valley_battery", name_ja="大容量谷地バッテリー", name_en="HC Valley Battery",
-            trade_value=70, production_rate=6.0,
-            originium_ore=180.0, ferrium_ore=120.0, power_consumption=515.0,  # from opt_sample.md (1030/2)
-            is_battery=True, battery_power=733.33,  # 1100 power * 40 sec / 60 sec/min
-        ),
-    ]
+def machine_caps(recipes: dict) -> dict[str, float]:
+    """
+    Max buildable count per machine type from recipes.json.
 
-    return products
+    A machine may carry several ``max_count*`` fields, one per game version
+    (``max_count_v12``, ...); the highest version wins and a bare
+    ``max_count`` is taken as the oldest.
+    """
+    caps = {}
+    for machine_id, machine in recipes.get("machines", {}).items():
+        versions = []
+        for key, value in machine.items():
+            m = re.fullmatch(r"max_count(?:_v(\d+))?", key)
+            if m and value is not None:
+                versions.append((int(m.group(1) or -1), float(value)))
+        if versions:
+            caps[machine_id] = max(versions)[1]
+    return caps
 
 
-def _build_wuling_products() -> list[Product]:
-    """Build Wuling v1.2 product specifications.
+# Bump when the compiled spec layout or chain conventions change
+PRODUCT_SPEC_VERSION = 2
 
-    Power and material consumption values are derived from verify_power.py
-    chain calculations. Outpost assignment (sold_at) follows v1.2 wiki data.
+
+def compile_product_specs(recipes: dict) -> dict[str, dict[str, Any]]:
+    """
+    Expand every craftable item in recipes.json to per-minute Product figures.
+
+    All items are solved at one machine's output rate in a single batch on
+    verify_power.RecipeGraph. Power covers the whole chain, including
+    intermediates such as xiranite whose gross throughput is also reported
+    as xiranite_consumption. Sewage and precipitation acid are net of the
+    chain's own byproducts. machine_usage counts every machine of the chain
+    by type, which is what the max_count caps are checked against.
     """
+    from verify_power import RecipeGraph, find_recipe
 
-    products = [
-        # Xiranite (息壌) - production limited by Forge of the Sky
-        # v1.2: Forge of the Sky 8台 (initial) - 12台 (after Forge Expansion IV)
-        # Conservative: 8台 = 240/min for v1.2 base case
-        Product(
-            id="xiranite", name_ja="息壌", name_en="Xiranite",
-            trade_value=1, production_rate=30.0,
-            power_consumption=77.5,
-            production_limit=240.0,  # v1.2: 8 Forge of the Sky × 30/min
-            sold_at=["tianwangyuan", "cardiac_remediation"],
-        ),
-
-        # Cuprium Part (赤銅部品) - v1.1
-        Product(
-            id="cuprium_part", name_ja="赤銅部品", name_en="Cuprium Part",
-            trade_value=1, production_rate=30.0,
-            cuprium_ore=30.0, power_consumption=25.0,
-            sewage_production=30.0,  # 1 sewage per cuprium refined
-            sold_at=["tianwangyuan"],
-        ),
-
-        # Jincao Drink (錦草ソーダ)
-        Product(
-            id="jincao_drink", name_ja="錦草ソーダ", name_en="Jincao Drink",
-            trade_value=16, production_rate=6.0,
-            ferrium_ore=120.0, power_consumption=175.0,
-            sold_at=["tianwangyuan"],
-        ),
-
-        # Jincao Tea (錦草ソーダⅡ) - v1.1 既存だが v1.2 で取引対象に
-        # Cuprium chain: 120 Cuprium/min → 120 Sewage byproduct
-        # Power: chain (verify_power: ~272.5)
-        Product(
-            id="jincao_tea", name_ja="錦草ソーダⅡ", name_en="Jincao Tea",
-            trade_value=22, production_rate=6.0,
-            cuprium_ore=120.0, power_consumption=272.5,
-            sewage_production=120.0,
-            sold_at=["cardiac_remediation"],
-        ),
-
-        # Yazhen Syringe C (芽針注射剤I)
-        Product(
-            id="yazhen_syringe_c", name_ja="芽針注射剤I", name_en="Yazhen Syringe C",
-            trade_value=16, production_rate=6.0,
-            ferrium_ore=120.0, power_consumption=175.0,
-            sold_at=["tianwangyuan"],
-        ),
-
-        # Yazhen Syringe A (芽針注射剤Ⅱ) - v1.1
-        Product(
-            id="yazhen_syringe_a", name_ja="芽針注射剤Ⅱ", name_en="Yazhen Syringe A",
-            trade_value=22, production_rate=6.0,
-            cuprium_ore=120.0, power_consumption=272.5,
-            sewage_production=120.0,
-            sold_at=["tianwangyuan", "cardiac_remediation"],
-        ),
-
-        # LC Wuling Battery
-        Product(
-            id="lc_wuling_battery", name_ja="小容量武陵バッテリー", name_en="LC Wuling Battery",
-            trade_value=25, production_rate=6.0,
-            originium_ore=180.0, power_consumption=227.5,
-            xiranite_consumption=30.0,
-            sandleaf_consumption=30.0,
-            is_battery=True, battery_power=1066.67,
-            sold_at=["tianwangyuan", "cardiac_remediation"],
-        ),
-
-        # SC Wuling Battery (中容量武陵バッテリー)
-        Product(
-            id="sc_wuling_battery", name_ja="中容量武陵バッテリー", name_en="SC Wuling Battery",
-            trade_value=54, production_rate=6.0,
-            originium_ore=240.0, ferrium_ore=30.0,
-            power_consumption=681.67,
-            xiranite_consumption=60.0,
-            sandleaf_consumption=40.0,
-            sewage_consumption=30.0,
-            is_battery=True, battery_power=2133.33,
-            sold_at=["tianwangyuan", "cardiac_remediation"],
-        ),
-
-        # === v1.2 NEW PRODUCTS ===
-
-        # Heavy Xiranite (重息壌) - v1.2
-        # 1台 Forge for Heavy + 3台 Forge for Xiranite (90/min) = 4台 Forge total
-        # Xircon Effluent 30/min via Reactor: Liquid Xiranite + Sewage → XE + IXE
-        # Sewage 30/min net consumption (must be from Cuprium products elsewhere)
-        # Power chain: forge×4 (200) + reactor×2 (100) + refining×12 (60) + shredding×3 (15) + others ~40 = 415
-        # No precipitation acid needed (basic recipe doesn't go through Liquid Heavy Xiranite)
-        Product(
-            id="heavy_xiranite", name_ja="重息壌", name_en="Heavy Xiranite",
-            trade_value=27, production_rate=6.0,
-            power_consumption=415.0,
-            xiranite_consumption=90.0,  # 60 (Heavy) + 30 (for Liquid Xiranite → XE)
-            sewage_consumption=30.0,    # net for Xircon Effluent reactor
-            sold_at=["cardiac_remediation"],
-        ),
-
-        # Hetonite Part (緋銅部品) - v1.2
-        # Chain: Cuprium ore→Cuprium→Powder→Solution(+PA)→HetoniteSolution(Purification, +PA byproduct)
-        #        → Hetonite (+ Sewage byproduct) → Hetonite Part
-        # Per 1 Hetonite Part: 30 PA pure consumption, 20 Cuprium ore, 5 Ferrium ore
-        # Net Sewage produced: 20/individual (Cuprium refining)
-        # Power: 835 unit/sec @ 6/min (verified)
-        Product(
-            id="hetonite_part", name_ja="緋銅部品", name_en="Hetonite Part",
-            trade_value=48, production_rate=6.0,
-            cuprium_ore=120.0, ferrium_ore=30.0,
-            precipitation_acid=180.0,  # 30 PA/個 × 6/min net
-            power_consumption=835.0,
-            sewage_production=120.0,   # 20/個 × 6/min from Cuprium refining
-            sold_at=["tianwangyuan"],
-        ),
-
-        # Xiranite Gourd (息壌ひょうたん) - v1.2 期間限定
-        # Chain: Experimental Xiranite Bottle (Moulding 2s, Xiranite 2 → 1) [推定]
-        #      + Experimental Xiranite Part (Fitting 2s, Xiranite 1 → 1) [確定]
-        # Per 1 Gourd: 5 Bottle (= 10 Xiranite) + 5 Part (= 5 Xiranite) = 15 Xiranite
-        # 6/min Gourd → 90 Xiranite/min (= Forge of the Sky 3台)
-        # Power: 305 unit/sec @ 6/min (verified)
-        Product(
-            id="xiranite_gourd", name_ja="息壌ひょうたん", name_en="Xiranite Gourd",
-            trade_value=40, production_rate=6.0,
-            power_consumption=305.0,
-            xiranite_consumption=90.0,  # 15 Xiranite × 6/min
-            sold_at=["cardiac_remediation"],
-            secondary_currency_value=10,  # 1 Gourd → 10 Fruits of Altruism Cert
-        ),
-    ]
+    graph = RecipeGraph(recipes)
+    targets = []
+    for item_id, item in recipes.get("items", {}).items():
+        if item.get("type", "").startswith("raw_"):
+            continue
+        recipe = find_recipe(recipes, item_id)
+        if recipe is not None:
+            targets.append((item_id, recipe["outputs"][item_id] / recipe["time_sec"] * 60))
+    result = graph.solve(graph.demand(targets))
+
+    def supply(item: str) -> np.ndarray:
+        i = graph.index.get(item)
+        return result.supply[i] if i is not None else np.zeros(len(targets))
+
+    xiranite = result.production[graph.index["xiranite"]] if "xiranite" in graph.index else np.zeros(len(targets))
+    sewage = supply("sewage")
+    specs = {}
+    for k, (item_id, production_rate) in enumerate(targets):
+        spec = {"production_rate": production_rate, "power_consumption": float(result.power[k])}
+        for ore_type in ORE_TYPES + ["precipitation_acid"]:
+            spec[ore_type] = float(supply(ore_type)[k])
+        spec["xiranite_consumption"] = float(xiranite[k]) if item_id != "xiranite" else 0.0
+        spec["sandleaf_consumption"] = float(supply("sandleaf")[k])
+        spec["sewage_production"] = float(max(-sewage[k], 0.0))
+        spec["sewage_consumption"] = float(max(sewage[k], 0.0))
+        spec["battery_power"] = float(recipes["items"][item_id].get("battery_power", 0.0))
+        spec["machine_usage"] = {
+            machine: float(count)
+            for machine, count in zip(graph.machine_types, result.machine_count[:, k])
+            if count > 1e-9
+        }
+        specs[item_id] = spec
+    return specs
+
+
+def load_product_specs(base_path: Path) -> dict[str, dict[str, float]]:
+    """
+    Compiled product specs for ``base_path/recipes.json``.
 
+    Results are cached under ``.cache/recipes`` keyed on the content hash of
+    recipes.json and of the chain code, so a recipe edit recompiles on the
+    next start and an unchanged file loads straight from disk.
+    """
+    recipes_path = base_path / "recipes.json"
+    key_blob = json.dumps([
+        PRODUCT_SPEC_VERSION,
+        _file_digest(recipes_path.resolve()),
+        _file_digest(Path(__file__).resolve()),
+        _file_digest(Path(__file__).resolve().with_name("verify_power.py")),
+    ])
+    key = hashlib.sha256(key_blob.encode("utf-8")).hexdigest()
+    return _load_product_specs(recipes_path, key)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_product_specs(recipes_path: Path, key: str) -> dict[str, dict[str, float]]:
+    cache_dir = recipes_path.parent / ".cache" / "recipes"
+    cache_path = cache_dir / f"{key}.json"
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    with open(recipes_path, "r", encoding="utf-8") as f:
+        specs = compile_product_specs(json.load(f))
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(specs, f)
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass  # read-only checkout: compile on every start
+    return specs
+
+
+def _build_products(entries: list[dict[str, Any]], specs: dict[str, dict[str, float]]) -> list[Product]:
+    """Combine trade data from a region JSON with recipe-derived specs."""
+    products = []
+    for entry in entries:
+        spec = specs.get(entry["id"])
+        if spec is None:
+            raise ValueError(f"No recipe chain in recipes.json for product: {entry['id']}")
+        limit = entry.get("production_limit")
+        products.append(Product(
+            id=entry["id"],
+            name_ja=entry["name_ja"],
+            name_en=entry["name_en"],
+            trade_value=entry["trade_value"],
+            production_limit=float(limit) if limit is not None else None,
+            is_battery=entry.get("category") == "battery",
+            sold_at=list(entry.get("sold_at", [])),
+            secondary_currency_value=float(sum(entry.get("secondary_currency", {}).values())),
+            **spec,
+        ))
     return products
 
 
+def load_portfolios(path: Path, region: RegionData, table: ProductTable) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Read user portfolios from a JSON file of the form
+    ``{"portfolios": [{"name": ..., "machines": {product: count}, "power": {battery: count}}]}``.
+
+    Products may be given by id, English or Japanese name. ``power`` counts
+    battery machines whose output goes to generators (0.25 = one generator).
+    Returns ``(names, machines, power_machines)`` in ``table`` order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    lookup: dict[str, int] = {}
+    for p in region.products:
+        k = table.index(p.id)
+        if k is not None:
+            lookup.update({p.id: k, p.name_en: k, p.name_ja: k})
+    battery_column = {int(b): k for k, b in enumerate(table.battery_indices)}
+
+    entries = data.get("portfolios", [])
+    names = []
+    machines = np.zeros((len(entries), len(table)))
+    power_machines = np.zeros((len(entries), len(battery_column)))
+    for row, entry in enumerate(entries):
+        name = entry.get("name", f"#{row + 1}")
+        names.append(name)
+        for product, count in entry.get("machines", {}).items():
+            if product not in lookup:
+                raise ValueError(f"{name}: unknown product {product}")
+            machines[row, lookup[product]] += count
+        for product, count in entry.get("power", {}).items():
+            if lookup.get(product) not in battery_column:
+                raise ValueError(f"{name}: {product} is not a battery")
+            power_machines[row, battery_column[lookup[product]]] += count
+    return names, machines, power_machines
+
+
+def load_schedules(path: Path) -> tuple[list[str], np.ndarray]:
+    """
+    Read sale schedules from a JSON file of the form
+    ``{"schedules": [{"name": ..., "sales": [hours, ...]}]}``.
+
+    ``sales`` are hours after a sale that emptied storage, or ISO datetimes
+    together with that sale as ``"start"``. Returns ``(names, times)`` with
+    ``times`` NaN-padded to the longest schedule, as ``PortfolioModel.simulate`` takes.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    names = []
+    rows = []
+    for k, entry in enumerate(data.get("schedules", [])):
+        name = entry.get("name", f"#{k + 1}")
+        sales = entry.get("sales", [])
+        if any(isinstance(t, str) for t in sales):
+            if "start" not in entry:
+                raise ValueError(f"{name}: datetime sales need a start")
+            start = datetime.fromisoformat(entry["start"])
+            sales = [(datetime.fromisoformat(t) - start).total_seconds() / 3600 for t in sales]
+        names.append(name)
+        rows.append([float(t) for t in sales])
+    times = np.full((len(rows), max((len(r) for r in rows), default=0)), np.nan)
+    for k, row in enumerate(rows):
+        times[k, :len(row)] = row
+    return names, times
+
+
+def login_schedules(
+    days: int,
+    logins: list[float],
+    jitter: float = 0.0,
+    skip: float = 0.0,
+    samples: int = 1,
+    seed: int | None = None,
+) -> np.ndarray:
+    """
+    ``samples`` random schedules of a daily play pattern: a sale at each
+    hour of day in ``logins`` (hour 0 = the first midnight), moved by
+    normal noise of ``jitter`` hours and missed with probability ``skip``.
+    """
+    rng = np.random.default_rng(seed)
+    base = (np.arange(days)[:, None] * 24 + np.asarray(logins, dtype=float)).ravel()
+    times = base + rng.normal(0.0, jitter, (samples, base.size)) if jitter > 0 else np.tile(base, (samples, 1))
+    if skip > 0:
+        times[rng.random(times.shape) < skip] = np.nan
+    return times
+
+
 # =============================================================================
 # LP Formulation
 # =============================================================================
@@ -446,6 +602,234 @@ class LPResult:
     # v1.2: Multi-outpost sales allocation
     sales_by_outpost: dict[str, dict[str, float]] = field(default_factory=dict)  # outpost_id -> {product_id: rate}
     secondary_currency_rate: float = 0.0  # tickets/min of secondary currency (e.g. AIC certs)
+    # Recipe-level model: recipe_id -> machines running it
+    recipe_machines: dict[str, float] = field(default_factory=dict)
+    # Capped machine types: machine_id -> {"used": machines, "cap": max count}
+    machine_usage: dict[str, dict[str, float]] = field(default_factory=dict)
+    # Solver statistics: upper bound on ticket_rate, relative gap (bound - rate) / rate,
+    # branch-and-bound nodes and wall time of PortfolioModel.solve
+    dual_bound: float | None = None
+    mip_gap: float | None = None
+    mip_node_count: int | None = None
+    wall_time_ms: float | None = None
+    limit_reached: bool = False  # time/node limit hit; the solution is the best found so far
+    # Shadow prices (--sensitivity): LP ticket rate on the chosen portfolio and, per parameter,
+    # {"parameter", "value", "marginal" (tickets/min per unit), "range": [lo, hi]}
+    sensitivity_rate: float | None = None
+    sensitivity: list[dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class CurveSegment:
+    """One piece of ticket_rate(interval): ``base + coef / hours`` for hours in [hours_from, hours_to]."""
+    hours_from: float
+    hours_to: float
+    base: float  # tickets/min
+    coef: float  # tickets/min × hours
+    products: list[str]  # products produced on this piece
+
+    def rate(self, hours: float) -> float:
+        return self.base + self.coef / hours
+
+
+@dataclass
+class IntervalCurve:
+    """Exact piecewise ticket_rate(interval) from ``PortfolioModel.interval_curve``."""
+    segments: list[CurveSegment]  # ascending hours; adjacent segments may jump at the shared end
+    solves: int  # MILP solves spent
+    wall_time_ms: float
+
+
+@dataclass
+class MiningHeatmap:
+    """ticket_rate over a grid of two mining rates, from ``PortfolioModel.mining_heatmap``."""
+    x_key: str
+    x_values: list[float]
+    y_key: str
+    y_values: list[float]
+    ticket_rate: list[list[float | None]]  # [y][x]; None where no portfolio is feasible
+    portfolio: list[list[int | None]]  # [y][x] index into portfolios
+    portfolios: list[list[str]]  # product ids of each distinct portfolio
+    solved: list[list[bool]]  # [y][x]: solved directly (others are pinned by bounds or interpolated)
+    interpolated: list[list[bool]]  # [y][x]: bilinear inside a smooth cell (see tolerance)
+    solves: int
+    wall_time_ms: float
+
+@dataclass
+class PortfolioEvaluation:
+    """Given portfolios scored by ``PortfolioModel.evaluate``; arrays are indexed by portfolio."""
+    ticket_rate: np.ndarray  # (N,) tickets/min realized after storage and outpost caps
+    offered: np.ndarray  # (N,) tickets/min of everything produced for sale
+    storage_loss: np.ndarray  # (N,) tickets/min over storage_limit
+    cap_loss: np.ndarray  # (N,) tickets/min over the outpost accumulation caps
+    constraint_ids: list[str]  # hard constraints, named like the --sensitivity parameters
+    slack: np.ndarray  # (N, len(constraint_ids)) limit − usage; negative = violated
+    feasible: np.ndarray  # (N,) every slack ≥ −tolerance
+
+
+@dataclass
+class SaleSimulation:
+    """A solved portfolio replayed by ``PortfolioModel.simulate``; arrays are indexed by schedule."""
+    horizon_hours: float
+    offered_rate: float  # tickets/min flowing into storage
+    stream_ids: list[str]  # sale streams: product@outpost, or product in the single-outpost model
+    group_ids: list[str]  # outposts buying separately (["all"] in the single-outpost model)
+    sold: np.ndarray  # (N, groups) tickets realized at each outpost
+    storage_waste: np.ndarray  # (N, streams) tickets of product lost over storage_limit
+    pool_overflow: np.ndarray  # (N,) outpost accumulation lost at ticket_max
+    end_stock: np.ndarray  # (N,) tickets still in storage at the horizon
+    sales: np.ndarray  # (N,) sales within the horizon
+
+    @property
+    def realized(self) -> np.ndarray:
+        return self.sold.sum(axis=1)
+
+    @property
+    def realized_rate(self) -> np.ndarray:
+        """(N,) realized tickets/min over the whole horizon."""
+        return self.realized / (self.horizon_hours * 60)
+
+
+class _SparseRowBuilder:
+    """Accumulates constraint rows as COO triplets and emits a CSR matrix.
+
+    Rows are appended in blocks from vectorized index arrays so that model
+    assembly never materializes a dense (rows × vars) array.
+    """
+
+    def __init__(self, n_vars: int):
+        self.n_vars = n_vars
+        self.n_rows = 0
+        self._rows: list[np.ndarray] = []
+        self._cols: list[np.ndarray] = []
+        self._vals: list[np.ndarray] = []
+        self._rhs: list[np.ndarray] = []
+
+    def add_rows(self, rows, cols, vals, rhs) -> np.ndarray:
+        """Append a block of rows; ``rows`` are local indices into ``rhs``.
+
+        Returns the global row indices of the appended block.
+        """
+        rhs = np.atleast_1d(np.asarray(rhs, dtype=float))
+        start = self.n_rows
+        self._rows.append(np.asarray(rows, dtype=int) + start)
+        self._cols.append(np.asarray(cols, dtype=int))
+        self._vals.append(np.asarray(vals, dtype=float))
+        self._rhs.append(rhs)
+        self.n_rows += len(rhs)
+        return np.arange(start, self.n_rows)
+
+    def add_row(self, cols, vals, rhs: float) -> int:
+        """Append a single row and return its global index."""
+        cols = np.asarray(cols, dtype=int)
+        return int(self.add_rows(np.zeros(len(cols), dtype=int), cols, vals, [rhs])[0])
+
+    def tocsr(self) -> tuple[sparse.csr_matrix, np.ndarray]:
+        """Return the assembled (A, rhs) pair; zero coefficients are dropped."""
+        from scipy import sparse
+
+        if self.n_rows == 0:
+            return sparse.csr_matrix((0, self.n_vars)), np.zeros(0)
+        vals = np.concatenate(self._vals)
+        keep = vals != 0
+        A = sparse.coo_matrix(
+            (vals[keep], (np.concatenate(self._rows)[keep], np.concatenate(self._cols)[keep])),
+            shape=(self.n_rows, self.n_vars),
+        ).tocsr()
+        return A, np.concatenate(self._rhs)
+
+
+class _BasisRanging:
+    """
+    Right-hand-side ranging for ``min c·x s.t. A x ≤ b, lower ≤ x ≤ upper`` at a vertex.
+
+    scipy does not expose the HiGHS basis, so it is recovered from the
+    solution: with slacks ``s = b - A x`` the basic columns of ``[A | I]``
+    are those strictly inside their bounds, completed to full rank with
+    degenerate columns whose dual is zero (those can enter the basis
+    without changing the duals).
+    """
+
+    def __init__(self, A, b, lower, upper, x, row_duals, upper_duals, tol: float = 1e-7):
+        from scipy import sparse
+
+        A = A.toarray() if sparse.issparse(A) else np.asarray(A, dtype=float)
+        m, n = A.shape
+        self.A = A
+        self.values = np.concatenate([x, b - A @ x])
+        self.lower = np.concatenate([lower, np.zeros(m)])
+        self.upper = np.concatenate([upper, np.full(m, np.inf)])
+        self.at_upper = np.flatnonzero(np.isfinite(upper) & (upper > lower) & (x >= upper - tol))
+
+        M = np.hstack([A, np.eye(m)])
+        free = self.upper > self.lower
+        interior = free & (self.values > self.lower + tol) & (self.values < self.upper - tol)
+        zero_dual = free & (np.abs(np.concatenate([upper_duals, row_duals])) <= tol)
+        order = np.concatenate([
+            np.flatnonzero(interior),
+            np.flatnonzero(zero_dual & ~interior),
+            np.flatnonzero(free & ~zero_dual & ~interior),
+        ])
+        basis: list[int] = []
+        for k in order:
+            if len(basis) == m:
+                break
+            if np.linalg.matrix_rank(M[:, basis + [k]], tol=1e-9) == len(basis) + 1:
+                basis.append(int(k))
+        self.basis = np.array(basis, dtype=int)
+        self.B = M[:, self.basis]
+        self.n = n
+
+    def interval(self, db: np.ndarray, du: np.ndarray) -> tuple[float, float]:
+        """Range of the step t along ``b += t·db, upper += t·du`` that keeps the basis optimal."""
+        if len(self.basis) < self.B.shape[0]:
+            return -np.inf, np.inf  # basis not recovered; no range
+        rhs = db - self.A[:, self.at_upper] @ du[self.at_upper]
+        dv = np.linalg.lstsq(self.B, rhs, rcond=None)[0]
+        v = self.values[self.basis]
+        lo, hi = self.lower[self.basis], self.upper[self.basis]
+        # Basic columns whose own upper bound moves
+        d_upper = np.zeros(len(self.basis))
+        own = self.basis < self.n
+        d_upper[own] = du[self.basis[own]]
+
+        t_lo, t_hi = -np.inf, np.inf
+        # Each basic value must stay within its bounds: v + rate·t ≤ hi and v + dv·t ≥ lo
+        for gap, rate, sign in ((hi - v, dv - d_upper, 1.0), (lo - v, dv, -1.0)):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = gap / rate
+            limits_hi = sign * rate > 1e-12
+            limits_lo = sign * rate < -1e-12
+            if np.any(limits_hi):
+                t_hi = min(t_hi, float(np.min(ratio[limits_hi])))
+            if np.any(limits_lo):
+                t_lo = max(t_lo, float(np.max(ratio[limits_lo])))
+        # A moving upper bound on a nonbasic column below it may not cross its value
+        slack_cols = np.setdiff1d(np.flatnonzero(du), np.concatenate([self.basis, self.at_upper]))
+        for j in slack_cols:
+            t = (self.values[j] - self.upper[j]) / du[j]
+            if du[j] > 0:
+                t_lo = max(t_lo, float(t))
+            else:
+                t_hi = min(t_hi, float(t))
+        return t_lo, t_hi
+
+
+@dataclass
+class _CurvePiece:
+    """A portfolio's ticket rate around θ = 1/interval_minutes: ``value + slope·(θ' - θ)``."""
+    theta: float
+    value: float
+    slope: float  # tickets/min per unit θ
+    products: list[str]
+    z: np.ndarray  # integer columns of the portfolio
+    excess: np.ndarray  # row violation of z within the MILP's feasibility tolerance
+
+    def at(self, theta: float) -> float:
+        return self.value + self.slope * (theta - self.theta)
+
+    def flat(self) -> _CurvePiece:
+        return _CurvePiece(self.theta, self.value, 0.0, self.products, self.z, self.excess)
 
 
 def _is_sold_at(product: Product, outpost: dict) -> bool:
@@ -456,21 +840,1327 @@ def _is_sold_at(product: Product, outpost: dict) -> bool:
     return product.id in outpost.get("products", [])
 
 
-def solve_portfolio_multi_outpost(
+@dataclass
+class PortfolioModel:
+    """
+    A compiled portfolio MILP/LP that can be re-solved for many scenarios.
+
+    The constraint matrix, objective, integrality and the scenario-independent
+    bounds are built once by ``compile_portfolio`` or
+    ``compile_portfolio_multi_outpost``. ``solve`` only rewrites the entries
+    that depend on the scenario:
+
+        - storage cap ``storage_limit / interval_minutes`` (right-hand side of
+          the storage rows, or column upper bounds in the single-outpost model)
+        - outpost accumulation caps ``ticket_rate × bonus / 60``
+        - power buffer (right-hand side of the power balance row)
+
+    Machine-count caps (``machine_cap_rows``) are fixed at compile time since
+    they change the model's structure only when a facility is upgraded.
+    """
+    region: RegionData
+    table: ProductTable
+    outposts: list[dict[str, Any]]
+    multi_outpost: bool
+    integer: bool
+    machine_increment: float
+    c: np.ndarray
+    A_ub: sparse.csr_matrix
+    b_ub: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    integrality: np.ndarray
+    col_scale: np.ndarray  # rate (/min) represented by one unit of each variable
+    q_cols: np.ndarray
+    pw_cols: np.ndarray
+    battery_indices: np.ndarray
+    power_row: int
+    storage_rows: np.ndarray  # rows whose rhs is the storage cap
+    resource_coef: np.ndarray  # (len(RESOURCE_KEYS), len(resource_cols)) use per unit of each column
+    s_cols: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    sale_i: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    sale_j: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    cap_rows: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    cap_per_h: np.ndarray = field(default_factory=lambda: np.zeros(0))  # before bonus
+    storage_cols: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    storage_col_limits: np.ndarray = field(default_factory=lambda: np.zeros(0))  # production_limit or inf
+    # Recipe-level model: machine columns per recipe, and the columns resource_coef applies to
+    m_cols: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    recipe_ids: list[str] = field(default_factory=list)
+    resource_cols: np.ndarray | None = None  # None = q_cols
+    machine_cap_rows: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    machine_cap_ids: list[str] = field(default_factory=list)
+    # Where each mining_rates entry enters the model (for sensitivity): a row's rhs in the
+    # aggregated layouts, a supply column's upper bound in the recipe-level model
+    mining_rows: dict[str, int] = field(default_factory=dict)
+    mining_cols: dict[str, int] = field(default_factory=dict)
+    cap_outpost_ids: list[str] = field(default_factory=list)  # outpost of each cap row
+
+    @property
+    def n_vars(self) -> int:
+        return len(self.c)
+
+    @property
+    def battery_power(self) -> np.ndarray:
+        """unit/sec per 1/min of each battery used for power."""
+        return self.table["battery_power"][self.battery_indices]
+
+    @functools.cached_property
+    def column_groups(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Classes of interchangeable columns, as ``(representatives, group)``.
+
+        Two columns are interchangeable when they have the same objective
+        coefficient, integrality, scale and constraint column, e.g. Valley IV's
+        Buck Capsule and Canned Citrome of one grade, which differ only in the
+        plant they grow. ``group[j]`` is the index of column j's class and
+        ``representatives`` the first column of each class. Their upper bounds
+        (separate storage per product) may differ and are summed on merging.
+        """
+        A = self.A_ub.tocsc()
+        A.sort_indices()
+        index: dict[tuple, int] = {}
+        group = np.empty(self.n_vars, dtype=int)
+        for j in range(self.n_vars):
+            start, end = A.indptr[j], A.indptr[j + 1]
+            key = (
+                self.c[j], self.integrality[j], self.col_scale[j], self.lower[j],
+                A.indices[start:end].tobytes(), A.data[start:end].tobytes(),
+            )
+            group[j] = index.setdefault(key, len(index))
+        _, representatives = np.unique(group, return_index=True)
+        return representatives, group
+
+    def _milp_merged(self, b_ub: np.ndarray, upper: np.ndarray, options: dict[str, Any]) -> OptimizeResult:
+        """
+        ``milp`` with interchangeable columns merged into one (symmetry reduction).
+
+        Each class is solved as a single column bounded by the sum of its
+        members' bounds, so branch-and-bound no longer explores every
+        permutation of an optimum across them. The optimum is split back by
+        filling the members in column order up to their own bounds.
+        """
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        representatives, group = self.column_groups
+        if len(representatives) == self.n_vars:
+            return milp(
+                self.c,
+                constraints=LinearConstraint(self.A_ub, -np.inf, b_ub),
+                bounds=Bounds(self.lower, upper),
+                integrality=self.integrality,
+                options=options,
+            )
+
+        n_groups = len(representatives)
+        result = milp(
+            self.c[representatives],
+            constraints=LinearConstraint(self.A_ub[:, representatives], -np.inf, b_ub),
+            bounds=Bounds(
+                np.bincount(group, self.lower, minlength=n_groups),
+                np.bincount(group, upper, minlength=n_groups),
+            ),
+            integrality=self.integrality[representatives],
+            options=options,
+        )
+        if result.x is not None:
+            x = np.zeros(self.n_vars)
+            filled = np.zeros(n_groups)
+            for j in range(self.n_vars):
+                g = group[j]
+                x[j] = min(upper[j], result.x[g] - filled[g])
+                filled[g] += x[j]
+            result.x = x
+        return result
+
+    def solve(
+        self,
+        min_interval_hours: float,
+        bonus_rate: float = 1.0,
+        power_buffer: float | None = None,
+        fast: bool = False,
+        time_limit: float | None = None,
+        mip_rel_gap: float | None = None,
+        node_limit: int | None = None,
+        sensitivity: bool = False,
+        mining_rates: dict[str, float] | None = None,
+        storage_limit: float | None = None,
+        tighten_bounds: bool = True,
+        presolve: bool = True,
+    ) -> LPResult:
+        """
+        Solve the compiled model for one scenario.
+
+        The result carries the solver's dual bound, relative gap, node count
+        and wall time. When ``time_limit`` or ``node_limit`` stops the MILP
+        early, the best solution found so far is returned with
+        ``limit_reached`` set; it is a failure only if there is none.
+
+        Args:
+            min_interval_hours: Minimum trade interval in hours
+            bonus_rate: Outpost accumulation bonus multiplier (multi-outpost only)
+            power_buffer: Power reserved for map facilities; defaults to region.power_buffer
+            fast: Round the LP relaxation instead of branch-and-bound (see ``_solve_rounded``);
+                the dual bound is then the relaxation's
+            time_limit: MILP wall-time limit in seconds
+            mip_rel_gap: Stop once the relative gap to the dual bound is below this
+            node_limit: Maximum branch-and-bound nodes
+            sensitivity: Also report shadow prices and their ranges (see ``_sensitivity``)
+            mining_rates: Override region.mining_rates entries (resource key -> /min); only
+                resources the model constrains (``mining_rows`` / ``mining_cols``) can be set
+            storage_limit: Override region.storage_limit
+            tighten_bounds: Give ``milp`` the implied integer bounds (see ``_tighten_bounds``)
+                instead of the raw column bounds
+            presolve: Run HiGHS's own presolve (``milp``'s ``presolve`` option)
+        """
+        t0 = time.perf_counter()
+        if power_buffer is None:
+            power_buffer = self.region.power_buffer
+        if storage_limit is None:
+            storage_limit = self.region.storage_limit
+        interval_minutes = min_interval_hours * 60
+        b_ub, upper, relaxed_upper = self._scenario_bounds(
+            interval_minutes, bonus_rate, power_buffer, mining_rates, storage_limit,
+        )
+
+        if self.integer and fast:
+            result = self._solve_rounded(b_ub, upper)
+        elif self.integer:
+            options = {
+                key: value
+                for key, value in (("time_limit", time_limit), ("mip_rel_gap", mip_rel_gap), ("node_limit", node_limit))
+                if value is not None
+            }
+            if not presolve:
+                options["presolve"] = False
+            if tighten_bounds:
+                upper = self._tighten_bounds(b_ub, upper)
+            result = self._milp_merged(b_ub, upper, options)
+        else:
+            result = self._linprog(b_ub, self.lower, upper)
+            if result.success:
+                # An LP optimum is its own bound
+                result.mip_dual_bound, result.mip_gap = result.fun, 0.0
+
+        # milp status 1 is the time limit; HiGHS's node limit surfaces as status 4
+        # ("Solution limit reached"). x is the incumbent if one was found.
+        limit_reached = self.integer and not fast and (
+            result.status == 1 or (result.status == 4 and "limit" in str(result.message).lower())
+        )
+        if result.x is None or not (result.success or limit_reached):
+            return LPResult(
+                success=False,
+                message=str(getattr(result, "message", "Optimization failed")),
+                ticket_rate=0,
+                production_rates={},
+                ore_consumption={},
+                power_consumption=0,
+                power_supply=0,
+                power_balance=0,
+                battery_for_power={},
+                battery_for_sale={},
+                mip_node_count=getattr(result, "mip_node_count", None),
+                wall_time_ms=(time.perf_counter() - t0) * 1000,
+                limit_reached=limit_reached,
+            )
+
+        # Transform solution back to rates
+        x = result.x * self.col_scale
+        if self.multi_outpost:
+            decoded = self._decode_multi_outpost(x, min_interval_hours, power_buffer, storage_limit)
+        else:
+            decoded = self._decode_single_outpost(
+                x, -result.fun, min_interval_hours, power_buffer, storage_limit,
+            )
+        decoded.recipe_machines = {
+            rid: x[col] for rid, col in zip(self.recipe_ids, self.m_cols) if x[col] > 1e-6
+        }
+        used = self.A_ub[self.machine_cap_rows] @ result.x
+        decoded.machine_usage = {
+            mid: {"used": float(u), "cap": float(cap)}
+            for mid, u, cap in zip(self.machine_cap_ids, used, b_ub[self.machine_cap_rows])
+        }
+        if getattr(result, "mip_dual_bound", None) is not None:
+            decoded.dual_bound = -float(result.mip_dual_bound)
+            decoded.mip_gap = float(result.mip_gap)
+        decoded.mip_node_count = getattr(result, "mip_node_count", None)
+        decoded.limit_reached = limit_reached
+        if limit_reached and result.status == 4:
+            decoded.message = "Node limit reached"
+        elif limit_reached or (self.integer and fast):
+            decoded.message = str(result.message)
+        if sensitivity:
+            decoded.sensitivity_rate, decoded.sensitivity = self._sensitivity(
+                result.x, b_ub, relaxed_upper, interval_minutes, bonus_rate, power_buffer, storage_limit,
+            )
+        decoded.wall_time_ms = (time.perf_counter() - t0) * 1000
+        return decoded
+
+    def _scenario_bounds(
+        self,
+        interval_minutes: float,
+        bonus_rate: float,
+        power_buffer: float,
+        mining_rates: dict[str, float] | None = None,
+        storage_limit: float | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Scenario right-hand side and column upper bounds.
+
+        Returns ``(b_ub, upper, relaxed_upper)``: ``upper`` floors the storage
+        bound of integer columns onto the machine grid, ``relaxed_upper`` keeps
+        it exact (for LPs over the same columns).
+        """
+        if storage_limit is None:
+            storage_limit = self.region.storage_limit
+        max_sale_rate = storage_limit / interval_minutes
+
+        b_ub = self.b_ub.copy()
+        b_ub[self.power_row] = -power_buffer
+        b_ub[self.storage_rows] = max_sale_rate
+        b_ub[self.cap_rows] = self.cap_per_h * bonus_rate / 60  # /min
+
+        upper = self.upper.copy()
+        relaxed_upper = self.upper.copy()
+        if len(self.storage_cols):
+            col_upper = np.minimum(max_sale_rate, self.storage_col_limits)
+            relaxed_upper[self.storage_cols] = col_upper / self.col_scale[self.storage_cols]
+            if self.integer:
+                # Use floor to ensure we don't exceed storage limits
+                int_cols = self.integrality[self.storage_cols] == 1
+                col_upper = np.where(
+                    int_cols, np.floor(col_upper / self.col_scale[self.storage_cols]), col_upper,
+                )
+            upper[self.storage_cols] = col_upper
+        for key, rate in (mining_rates or {}).items():
+            if key in self.mining_rows:
+                b_ub[self.mining_rows[key]] = rate
+            elif key in self.mining_cols:
+                col = self.mining_cols[key]
+                upper[col] = relaxed_upper[col] = rate / self.col_scale[col]
+            else:
+                raise ValueError(f"{key} is not a mining constraint of this model")
+        return b_ub, upper, relaxed_upper
+
+    def _tighten_bounds(self, b_ub: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        Implied upper bounds for the integer columns (bound-tightening presolve).
+
+        Every column is non-negative, so a row whose coefficients are all
+        non-negative (ore, PA, machine caps, storage) caps each of its columns at
+        ``b / a_j``; e.g. a ferrium-only product gets ``ferrium_ore rate /
+        ferrium per increment``. Generator columns only appear in rows with
+        negative coefficients (power balance, battery coupling), so they are
+        bounded in a second step through the coupling rows, from the produced
+        battery's bound just derived: ``pw ≤ q_ub × rate / power increment``.
+        Integer bounds are floored onto the grid, so the MILP's feasible set
+        is unchanged.
+        """
+        A = self.A_ub.tocoo()
+        rows, cols, vals = A.row, A.col, A.data
+        is_int = self.integrality == 1
+        resource_row = np.ones(A.shape[0], dtype=bool)
+        resource_row[rows[vals < 0]] = False
+        ok = resource_row[rows] & (vals > 0) & is_int[cols]
+        implied = np.full(self.n_vars, np.inf)
+        np.minimum.at(implied, cols[ok], b_ub[rows[ok]] / vals[ok])
+        upper = np.minimum(upper, np.maximum(np.floor(implied + 1e-6), self.lower))
+
+        # Smallest activity of the other columns in each row; rows where one of them
+        # is unbounded below (the power row, via the generators themselves) imply nothing
+        contrib = np.where(vals > 0, vals * self.lower[cols], vals * upper[cols])
+        unbounded = np.isinf(contrib)
+        min_act = np.bincount(rows, np.where(unbounded, 0.0, contrib), minlength=len(b_ub))
+        n_unbounded = np.bincount(rows, unbounded, minlength=len(b_ub))
+        ok = np.isin(cols, self.pw_cols) & (vals > 0) & (n_unbounded[rows] == 0)
+        implied = np.full(self.n_vars, np.inf)
+        np.minimum.at(implied, cols[ok], (b_ub[rows[ok]] - min_act[rows[ok]] + contrib[ok]) / vals[ok])
+        return np.minimum(upper, np.maximum(np.floor(implied + 1e-6), self.lower))
+
+    def interval_curve(
+        self,
+        min_hours: float,
+        max_hours: float,
+        bonus_rate: float = 1.0,
+        power_buffer: float | None = None,
+        max_solves: int = 500,
+    ) -> IntervalCurve:
+        """
+        Exact ticket_rate as a function of the sale interval over [min_hours, max_hours].
+
+        The interval enters the model only through the storage cap
+        ``storage_limit · θ`` with ``θ = 1 / interval_minutes``, and a shorter
+        interval only loosens the model, so ticket_rate is nondecreasing in
+        θ. For a fixed integer solution (portfolio) the LP over the remaining
+        sale columns is concave and piecewise linear in θ, which makes
+        ticket_rate piecewise ``base + coef / hours``.
+
+        Pieces are found by recursive splitting between two solved points
+        a < b (in θ), with no grid:
+
+            - equal rates at a and b: flat on [a, b] (exact by monotonicity)
+            - otherwise b's portfolio follows its line down to the θ where
+              it stops fitting or its basis changes (``_piece_end``); the
+              next solve goes just below that end
+            - if b's line reaches a but another portfolio is better there,
+              the solve goes where the two lines cross
+
+        So solves land on breakpoints, about two per breakpoint.
+        """
+        t0 = time.perf_counter()
+        if power_buffer is None:
+            power_buffer = self.region.power_buffer
+        theta_lo, theta_hi = 1 / (max_hours * 60), 1 / (min_hours * 60)
+        step = 1e-6  # relative resolution in θ, above the solvers' feasibility tolerance
+        pieces: dict[float, _CurvePiece] = {}
+
+        def solve(theta: float) -> _CurvePiece:
+            if theta not in pieces:
+                if len(pieces) >= max_solves:
+                    raise RuntimeError(f"interval curve needs more than {max_solves} solves")
+                piece = self._curve_piece(theta, bonus_rate, power_buffer)
+                if piece is None:
+                    raise RuntimeError(f"no feasible portfolio at {1 / (theta * 60):g}h")
+                # Any portfolio solved at a longer interval still fits; HiGHS occasionally
+                # returns a worse one right at a storage threshold
+                best = max((p for p in pieces.values() if p.theta < theta), key=lambda p: p.value, default=None)
+                if best is not None and piece.value < best.value - tol(best.value):
+                    piece = self._curve_piece(theta, bonus_rate, power_buffer, z=best.z) or piece
+                pieces[theta] = piece
+            return pieces[theta]
+
+        def tol(value: float) -> float:
+            return 1e-6 * max(1.0, abs(value))
+
+        def crossing(a: float, pa: _CurvePiece, b: float, pb: _CurvePiece) -> float:
+            """Where a's and b's lines cross, or the midpoint if not strictly inside (a, b)."""
+            if pa.slope > pb.slope:
+                x = (pb.at(0.0) - pa.at(0.0)) / (pa.slope - pb.slope)
+                if a + (b - a) * 1e-6 < x < b - (b - a) * 1e-6:
+                    return x
+            return (a + b) / 2
+
+        # Segments (s, t, piece): ticket_rate = piece.at(θ) for θ in [s, t], ascending
+        def refine(a: float, pa: _CurvePiece, b: float, pb: _CurvePiece) -> list[tuple[float, float, _CurvePiece]]:
+            if pb.value - pa.value <= tol(pb.value):
+                return [(a, b, pa.flat())]
+            if b - a <= step * b:
+                return [(a, a, pa), (b, b, pb)]  # jump
+            end = self._piece_end(pb, bonus_rate, power_buffer, tol(pb.value))
+            if end <= a:
+                if pa.value <= pb.at(a) + tol(pa.value):
+                    return [(a, b, pb)]
+                x = crossing(a, pa, b, pb)
+                px = solve(x)
+                return refine(a, pa, x, px) + refine(x, px, b, pb)
+            if end < b * (1 - step):
+                # b's portfolio leaves its line at `end`: check [end, b], then continue below
+                upper = refine(end, solve(end), b, pb)
+                below = end * (1 - step)
+                if below <= a:
+                    return [(a, a, pa)] + upper
+                return refine(a, pa, below, solve(below)) + upper
+            # Degenerate basis at b (the line's end is b itself): split and retry
+            x = crossing(a, pa, b, pb)
+            px = solve(x)
+            return refine(a, pa, x, px) + refine(x, px, b, pb)
+
+        segments = refine(theta_lo, solve(theta_lo), theta_hi, solve(theta_hi))
+
+        # θ ascending -> hours ascending; merge neighbours on the same line. A flat run takes
+        # the portfolio of its longest interval, which fits and reaches the rate throughout.
+        curve: list[CurveSegment] = []
+        for s, t, piece in reversed(segments):
+            base, coef = piece.at(0.0), piece.slope / 60
+            prev = curve[-1] if curve else None
+            if (
+                prev is not None and (prev.products == piece.products or coef == 0.0)
+                and abs(prev.base - base) <= tol(base) and abs(prev.coef - coef) <= tol(coef)
+            ):
+                prev.hours_to = 1 / (s * 60)
+                prev.products = piece.products
+            else:
+                curve.append(CurveSegment(1 / (t * 60), 1 / (s * 60), base, coef, piece.products))
+        return IntervalCurve(curve, len(pieces), (time.perf_counter() - t0) * 1000)
+
+    def _theta_direction(self, theta: float) -> tuple[np.ndarray, np.ndarray]:
+        """d b_ub / dθ and d upper / dθ for the continuous storage-bounded columns at θ."""
+        limit = self.region.storage_limit
+        db = np.zeros(self.A_ub.shape[0])
+        db[self.storage_rows] = limit
+        du = np.zeros(self.n_vars)
+        moving = self.storage_cols[
+            (self.integrality[self.storage_cols] == 0) & (limit * theta < self.storage_col_limits)
+        ]
+        du[moving] = limit / self.col_scale[moving]
+        return db, du
+
+    def _curve_piece(
+        self, theta: float, bonus_rate: float, power_buffer: float, z: np.ndarray | None = None,
+    ) -> _CurvePiece | None:
+        """
+        Solve at θ = 1 / interval_minutes and return the line of its portfolio through θ.
+
+        With ``z`` given, that portfolio (integer columns) is used instead of solving the MILP.
+        """
+        from scipy.optimize import Bounds, LinearConstraint, OptimizeResult, milp
+
+        b_ub, upper, relaxed_upper = self._scenario_bounds(1 / theta, bonus_rate, power_buffer)
+        ints = self.integrality == 1
+        if z is not None:
+            result = OptimizeResult(success=True, x=np.where(ints, 0.0, self.lower))
+            result.x[ints] = z
+        elif self.integer:
+            result = milp(
+                self.c,
+                constraints=LinearConstraint(self.A_ub, -np.inf, b_ub),
+                bounds=Bounds(self.lower, self._tighten_bounds(b_ub, upper)),
+                integrality=self.integrality,
+                options={"mip_rel_gap": 1e-7},
+            )
+        else:
+            result = self._linprog(b_ub, self.lower, upper)
+        if not result.success:
+            return None
+
+        # Fix the integer solution; the sale columns stay free. Rows the MILP satisfied
+        # only within its feasibility tolerance are widened by that much.
+        z = np.round(result.x[ints])
+        x = result.x.copy()
+        x[ints] = z
+        excess = np.maximum(self.A_ub @ x - b_ub, 0.0)
+        lower, fixed_upper = self._fixed_bounds(z, relaxed_upper)
+        lp = self._linprog(b_ub + excess, lower, fixed_upper)
+        if not lp.success:
+            return None
+        db, du = self._theta_direction(theta)
+        slope = -(lp.ineqlin.marginals @ db + lp.upper.marginals @ du)
+        rates = lp.x * self.col_scale
+        products = [pid for pid, col in zip(self.table.ids, self.q_cols) if rates[col] > 1e-6]
+        return _CurvePiece(theta, float(-lp.fun), float(slope), products, z, excess)
+
+    def _fixed_bounds(self, z: np.ndarray, upper: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        lower, upper = self.lower.copy(), upper.copy()
+        ints = self.integrality == 1
+        lower[ints] = upper[ints] = z
+        return lower, upper
+
+    def _piece_end(self, piece: _CurvePiece, bonus_rate: float, power_buffer: float, tol: float) -> float:
+        """
+        Smallest θ at which ``piece``'s portfolio still reaches its line.
+
+        An LP over ``(x, θ)``: minimize θ subject to the model at θ with the
+        integer columns fixed and ``-c·x ≥ piece.at(θ)``. The fixed
+        portfolio's rate is concave in θ and never above its line, so the
+        LP stops exactly where the portfolio stops fitting or its basis
+        changes.
+        """
+        from scipy import sparse
+        from scipy.optimize import linprog
+
+        theta = piece.theta
+        b_ub, _, relaxed_upper = self._scenario_bounds(1 / theta, bonus_rate, power_buffer)
+        lower, upper = self._fixed_bounds(piece.z, relaxed_upper)
+        db, du = self._theta_direction(theta)
+        moving = np.flatnonzero(du)
+
+        # Integer storage columns need storage_limit · θ above their rate
+        int_storage = self.storage_cols[self.integrality[self.storage_cols] == 1]
+        needed = float((upper[int_storage] * self.col_scale[int_storage]).max(initial=0.0))
+        theta_floor = needed / self.region.storage_limit
+
+        n = self.n_vars
+        A = sparse.vstack([
+            sparse.hstack([self.A_ub, -db[:, None]]),
+            sparse.hstack([sparse.csr_matrix((np.ones(len(moving)), (np.arange(len(moving)), moving)),
+                                             shape=(len(moving), n)), -du[moving, None]]),
+            sparse.hstack([sparse.csr_matrix(self.c[None, :]), np.array([[piece.slope]])]),
+        ]).tocsr()
+        b = np.concatenate([
+            b_ub + piece.excess - db * theta,
+            upper[moving] - du[moving] * theta,
+            [-piece.value + piece.slope * theta + tol],
+        ])
+        c = np.zeros(n + 1)
+        c[n] = 1.0
+        bounds = [(lo, hi if not np.isinf(hi) else None) for lo, hi in zip(lower, upper)]
+        for j in moving:
+            bounds[j] = (lower[j], None)  # moves with θ through its row above
+        bounds.append((min(theta_floor, theta), theta))
+        lp = linprog(c, A_ub=A, b_ub=b, bounds=bounds, method="highs")
+        return float(lp.x[n]) if lp.success else theta
+
+    def mining_heatmap(
+        self,
+        min_interval_hours: float,
+        x_key: str,
+        x_values: list[float],
+        y_key: str,
+        y_values: list[float],
+        bonus_rate: float = 1.0,
+        power_buffer: float | None = None,
+        tolerance: float = 0.0,
+    ) -> MiningHeatmap:
+        """
+        ticket_rate on the grid ``x_values × y_values`` of two mining rates.
+
+        Most grid points are never solved. ticket_rate is nondecreasing in
+        every mining rate, and a portfolio solved at one point stays feasible,
+        at the same rate, wherever both rates cover its consumption. So at
+        any point the rate lies between the best solved portfolio that fits
+        there and the lowest rate solved at a point with both rates at least
+        as large. The grid is split quadtree-style, solving only a cell's
+        lower-left and upper-right corners; a cell whose two bounds meet is
+        filled with no further solves, so solves concentrate where the
+        optimal portfolio changes. With ``tolerance`` > 0, a cell whose
+        centre solves to within that relative error of the bilinear surface
+        through its corners is interpolated instead of split further (the
+        portfolio shown there is the lower-left corner's).
+
+        scipy's ``milp`` takes no starting solution, so neighbouring solutions
+        are reused as these bounds rather than as warm starts.
+        """
+        t0 = time.perf_counter()
+        for key in (x_key, y_key):
+            if key not in self.mining_rows and key not in self.mining_cols:
+                raise ValueError(f"{key} is not a mining constraint of this model")
+        xs, ys = np.asarray(x_values, dtype=float), np.asarray(y_values, dtype=float)
+        rate = np.full((len(ys), len(xs)), np.nan)
+        owner = np.full((len(ys), len(xs)), -1)
+        solved = np.zeros((len(ys), len(xs)), dtype=bool)
+        pinned = np.zeros((len(ys), len(xs)), dtype=bool)  # exact from the bounds
+        interpolated = np.zeros((len(ys), len(xs)), dtype=bool)
+        portfolios: list[list[str]] = []
+        # Solved points: consumption of both resources, rate (-inf if infeasible), portfolio
+        used_x: list[float] = []
+        used_y: list[float] = []
+        found: list[float] = []
+        found_at: list[tuple[float, float]] = []
+        found_owner: list[int] = []
+
+        def solve(i: int, j: int) -> None:
+            if solved[j, i] or pinned[j, i]:
+                return
+            result = self.solve(
+                min_interval_hours, bonus_rate=bonus_rate, power_buffer=power_buffer,
+                mining_rates={x_key: xs[i], y_key: ys[j]},
+            )
+            solved[j, i] = True
+            interpolated[j, i] = False
+            found_at.append((xs[i], ys[j]))
+            if not result.success:
+                used_x.append(np.inf)
+                used_y.append(np.inf)
+                found.append(-np.inf)
+                found_owner.append(-1)
+                return
+            products = sorted(result.production_rates)
+            if products not in portfolios:
+                portfolios.append(products)
+            k = portfolios.index(products)
+            used_x.append(result.ore_consumption.get(x_key, 0.0))
+            used_y.append(result.ore_consumption.get(y_key, 0.0))
+            found.append(result.ticket_rate)
+            found_owner.append(k)
+            rate[j, i], owner[j, i] = result.ticket_rate, k
+
+        def bounds(i0: int, j0: int, i1: int, j1: int) -> tuple[float, int, float]:
+            """(lower bound on [i0, i1]×[j0, j1] with its portfolio, upper bound)."""
+            ux, uy, value = np.array(used_x), np.array(used_y), np.array(found)
+            at = np.array(found_at).reshape(-1, 2)
+            fits = (ux <= xs[i0] + 1e-6) & (uy <= ys[j0] + 1e-6)
+            lo_k = int(np.argmax(np.where(fits, value, -np.inf))) if np.any(fits) else -1
+            lo = value[lo_k] if lo_k >= 0 else -np.inf
+            above = (at[:, 0] >= xs[i1]) & (at[:, 1] >= ys[j1])
+            hi = float(np.min(value[above])) if np.any(above) else np.inf
+            return lo, (found_owner[lo_k] if lo_k >= 0 else -1), hi
+
+        def cell(i0: int, j0: int, i1: int, j1: int) -> None:
+            solve(i0, j0)
+            solve(i1, j1)
+            lo, k, hi = bounds(i0, j0, i1, j1)
+            area = np.s_[j0:j1 + 1, i0:i1 + 1]
+            if hi == -np.inf or hi - lo <= 1e-9 * max(1.0, abs(hi)):
+                # Pinned: infeasible throughout, or one rate with a portfolio that fits everywhere
+                block = ~(solved[area] | pinned[area])
+                rate[area][block] = np.nan if hi == -np.inf else lo
+                owner[area][block] = -1 if hi == -np.inf else k
+                pinned[area] |= block
+                interpolated[area] &= ~block
+                return
+            solve(i1, j0)
+            solve(i0, j1)
+            if i1 - i0 <= 1 and j1 - j0 <= 1:
+                return
+            im, jm = (i0 + i1) // 2, (j0 + j1) // 2
+            if tolerance > 0 and i1 - i0 >= 2 and j1 - j0 >= 2:
+                # Smooth cell: the centre (a corner of the children anyway) lies on the
+                # bilinear surface through the four corners
+                solve(im, jm)
+                fx = ((xs[i0:i1 + 1] - xs[i0]) / (xs[i1] - xs[i0]))[None, :]
+                fy = ((ys[j0:j1 + 1] - ys[j0]) / (ys[j1] - ys[j0]))[:, None]
+                r00, r10, r01, r11 = rate[[j0, j0, j1, j1], [i0, i1, i0, i1]]
+                bilinear = (r00 * (1 - fx) * (1 - fy) + r10 * fx * (1 - fy)
+                            + r01 * (1 - fx) * fy + r11 * fx * fy)
+                centre = rate[jm, im]
+                if abs(centre - bilinear[jm - j0, im - i0]) <= tolerance * max(1.0, abs(centre)):
+                    block = ~(solved[area] | pinned[area])
+                    rate[area][block] = bilinear[block]
+                    owner[area][block] = owner[j0, i0]
+                    interpolated[area] |= block
+                    return
+            if i1 - i0 <= 1:
+                cell(i0, j0, i1, jm)
+                cell(i0, jm, i1, j1)
+            elif j1 - j0 <= 1:
+                cell(i0, j0, im, j1)
+                cell(im, j0, i1, j1)
+            else:
+                for a0, a1 in ((i0, im), (im, i1)):
+                    for b0, b1 in ((j0, jm), (jm, j1)):
+                        cell(a0, b0, a1, b1)
+
+        if len(xs) == 1 or len(ys) == 1:
+            for j in range(len(ys)):
+                for i in range(len(xs)):
+                    solve(i, j)
+        else:
+            cell(0, 0, len(xs) - 1, len(ys) - 1)
+
+        # Interpolated points stay within the bounds of everything solved
+        if np.any(interpolated):
+            jj, ii = np.nonzero(interpolated)
+            ux, uy, value = np.array(used_x), np.array(used_y), np.array(found)
+            at = np.array(found_at)
+            fits = (ux[None, :] <= xs[ii, None] + 1e-6) & (uy[None, :] <= ys[jj, None] + 1e-6)
+            above = (at[None, :, 0] >= xs[ii, None]) & (at[None, :, 1] >= ys[jj, None])
+            lo = np.where(fits, value[None, :], -np.inf).max(axis=1)
+            hi = np.where(above, value[None, :], np.inf).min(axis=1)
+            rate[jj, ii] = np.clip(rate[jj, ii], lo, hi)
+
+        def grid(values: np.ndarray, missing) -> list[list]:
+            return [[missing(v) for v in row] for row in values.tolist()]
+
+        return MiningHeatmap(
+            x_key=x_key,
+            x_values=xs.tolist(),
+            y_key=y_key,
+            y_values=ys.tolist(),
+            ticket_rate=grid(rate, lambda v: None if np.isnan(v) else v),
+            portfolio=grid(owner, lambda v: None if v < 0 else v),
+            portfolios=portfolios,
+            solved=solved.tolist(),
+            interpolated=interpolated.tolist(),
+            solves=int(solved.sum()),
+            wall_time_ms=(time.perf_counter() - t0) * 1000,
+        )
+
+    def evaluate(
+        self,
+        machines: np.ndarray,
+        power_machines: np.ndarray,
+        min_interval_hours: float,
+        bonus_rate: float = 1.0,
+        power_buffer: float | None = None,
+        tolerance: float = 1e-6,
+    ) -> PortfolioEvaluation:
+        """
+        Score N given portfolios against this scenario in one vectorized pass.
+
+        ``machines`` is (N, products) final-stage machine counts in ``table``
+        order and ``power_machines`` (N, batteries) the battery machines'
+        output sent to generators. Mining, PA, power, battery split, machine
+        caps (Forge of the Sky, i.e. xiranite), sewage and production limits
+        are hard constraints reported as slack. Storage and outpost caps are
+        soft, as in the solver: they only reduce the realized ticket rate.
+
+        Sales go to outposts optimally, so the realized rate is the max flow
+        from products (price × sale rate) through the per-outpost storage caps
+        to the accumulation caps. With only a few outposts it is computed as
+        the minimum over all 2^m cuts. The single-outpost model has no
+        accumulation caps, so each product is limited by its storage alone.
+        """
+        table = self.table
+        n = len(table)
+        bi = table.battery_indices
+        machines = np.asarray(machines, dtype=float).reshape(-1, n)
+        power_machines = np.asarray(power_machines, dtype=float).reshape(-1, len(bi))
+        n_portfolios = len(machines)
+        if power_buffer is None:
+            power_buffer = self.region.power_buffer
+
+        production = machines * table["production_rate"]
+        power_rate = power_machines * table["production_rate"][bi]
+        sale = production.copy()
+        sale[:, bi] -= power_rate
+
+        # Hard constraints as (id, usage, limit)
+        rows: list[tuple[str, np.ndarray, Any]] = []
+        for key in ORE_TYPES + ["precipitation_acid"]:
+            coef = table.per_rate(key)
+            rate = self.region.mining_rates.get(key, 0)
+            if rate > 0 or np.any(coef > 0):
+                rows.append((f"mining_rates.{key}", production @ coef, rate))
+        # Consumption + buffer ≤ supply
+        supply = power_rate @ self.battery_power
+        rows.append(("power_buffer", production @ table.per_rate("power_consumption") - supply, -power_buffer))
+        for k, i in enumerate(bi):
+            rows.append((f"battery_split.{table.ids[i]}", power_rate[:, k], production[:, i]))
+        for machine_id, cap in zip(self.machine_cap_ids, self.b_ub[self.machine_cap_rows]):
+            rows.append((f"max_count.{machine_id}", production @ table.machines_per_rate(machine_id), cap))
+        net_sewage = table.per_rate("sewage_consumption") - table.per_rate("sewage_production")
+        if np.any(net_sewage != 0):
+            rows.append(("sewage", production @ net_sewage, 0.0))
+        for i in np.flatnonzero(~np.isnan(table.production_limit)):
+            rows.append((f"production_limit.{table.ids[i]}", production[:, i], table.production_limit[i]))
+        slack = np.column_stack([np.broadcast_to(limit, (n_portfolios,)) - used for _, used, limit in rows])
+
+        # Outposts: cut T (outposts on the source side) costs their caps plus, per product,
+        # the smaller of its offer and its storage caps into the outposts outside T
+        price = table["trade_value"]
+        storage_rate = self.region.storage_limit / (min_interval_hours * 60)
+        if self.multi_outpost:
+            sold = table.sold
+            caps = np.full(sold.shape[1], np.inf)
+            caps[[table.outpost_ids.index(oid) for oid in self.cap_outpost_ids]] = self.cap_per_h * bonus_rate / 60
+        else:
+            sold = np.ones((n, 1), dtype=bool)
+            caps = np.array([np.inf])
+        offer = np.maximum(sale, 0) * price
+        edge = np.where(sold, (price * storage_rate)[:, None], 0.0)
+        n_outposts = sold.shape[1]
+        storage_only = np.minimum(offer, edge.sum(axis=1)).sum(axis=1)
+        ticket_rate = storage_only.copy()
+        for mask in range(1, 1 << n_outposts):
+            in_cut = (mask >> np.arange(n_outposts)) & 1 == 1
+            if np.isinf(caps[in_cut]).any():
+                continue
+            cut = caps[in_cut].sum() + np.minimum(offer, edge[:, ~in_cut].sum(axis=1)).sum(axis=1)
+            ticket_rate = np.minimum(ticket_rate, cut)
+
+        offered = offer.sum(axis=1)
+        return PortfolioEvaluation(
+            ticket_rate=ticket_rate,
+            offered=offered,
+            storage_loss=offered - storage_only,
+            cap_loss=storage_only - ticket_rate,
+            constraint_ids=[name for name, _, _ in rows],
+            slack=slack,
+            feasible=np.all(slack >= -tolerance, axis=1),
+        )
+
+    def simulate(
+        self,
+        result: LPResult,
+        schedules: np.ndarray,
+        horizon_hours: float,
+        bonus_rate: float = 1.0,
+        storage_limit: float | None = None,
+    ) -> SaleSimulation:
+        """
+        Replay the sales of ``result`` against N sale schedules at once.
+
+        ``schedules`` is (N, K) sale times in hours, NaN-padded where a
+        schedule has fewer sales; times outside (0, ``horizon_hours``] are
+        ignored. Storage and outpost pools start empty, as right after a
+        sale at hour 0.
+
+        Each sale stream fills its own stock up to ``storage_limit`` (per
+        product and outpost, as in the solver) and the overflow is lost.
+        Each outpost accumulates ``ticket_rate × bonus_rate`` per hour up to
+        ``ticket_max``; outposts without a ticket_rate buy without limit. At
+        a sale every outpost buys its streams' stock up to its pool, the same
+        fraction of each stream if the pool runs short; the rest stays in
+        storage. The single-outpost model sells any product anywhere, so its
+        outposts form one pool.
+
+        Between sales the state only grows until it hits a cap, so it
+        advances in closed form from one sale to the next rather than in
+        fixed time steps; each step is vectorized over the schedules.
+        """
+        if storage_limit is None:
+            storage_limit = self.region.storage_limit
+        price = dict(zip(self.table.ids, self.table["trade_value"]))
+        stream_ids: list[str] = []
+        stream_rate: list[float] = []  # /h
+        stream_price: list[float] = []
+        stream_group: list[int] = []
+        if self.multi_outpost:
+            group_ids = [o["id"] for o in self.outposts]
+            outpost_group = np.arange(len(self.outposts))
+            for j, o in enumerate(self.outposts):
+                for product_id, rate in result.sales_by_outpost.get(o["id"], {}).items():
+                    stream_ids.append(f"{product_id}@{o['id']}")
+                    stream_rate.append(rate * 60)
+                    stream_price.append(price[product_id])
+                    stream_group.append(j)
+        else:
+            group_ids = ["all"]
+            outpost_group = np.zeros(len(self.outposts), dtype=int)
+            for product_id, rate in result.production_rates.items():
+                rate -= result.battery_for_power.get(product_id, 0.0)
+                if rate > 1e-9:
+                    stream_ids.append(product_id)
+                    stream_rate.append(rate * 60)
+                    stream_price.append(price[product_id])
+                    stream_group.append(0)
+        rate_h = np.array(stream_rate)
+        value = np.array(stream_price)
+        n_groups = len(group_ids)
+        stream_onehot = (np.array(stream_group, dtype=int)[:, None] == np.arange(n_groups)).astype(float)
+        outpost_onehot = (outpost_group[:, None] == np.arange(n_groups)).astype(float)
+
+        pool_rate = np.array([o.get("ticket_rate", 0) for o in self.outposts], dtype=float) * bonus_rate
+        uncapped = pool_rate <= 0
+        pool_max = np.array([o.get("ticket_max", np.inf) for o in self.outposts], dtype=float)
+        pool_max[uncapped] = 0.0
+        group_uncapped = (outpost_onehot[uncapped] > 0).any(axis=0)
+
+        times = np.array(schedules, dtype=float).reshape(len(schedules), -1)
+        times[~((times > 0) & (times <= horizon_hours))] = np.nan
+        times = np.sort(times, axis=1)  # NaN last
+        n = len(times)
+        stock = np.zeros((n, len(stream_ids)))
+        pool = np.zeros((n, len(self.outposts)))
+        wasted = np.zeros_like(stock)
+        pool_overflow = np.zeros(n)
+        sold = np.zeros((n, n_groups))
+        last = np.zeros(n)
+
+        def advance(to: np.ndarray) -> None:
+            dt = np.where(np.isnan(to), 0.0, to - last)
+            stock[:] += dt[:, None] * rate_h
+            over = np.maximum(stock - storage_limit, 0.0)
+            wasted[:] += over
+            stock[:] -= over
+            pool[:] += dt[:, None] * pool_rate
+            over = np.maximum(pool - pool_max, 0.0)
+            pool_overflow[:] += over.sum(axis=1)
+            pool[:] -= over
+            np.copyto(last, to, where=~np.isnan(to))
+
+        for t in times.T:
+            if np.isnan(t).all():
+                break
+            advance(t)
+            offer = (stock * value) @ stream_onehot
+            capacity = np.where(group_uncapped, np.inf, pool @ outpost_onehot)
+            take = np.where(np.isnan(t)[:, None], 0.0, np.minimum(offer, capacity))
+            stock *= 1 - np.divide(take, offer, out=np.zeros_like(take), where=offer > 0) @ stream_onehot.T
+            drained = np.divide(take, capacity, out=np.zeros_like(take), where=np.isfinite(capacity) & (capacity > 0))
+            pool *= 1 - drained @ outpost_onehot.T
+            sold += take
+        advance(np.full(n, float(horizon_hours)))
+
+        return SaleSimulation(
+            horizon_hours=horizon_hours,
+            offered_rate=float(rate_h @ value) / 60,
+            stream_ids=stream_ids,
+            group_ids=group_ids,
+            sold=sold,
+            storage_waste=wasted * value,
+            pool_overflow=pool_overflow,
+            end_stock=stock @ value,
+            sales=(~np.isnan(times)).sum(axis=1),
+        )
+
+    def _sensitivity(
+        self,
+        x: np.ndarray,
+        b_ub: np.ndarray,
+        upper: np.ndarray,
+        interval_minutes: float,
+        bonus_rate: float,
+        power_buffer: float,
+        storage_limit: float,
+    ) -> tuple[float | None, list[dict[str, Any]]]:
+        """
+        Shadow prices of the scenario parameters around solution ``x``.
+
+        The portfolio found by the solve is kept: integer columns that are
+        zero in ``x`` stay fixed at zero and the others become continuous, so
+        the LP still trades ore, power and storage between the chosen
+        products. (Fixing every integer column at its value would leave only
+        the sale columns free and price ore and power at zero.) HiGHS duals
+        of that LP give the marginal tickets/min per unit of each parameter;
+        the range is the interval of the parameter over which the optimal
+        basis, and so the marginal, stays the same.
+
+        Returns the LP's ticket rate and one entry per parameter:
+        ``{"parameter", "value", "marginal", "range": [lo, hi]}``.
+        """
+        lower = self.lower.copy()
+        upper = upper.copy()
+        unused = (self.integrality == 1) & (x <= 1e-9)
+        upper[unused] = lower[unused]
+        lp = self._linprog(b_ub, lower, upper)
+        if not lp.success:
+            return None, []
+
+        # Parameter -> (value, d rhs / d parameter, d column upper / d parameter)
+        n_rows = len(b_ub)
+        params: list[tuple[str, float, np.ndarray, np.ndarray]] = []
+
+        def param(name: str, value: float, rows=(), row_coef=(), cols=(), col_coef=()) -> None:
+            db, du = np.zeros(n_rows), np.zeros(self.n_vars)
+            db[np.asarray(rows, dtype=int)] = row_coef
+            du[np.asarray(cols, dtype=int)] = col_coef
+            params.append((name, value, db, du))
+
+        for key, row in self.mining_rows.items():
+            param(f"mining_rates.{key}", b_ub[row], [row], 1.0)
+        for key, col in self.mining_cols.items():
+            param(f"mining_rates.{key}", upper[col] * self.col_scale[col], cols=[col], col_coef=1.0)
+        param("power_buffer", power_buffer, [self.power_row], -1.0)
+        param(
+            "storage_limit", storage_limit,
+            self.storage_rows, 1 / interval_minutes,
+            self.storage_cols, 1 / interval_minutes / self.col_scale[self.storage_cols],
+        )
+        for outpost_id, row in zip(self.cap_outpost_ids, self.cap_rows):
+            cap = next(o.get("ticket_rate", 0) for o in self.outposts if o["id"] == outpost_id)
+            param(f"ticket_rate.{outpost_id}", cap, [row], bonus_rate / 60)
+        for machine_id, row in zip(self.machine_cap_ids, self.machine_cap_rows):
+            param(f"max_count.{machine_id}", b_ub[row], [row], 1.0)
+
+        y = lp.ineqlin.marginals
+        w = lp.upper.marginals
+        ranging = _BasisRanging(self.A_ub, b_ub, lower, upper, lp.x, y, w)
+        report = []
+        for name, value, db, du in params:
+            du = np.where(np.isfinite(upper), du, 0.0)
+            lo, hi = ranging.interval(db, du)
+            report.append({
+                "parameter": name,
+                "value": float(value),
+                "marginal": float(-(y @ db + w @ du)) + 0.0,
+                "range": [float(value + lo), float(value + hi)],
+            })
+        return float(-lp.fun), report
+
+    def _linprog(self, b_ub: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> OptimizeResult:
+        from scipy.optimize import linprog
+
+        bounds = [(lo, hi if not np.isinf(hi) else None) for lo, hi in zip(lower, upper)]
+        return linprog(self.c, A_ub=self.A_ub, b_ub=b_ub, bounds=bounds, method="highs")
+
+    def _solve_rounded(self, b_ub: np.ndarray, upper: np.ndarray, max_moves: int = 1000) -> OptimizeResult:
+        """
+        Approximate MILP solve: LP relaxation, rounded onto the machine grid.
+
+        Integer columns are rounded to the nearest grid step within their
+        bounds and continuous columns (outpost sales) start at zero. A greedy
+        repair then moves one integer column by ±1 at a time, always taking the
+        move that most reduces the total row violation (rows scaled by their
+        largest coefficient; ties go to the move that costs the least
+        objective), until ore, power, sewage and every other row hold. Columns
+        that earn tickets directly are then raised while the point stays
+        feasible, and the continuous columns are re-optimized with the integer
+        columns fixed.
+
+        The returned result mirrors ``milp``'s: ``mip_dual_bound`` is the
+        relaxation objective, which bounds the true MILP optimum.
+        """
+        from scipy.optimize import OptimizeResult
+
+        relaxed = self._linprog(b_ub, self.lower, upper)
+        if not relaxed.success:
+            return relaxed
+
+        int_cols = np.flatnonzero(self.integrality == 1)
+        A = self.A_ub[:, int_cols].toarray()
+        row_scale = np.abs(A).max(axis=1, initial=0.0)
+        row_scale[row_scale == 0] = 1.0
+        lo, hi = self.lower[int_cols], upper[int_cols]
+        tol = 1e-9
+        # Price integer columns through the rows they share with continuous columns
+        # (e.g. production through its outposts' sale rows), using the relaxation's duals
+        cont = np.ones(self.n_vars, dtype=bool)
+        cont[int_cols] = False
+        linking = np.flatnonzero(self.A_ub[:, np.flatnonzero(cont)].getnnz(axis=1) > 0)
+        y = relaxed.ineqlin.marginals
+        c = self.c[int_cols] - A[linking].T @ y[linking]
+
+        z = np.clip(np.round(relaxed.x[int_cols]), lo, hi)
+        residual = A @ z - b_ub
+
+        def violation(r: np.ndarray) -> np.ndarray:
+            return (np.maximum(r, 0) / row_scale[:, None]).sum(axis=0)
+
+        # Repair: ±1 on the integer column that most reduces the total violation
+        for _ in range(max_moves):
+            current = violation(residual[:, None])[0]
+            if current <= tol:
+                break
+            v = np.concatenate([violation(residual[:, None] + A), violation(residual[:, None] - A)])
+            v[:len(z)][z + 1 > hi] = np.inf
+            v[len(z):][z - 1 < lo] = np.inf
+            best = np.lexsort((np.concatenate([c, -c]), np.round(v, 9)))[0]
+            if not v[best] < current - tol:
+                break
+            step = 1 if best < len(z) else -1
+            j = best % len(z)
+            z[j] += step
+            residual += step * A[:, j]
+        if violation(residual[:, None])[0] > tol:
+            return OptimizeResult(
+                success=False, status=2, x=None, fun=None, mip_dual_bound=relaxed.fun,
+                message="Rounding the LP relaxation left constraints violated; solve the full MILP instead",
+            )
+
+        def polish() -> OptimizeResult:
+            """Best continuous columns for the current z (``z`` itself if there are none)."""
+            if not np.any(cont):
+                x = np.zeros(self.n_vars)
+                x[int_cols] = z
+                return OptimizeResult(success=True, x=x, price=self.c[int_cols])
+            lower, fixed_upper = self.lower.copy(), upper.copy()
+            lower[int_cols] = fixed_upper[int_cols] = z
+            res = self._linprog(b_ub, lower, fixed_upper)
+            if res.success:
+                # Objective change per unit raise of each fixed column
+                res.price = res.upper.marginals[int_cols]
+            return res
+
+        # Improve: raise columns that pay for themselves (cheapest first) while they fit,
+        # then re-price them against the re-optimized continuous columns
+        polished = polish()
+        for _ in range(max_moves):
+            if not polished.success:
+                return polished
+            raised = False
+            for j in np.argsort(polished.price):
+                if polished.price[j] >= -tol:
+                    break
+                if z[j] + 1 <= hi[j] and np.all(residual + A[:, j] <= tol):
+                    z[j] += 1
+                    residual += A[:, j]
+                    raised = True
+            if not raised:
+                break
+            polished = polish()
+        x = polished.x
+        fun = float(self.c @ x)
+        return OptimizeResult(
+            success=True, status=0, x=x, fun=fun,
+            mip_dual_bound=relaxed.fun, mip_gap=(fun - relaxed.fun) / max(abs(fun), 1e-9),
+            message="LP relaxation rounded to the machine grid",
+        )
+
+    def _resource_usage(self, x: np.ndarray) -> dict[str, float]:
+        """Per-minute resource use (and power in unit/sec) of solution ``x`` in rate space."""
+        cols = self.q_cols if self.resource_cols is None else self.resource_cols
+        usage = self.resource_coef @ x[cols]
+        return dict(zip(RESOURCE_KEYS, usage.tolist()))
+
+    def _decode_multi_outpost(
+        self, x: np.ndarray, min_interval_hours: float, power_buffer: float, storage_limit: float,
+    ) -> LPResult:
+        ids = self.table.ids
+        outposts = self.outposts
+        region = self.region
+        interval_minutes = min_interval_hours * 60
+
+        production_rates = {}
+        sales_by_outpost = {o["id"]: {} for o in outposts}
+        for i, product_id in enumerate(ids):
+            prod = x[self.q_cols[i]]
+            if prod > 1e-6:
+                production_rates[product_id] = prod
+        for k, (i, j) in enumerate(zip(self.sale_i, self.sale_j)):
+            sale = x[self.s_cols[k]]
+            if sale > 1e-6:
+                sales_by_outpost[outposts[j]["id"]][ids[i]] = sale
+
+        battery_for_power = {}
+        battery_for_sale = {}
+        for bj, bi in enumerate(self.battery_indices):
+            prod = x[self.q_cols[bi]]
+            pw = x[self.pw_cols[bj]]
+            if prod > 1e-6:
+                battery_for_power[ids[bi]] = pw
+                battery_for_sale[ids[bi]] = prod - pw
+
+        sales = x[self.s_cols]
+        total_ticket_rate = float(self.table["trade_value"][self.sale_i] @ sales)
+        secondary_currency = float(self.table["secondary_currency_value"][self.sale_i] @ sales)
+
+        # Mining/PA totals and power
+        usage = self._resource_usage(x)
+        ore_consumption = {
+            key: usage[key] for key in ORE_TYPES + ["precipitation_acid"] if usage[key] > 1e-6
+        }
+        power_consumption = usage["power_consumption"]
+        power_supply = float(self.battery_power @ x[self.pw_cols])
+
+        # Storage analysis (per outpost x product)
+        storage_analysis = {}
+        for o in outposts:
+            for prod_id, sale_rate in sales_by_outpost[o["id"]].items():
+                production = sale_rate * interval_minutes
+                loss = max(0, production - storage_limit)
+                storage_analysis[f"{prod_id}@{o['id']}"] = {
+                    "production": production,
+                    "storage_loss": loss,
+                    "effective": min(production, storage_limit),
+                    "loss_percent": loss / production * 100 if production > 0 else 0,
+                }
+
+        return LPResult(
+            success=True,
+            message="Optimal solution found",
+            ticket_rate=total_ticket_rate,
+            production_rates=production_rates,
+            ore_consumption=ore_consumption,
+            power_consumption=power_consumption,
+            power_supply=power_supply,
+            power_balance=power_supply - power_consumption - power_buffer,
+            battery_for_power=battery_for_power,
+            battery_for_sale=battery_for_sale,
+            storage_analysis=storage_analysis,
+            sales_by_outpost=sales_by_outpost,
+            secondary_currency_rate=secondary_currency,
+        )
+
+    def _decode_single_outpost(
+        self,
+        x: np.ndarray,
+        total_ticket_rate: float,
+        min_interval_hours: float,
+        power_buffer: float,
+        storage_limit: float,
+    ) -> LPResult:
+        ids = self.table.ids
+        region = self.region
+
+        # Extract solution
+        production_rates = {}
+        for i, product_id in enumerate(ids):
+            if x[i] > 1e-6:
+                production_rates[product_id] = x[i]
+
+        # Battery allocation
+        battery_for_power = {}
+        battery_for_sale = {}
+        for j, bat_idx in enumerate(self.battery_indices):
+            prod_rate = x[bat_idx]
+            power_rate = x[self.pw_cols[j]]
+            if prod_rate > 1e-6:
+                battery_for_power[ids[bat_idx]] = power_rate
+                battery_for_sale[ids[bat_idx]] = prod_rate - power_rate
+
+        # Note: For products consuming xiranite, the power_consumption already includes
+        # xiranite production, so it is not added separately here.
+        usage = self._resource_usage(x)
+        ore_consumption = {key: usage[key] for key in ORE_TYPES if usage[key] > 1e-6}
+        power_consumption = usage["power_consumption"]
+        power_supply = float(self.battery_power @ x[self.pw_cols])
+
+        # Storage analysis for given interval
+        interval_minutes = min_interval_hours * 60
+        storage_analysis = {}
+        for i, product_id in enumerate(ids):
+            if x[i] > 1e-6:
+                rate = x[i]
+                # For batteries, only the sale portion counts for storage
+                if self.table.is_battery[i] and product_id in battery_for_sale:
+                    rate = battery_for_sale[product_id]
+
+                production = rate * interval_minutes
+                storage_loss = max(0, production - storage_limit)
+                storage_analysis[product_id] = {
+                    "production": production,
+                    "storage_loss": storage_loss,
+                    "effective": min(production, storage_limit),
+                    "loss_percent": storage_loss / production * 100 if production > 0 else 0,
+                }
+
+        # Analyze outpost ticket limits
+        outpost_analysis = analyze_outpost_tickets(
+            region.outposts,
+            total_ticket_rate,
+            min_interval_hours,
+            bonus_rate=1.0,  # No bonus assumed; user can check with bonus separately
+        )
+
+        return LPResult(
+            success=True,
+            message="Optimal solution found",
+            ticket_rate=total_ticket_rate,
+            production_rates=production_rates,
+            ore_consumption=ore_consumption,
+            power_consumption=power_consumption,
+            power_supply=power_supply,
+            power_balance=power_supply - power_consumption - power_buffer,
+            battery_for_power=battery_for_power,
+            battery_for_sale=battery_for_sale,
+            storage_analysis=storage_analysis,
+            outpost_analysis=outpost_analysis,
+        )
+
+
+def _outposts_at_level(outposts: list[dict[str, Any]], cardiac_remediation_level: int) -> list[dict[str, Any]]:
+    """Copy of ``outposts`` with the Cardiac Remediation Station set to the given level."""
+    adjusted = []
+    for o in outposts:
+        o2 = dict(o)
+        if o["id"] == "cardiac_remediation" and "level_table" in o:
+            for lvl in o["level_table"]:
+                if lvl["level"] == cardiac_remediation_level:
+                    o2["ticket_rate"] = lvl["ticket_rate"]
+                    o2["ticket_max"] = lvl["ticket_max"]
+                    o2["level"] = cardiac_remediation_level
+                    break
+        adjusted.append(o2)
+    return adjusted
+
+
+def _effective_machine_caps(region: RegionData, overrides: dict[str, float] | None) -> dict[str, float]:
+    """region.machine_caps with ``overrides`` applied; unknown machine ids are an error."""
+    known = region.recipes.get("machines", {})
+    unknown = sorted(set(overrides or {}) - set(known))
+    if unknown:
+        raise ValueError(f"Unknown machine(s): {', '.join(unknown)}")
+    return {**region.machine_caps, **(overrides or {})}
+
+
+def _add_machine_cap_rows(
+    ub_rows: _SparseRowBuilder,
+    cols: np.ndarray,
+    usage: dict[str, np.ndarray],
+    caps: dict[str, float],
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Add ``Σ usage[m] · x[cols] ≤ caps[m]`` for every capped machine type in use.
+
+    Returns the row indices and machine ids; uncapped or unused machine types
+    get no row.
+    """
+    rows, ids = [], []
+    for machine_id in sorted(caps):
+        coef = usage.get(machine_id)
+        if coef is None or not np.any(coef):
+            continue
+        rows.append(ub_rows.add_row(cols, coef, caps[machine_id]))
+        ids.append(machine_id)
+    return np.array(rows, dtype=int), ids
+
+
+def compile_portfolio_multi_outpost(
     region: RegionData,
-    min_interval_hours: float,
     machine_increment: float = 0.25,
-    bonus_rate: float = 1.0,
     include_event_items: bool = True,
     cardiac_remediation_level: int = 2,
-) -> LPResult:
+    machine_caps: dict[str, float] | None = None,
+) -> PortfolioModel:
     """
-    Multi-outpost LP solver for v1.2 Wuling.
+    Build the multi-outpost MILP for v1.2 Wuling once; see ``PortfolioModel.solve``.
 
     Variables:
         q[i]:    production count for product i (integer, machine_increment unit)
         pw[b]:   power-allocation count for battery b (integer, 0.25 unit)
-        s[i,j]:  sale rate of product i at outpost j (continuous, /min)
+        s[i,j]:  sale rate of product i at outpost j (continuous, /min),
+                 created only for pairs where the product is sold at the outpost
 
     Constraints:
         Mining:        Σi ore_i × p_i ≤ ore_rate
@@ -478,312 +2168,213 @@ def solve_portfolio_multi_outpost(
         Power:         Σi power_i × p_i + buffer ≤ Σb battery_power_b × pw_b
         Battery split: pw_b ≤ p_b
         Sale ≤ prod:   Σj s[i,j] + pw_b (if battery) ≤ p_i
-        Outpost-only:  s[i,j] = 0 if product not sold at outpost j
-        Xiranite:      production + consumption ≤ 240/min (Forge 8台)
+        Machines:      Σi machines_m,i × p_i ≤ max_count_m  (e.g. Forge of the Sky 8台)
         Sewage:        Σi (consumption - production) × p_i ≤ 0
         Storage:       s[i,j] × interval_min ≤ storage_limit
         Outpost cap:   Σi s[i,j] × price_i ≤ rate_j × bonus / 60   (per minute)
     Objective:
         max Σi Σj s[i,j] × price_i
     """
-    products = list(region.products)
+    table = region.product_table
     if not include_event_items:
-        products = [p for p in products if p.id != "xiranite_gourd"]
+        table = table.subset(np.array([pid != "xiranite_gourd" for pid in table.ids], dtype=bool))
 
-    # Adjust cardiac remediation level if specified
-    outposts = []
-    for o in region.outposts:
-        o2 = dict(o)
-        if o["id"] == "cardiac_remediation" and "level_table" in o:
-            for lvl in o["level_table"]:
-                if lvl["level"] == cardiac_remediation_level:
-                    o2["ticket_rate"] = lvl["ticket_rate"]
-                    o2["ticket_max"] = lvl["ticket_max"]
-                    o2["level"] = cardiac_remediation_level
-                    break
-        outposts.append(o2)
+    outposts = _outposts_at_level(region.outposts, cardiac_remediation_level)
 
-    n = len(products)
+    n = len(table)
     m = len(outposts)
-    battery_indices = [i for i, p in enumerate(products) if p.is_battery]
+    battery_indices = table.battery_indices
     n_batteries = len(battery_indices)
 
-    rate_increments = [p.production_rate * machine_increment for p in products]
+    production_rate = table["production_rate"]
+    trade_value = table["trade_value"]
+    rate_increments = production_rate * machine_increment
     power_increment = 0.25
-    power_rate_increments = [p.production_rate * power_increment for p in products]
+    power_rate_increments = production_rate * power_increment
+    # Sellability index: one sale variable per (product, outpost) pair that can sell,
+    # ordered by product then outpost
+    sale_i, sale_j = np.nonzero(table.sold)
 
-    # Variable layout:
+    # Variable layout: [q_0..q_{n-1}, pw_0..pw_{k-1}, s_0..s_{n_s-1}]
     n_q = n
     n_pw = n_batteries
-    n_s = n * m
+    n_s = len(sale_i)
     n_vars = n_q + n_pw + n_s
-
-    def q_idx(i: int) -> int:
-        return i
-
-    def pw_idx(bj: int) -> int:
-        return n_q + bj
-
-    def s_idx(i: int, j: int) -> int:
-        return n_q + n_pw + i * m + j
+    q_cols = np.arange(n_q)
+    pw_cols = n_q + np.arange(n_pw)
+    s_cols = n_q + n_pw + np.arange(n_s)
 
     # Objective: maximize Σ s[i,j] × price (negate for minimization)
     c = np.zeros(n_vars)
-    for i, p in enumerate(products):
-        for j, o in enumerate(outposts):
-            if _is_sold_at(p, o):
-                c[s_idx(i, j)] = -p.trade_value
+    c[s_cols] = -trade_value[sale_i]
 
-    A_ub = []
-    b_ub = []
-    A_eq = []
-    b_eq = []
+    ub_rows = _SparseRowBuilder(n_vars)
 
     # 1. Mining constraints
-    ore_types = ["originium_ore", "amethyst_ore", "ferrium_ore", "cuprium_ore"]
-    for ore_type in ore_types:
+    mining_rows = {}
+    for ore_type in ORE_TYPES:
         rate = region.mining_rates.get(ore_type, 0)
         if rate > 0:
-            row = np.zeros(n_vars)
-            for i, p in enumerate(products):
-                ore_per_rate = getattr(p, ore_type, 0.0) / p.production_rate
-                row[q_idx(i)] = ore_per_rate * rate_increments[i]
-            A_ub.append(row)
-            b_ub.append(rate)
+            mining_rows[ore_type] = ub_rows.add_row(q_cols, table.per_rate(ore_type) * rate_increments, rate)
 
     # 2. Precipitation acid
     pa_supply = region.mining_rates.get("precipitation_acid", 0)
     if pa_supply > 0:
-        row = np.zeros(n_vars)
-        for i, p in enumerate(products):
-            pa_per_rate = p.precipitation_acid / p.production_rate
-            row[q_idx(i)] = pa_per_rate * rate_increments[i]
-        A_ub.append(row)
-        b_ub.append(pa_supply)
-
-    # 3. Power balance
-    row = np.zeros(n_vars)
-    for i, p in enumerate(products):
-        power_per_rate = p.power_consumption / p.production_rate
-        row[q_idx(i)] = power_per_rate * rate_increments[i]
-    for bj, bi in enumerate(battery_indices):
-        bp = products[bi].battery_power
-        row[pw_idx(bj)] = -bp * power_rate_increments[bi]
-    A_ub.append(row)
-    b_ub.append(-region.power_buffer)
+        mining_rows["precipitation_acid"] = ub_rows.add_row(
+            q_cols, table.per_rate("precipitation_acid") * rate_increments, pa_supply,
+        )
+
+    # 3. Power balance (rhs = -power_buffer, set per solve)
+    battery_power = table["battery_power"][battery_indices]
+    power_row = ub_rows.add_row(
+        np.concatenate([q_cols, pw_cols]),
+        np.concatenate([
+            table.per_rate("power_consumption") * rate_increments,
+            -battery_power * power_rate_increments[battery_indices],
+        ]),
+        0.0,
+    )
 
     # 4. Battery: pw ≤ p (in increment units, pw_count × power_inc ≤ q_count × machine_inc)
-    for bj, bi in enumerate(battery_indices):
-        row = np.zeros(n_vars)
-        row[pw_idx(bj)] = power_increment
-        row[q_idx(bi)] = -machine_increment
-        A_ub.append(row)
-        b_ub.append(0)
+    bat_rows = np.arange(n_batteries)
+    ub_rows.add_rows(
+        np.concatenate([bat_rows, bat_rows]),
+        np.concatenate([pw_cols, q_cols[battery_indices]]),
+        np.concatenate([
+            np.full(n_batteries, power_increment),
+            np.full(n_batteries, -machine_increment),
+        ]),
+        np.zeros(n_batteries),
+    )
 
     # 5. Sale ≤ production (per product i: Σj s_ij + pw_actual ≤ p_i)
-    for i, p in enumerate(products):
-        row = np.zeros(n_vars)
-        for j in range(m):
-            row[s_idx(i, j)] = 1
-        row[q_idx(i)] = -rate_increments[i]
-        if i in battery_indices:
-            bj = battery_indices.index(i)
-            row[pw_idx(bj)] = power_rate_increments[i]
-        A_ub.append(row)
-        b_ub.append(0)
-
-    # 6. Force s_ij = 0 if product not sold at outpost
-    for i, p in enumerate(products):
-        for j, o in enumerate(outposts):
-            if not _is_sold_at(p, o):
-                row = np.zeros(n_vars)
-                row[s_idx(i, j)] = 1
-                A_eq.append(row)
-                b_eq.append(0)
-
-    # 7. Xiranite limit (production + consumption ≤ 240)
-    xiranite_idx = next((i for i, p in enumerate(products) if p.id == "xiranite"), None)
-    has_xiranite_consumers = any(p.xiranite_consumption > 0 for p in products)
-    if xiranite_idx is not None and has_xiranite_consumers:
-        xp = products[xiranite_idx]
-        if xp.production_limit:
-            row = np.zeros(n_vars)
-            row[q_idx(xiranite_idx)] = rate_increments[xiranite_idx]
-            for i, p in enumerate(products):
-                if p.xiranite_consumption > 0:
-                    xc_per_rate = p.xiranite_consumption / p.production_rate
-                    row[q_idx(i)] += xc_per_rate * rate_increments[i]
-            A_ub.append(row)
-            b_ub.append(xp.production_limit)
+    ub_rows.add_rows(
+        np.concatenate([sale_i, np.arange(n), battery_indices]),
+        np.concatenate([s_cols, q_cols, pw_cols]),
+        np.concatenate([
+            np.ones(n_s),
+            -rate_increments,
+            power_rate_increments[battery_indices],
+        ]),
+        np.zeros(n),
+    )
+
+    # 6. (Outpost-only sales are enforced by the variable layout: unsellable
+    #    pairs have no s variable at all.)
+
+    # 7. Machine counts over each product's whole chain (region caps, overridden by machine_caps)
+    caps = _effective_machine_caps(region, machine_caps)
+    machine_cap_rows, machine_cap_ids = _add_machine_cap_rows(
+        ub_rows, q_cols, {mid: table.machines_per_rate(mid) * rate_increments for mid in caps}, caps,
+    )
 
     # 8. Sewage balance (consumption ≤ production)
-    has_sewage = any(p.sewage_consumption > 0 or p.sewage_production > 0 for p in products)
+    has_sewage = bool(np.any((table["sewage_consumption"] > 0) | (table["sewage_production"] > 0)))
     if has_sewage:
-        row = np.zeros(n_vars)
-        for i, p in enumerate(products):
-            net = (p.sewage_consumption - p.sewage_production) / p.production_rate
-            row[q_idx(i)] = net * rate_increments[i]
-        A_ub.append(row)
-        b_ub.append(0)
-
-    # 9. Storage cap per (product, outpost)
-    interval_minutes = min_interval_hours * 60
-    max_sale_rate = region.storage_limit / interval_minutes
-    for i in range(n):
-        for j in range(m):
-            row = np.zeros(n_vars)
-            row[s_idx(i, j)] = 1
-            A_ub.append(row)
-            b_ub.append(max_sale_rate)
-
-    # 10. Outpost ticket accumulation cap
-    for j, o in enumerate(outposts):
-        rate_per_h = o.get("ticket_rate", 0) * bonus_rate
-        if rate_per_h > 0:
-            row = np.zeros(n_vars)
-            for i, p in enumerate(products):
-                if _is_sold_at(p, o):
-                    row[s_idx(i, j)] = p.trade_value
-            A_ub.append(row)
-            b_ub.append(rate_per_h / 60)  # /min
+        net = table.per_rate("sewage_consumption") - table.per_rate("sewage_production")
+        ub_rows.add_row(q_cols, net * rate_increments, 0)
+
+    # 9. Storage cap per sellable (product, outpost) (rhs = storage_limit / interval_min, set per solve)
+    storage_rows = ub_rows.add_rows(np.arange(n_s), s_cols, np.ones(n_s), np.zeros(n_s))
+
+    # 10. Outpost ticket accumulation cap (rhs = rate_j × bonus / 60, set per solve)
+    cap_per_h = np.array([o.get("ticket_rate", 0) for o in outposts], dtype=float)
+    capped = np.flatnonzero(cap_per_h > 0)
+    cap_row_of = np.full(m, -1)
+    cap_row_of[capped] = np.arange(len(capped))
+    in_capped = cap_per_h[sale_j] > 0
+    cap_rows = ub_rows.add_rows(
+        cap_row_of[sale_j[in_capped]], s_cols[in_capped], trade_value[sale_i[in_capped]],
+        np.zeros(len(capped)),
+    )
 
     # Bounds
     lower = np.zeros(n_vars)
     upper = np.full(n_vars, np.inf)
-    for i, p in enumerate(products):
-        if p.production_limit is not None:
-            upper[q_idx(i)] = p.production_limit / rate_increments[i]
-        else:
-            upper[q_idx(i)] = 10000
-    for bj, bi in enumerate(battery_indices):
-        upper[pw_idx(bj)] = upper[q_idx(bi)] * machine_increment / power_increment
-
-    # Convert
-    A_ub_arr = np.array(A_ub) if A_ub else np.zeros((0, n_vars))
-    b_ub_arr = np.array(b_ub) if b_ub else np.zeros(0)
-    A_eq_arr = np.array(A_eq) if A_eq else np.zeros((0, n_vars))
-    b_eq_arr = np.array(b_eq) if b_eq else np.zeros(0)
+    upper[q_cols] = np.where(
+        np.isnan(table.production_limit), np.inf, table.production_limit / rate_increments,
+    )
+    upper[pw_cols] = upper[q_cols[battery_indices]] * machine_increment / power_increment
 
     # MILP integrality: q & pw integer, s continuous
     integrality = np.zeros(n_vars, dtype=int)
     integrality[:n_q] = 1
     integrality[n_q:n_q + n_pw] = 1
 
-    constraints = [LinearConstraint(A_ub_arr, -np.inf, b_ub_arr)]
-    if len(A_eq) > 0:
-        constraints.append(LinearConstraint(A_eq_arr, b_eq_arr, b_eq_arr))
-
-    bounds_milp = Bounds(lower, upper)
-    result = milp(c, constraints=constraints, bounds=bounds_milp, integrality=integrality)
-
-    if not result.success:
-        return LPResult(
-            success=False, message=str(getattr(result, "message", "MILP failed")),
-            ticket_rate=0, production_rates={}, ore_consumption={},
-            power_consumption=0, power_supply=0, power_balance=0,
-            battery_for_power={}, battery_for_sale={},
-        )
-
-    x = result.x
-
-    # Decode
-    production_rates = {}
-    sales_by_outpost = {o["id"]: {} for o in outposts}
-    for i, p in enumerate(products):
-        prod = x[q_idx(i)] * rate_increments[i]
-        if prod > 1e-6:
-            production_rates[p.id] = prod
-        for j, o in enumerate(outposts):
-            sale = x[s_idx(i, j)]
-            if sale > 1e-6:
-                sales_by_outpost[o["id"]][p.id] = sale
-
-    battery_for_power = {}
-    battery_for_sale = {}
-    for bj, bi in enumerate(battery_indices):
-        p = products[bi]
-        prod = x[q_idx(bi)] * rate_increments[bi]
-        pw = x[pw_idx(bj)] * power_rate_increments[bi]
-        if prod > 1e-6:
-            battery_for_power[p.id] = pw
-            battery_for_sale[p.id] = prod - pw
-
-    total_ticket_rate = sum(
-        x[s_idx(i, j)] * products[i].trade_value
-        for i in range(n) for j in range(m)
-    )
-    secondary_currency = sum(
-        x[s_idx(i, j)] * products[i].secondary_currency_value
-        for i in range(n) for j in range(m)
-        if products[i].secondary_currency_value > 0
-    )
-
-    # Mining/PA totals
-    ore_consumption = {}
-    for ore_type in ore_types:
-        total = sum(
-            x[q_idx(i)] * rate_increments[i] * (getattr(p, ore_type, 0.0) / p.production_rate)
-            for i, p in enumerate(products)
-        )
-        if total > 1e-6:
-            ore_consumption[ore_type] = total
-    pa_total = sum(
-        x[q_idx(i)] * rate_increments[i] * (p.precipitation_acid / p.production_rate)
-        for i, p in enumerate(products)
+    # Rate (/min) represented by one unit of each variable
+    col_scale = np.ones(n_vars)
+    col_scale[q_cols] = rate_increments
+    col_scale[pw_cols] = power_rate_increments[battery_indices]
+
+    A_ub, b_ub = ub_rows.tocsr()
+    return PortfolioModel(
+        region=region,
+        table=table,
+        outposts=outposts,
+        multi_outpost=True,
+        integer=True,
+        machine_increment=machine_increment,
+        c=c,
+        A_ub=A_ub,
+        b_ub=b_ub,
+        lower=lower,
+        upper=upper,
+        integrality=integrality,
+        col_scale=col_scale,
+        q_cols=q_cols,
+        pw_cols=pw_cols,
+        battery_indices=battery_indices,
+        power_row=power_row,
+        storage_rows=storage_rows,
+        resource_coef=table.per_rate_matrix(RESOURCE_KEYS),
+        s_cols=s_cols,
+        sale_i=sale_i,
+        sale_j=sale_j,
+        cap_rows=cap_rows,
+        cap_per_h=cap_per_h[capped],
+        cap_outpost_ids=[outposts[j]["id"] for j in capped],
+        machine_cap_rows=machine_cap_rows,
+        machine_cap_ids=machine_cap_ids,
+        mining_rows=mining_rows,
     )
-    if pa_total > 1e-6:
-        ore_consumption["precipitation_acid"] = pa_total
 
-    # Power
-    power_consumption = sum(
-        x[q_idx(i)] * rate_increments[i] * (p.power_consumption / p.production_rate)
-        for i, p in enumerate(products)
-    )
-    power_supply = sum(
-        x[pw_idx(bj)] * power_rate_increments[bi] * products[bi].battery_power
-        for bj, bi in enumerate(battery_indices)
-    )
 
-    # Storage analysis (per outpost x product)
-    storage_analysis = {}
-    for o in outposts:
-        for prod_id, sale_rate in sales_by_outpost[o["id"]].items():
-            production = sale_rate * interval_minutes
-            loss = max(0, production - region.storage_limit)
-            storage_analysis[f"{prod_id}@{o['id']}"] = {
-                "production": production,
-                "storage_loss": loss,
-                "effective": min(production, region.storage_limit),
-                "loss_percent": loss / production * 100 if production > 0 else 0,
-            }
+def solve_portfolio_multi_outpost(
+    region: RegionData,
+    min_interval_hours: float,
+    machine_increment: float = 0.25,
+    bonus_rate: float = 1.0,
+    include_event_items: bool = True,
+    cardiac_remediation_level: int = 2,
+    machine_caps: dict[str, float] | None = None,
+    **solve_options: Any,
+) -> LPResult:
+    """
+    Multi-outpost LP solver for v1.2 Wuling.
 
-    return LPResult(
-        success=True,
-        message="Optimal solution found",
-        ticket_rate=total_ticket_rate,
-        production_rates=production_rates,
-        ore_consumption=ore_consumption,
-        power_consumption=power_consumption,
-        power_supply=power_supply,
-        power_balance=power_supply - power_consumption - region.power_buffer,
-        battery_for_power=battery_for_power,
-        battery_for_sale=battery_for_sale,
-        storage_analysis=storage_analysis,
-        sales_by_outpost=sales_by_outpost,
-        secondary_currency_rate=secondary_currency,
+    Compiles the model with ``compile_portfolio_multi_outpost`` and solves it
+    once. Callers running many scenarios should compile once and call
+    ``PortfolioModel.solve`` instead. ``solve_options`` (fast, time_limit,
+    mip_rel_gap, node_limit) are passed to ``PortfolioModel.solve``.
+    """
+    model = compile_portfolio_multi_outpost(
+        region,
+        machine_increment=machine_increment,
+        include_event_items=include_event_items,
+        cardiac_remediation_level=cardiac_remediation_level,
+        machine_caps=machine_caps,
     )
+    return model.solve(min_interval_hours, bonus_rate=bonus_rate, **solve_options)
 
 
-def solve_portfolio(
+def compile_portfolio(
     region: RegionData,
-    min_interval_hours: float,
     use_machine_increments: bool = True,
     machine_increment: float = 0.25,
-    bonus_rate: float = 1.0,
-    include_event_items: bool = True,
-) -> LPResult:
+    machine_caps: dict[str, float] | None = None,
+) -> PortfolioModel:
     """
-    Solve the production portfolio optimization problem using MILP.
+    Build the single-outpost portfolio MILP (or LP) once; see ``PortfolioModel.solve``.
 
     The problem is:
         Maximize: sum(sale_rate_i * price_i) for all products i
@@ -798,8 +2389,8 @@ def solve_portfolio(
         3. Battery split constraint:
            For each battery type: production_rate = power_rate + sale_rate
 
-        4. Intermediate material balance (e.g., xiranite):
-           production >= sales + consumption_by_other_products
+        4. Machine counts (e.g., Forge of the Sky for xiranite):
+           sum(production_rate_i * machines_m_i) <= max_count_m for each capped machine type
 
         5. Non-negativity: all rates >= 0
 
@@ -813,355 +2404,1351 @@ def solve_portfolio(
 
     Args:
         region: Region data with products and constraints
-        min_interval_hours: Minimum trade interval in hours
         use_machine_increments: If True, use MILP with 0.25 machine increments
         machine_increment: Machine count increment (default 0.25)
+        machine_caps: Machine count caps overriding region.machine_caps
     """
+    from scipy import sparse
 
-    products = region.products
-    n_products = len(products)
+    table = region.product_table
+    n_products = len(table)
 
-    # Identify batteries and intermediates (xiranite)
-    battery_indices = [i for i, p in enumerate(products) if p.is_battery]
-    xiranite_idx = next((i for i, p in enumerate(products) if p.id == "xiranite"), None)
+    battery_indices = table.battery_indices
     n_batteries = len(battery_indices)
 
-    # Check if any product consumes xiranite
-    has_xiranite_consumers = any(p.xiranite_consumption > 0 for p in products)
-
     # Calculate rate increments for each product based on machine_increment
     # rate_increment = production_rate_per_machine * machine_increment
-    rate_increments = [p.production_rate * machine_increment for p in products]
+    rate_increments = table["production_rate"] * machine_increment
 
     # Decision variable layout:
     # [prod_rate_0, ..., prod_rate_n-1, power_rate_bat0, ..., power_rate_bat_k-1]
-    # For xiranite: the variable represents SALE rate, not total production
-    # Total xiranite production = sale_rate + consumption_by_batteries
+    # For xiranite the variable is its SALE rate; xiranite made inside other
+    # chains is covered by their machine usage
 
     n_vars = n_products + n_batteries
+    q_cols = np.arange(n_products)
+    pw_cols = n_products + np.arange(n_batteries)
 
     # Build objective function (maximize ticket rate = minimize negative)
     c = np.zeros(n_vars)
-    for i, p in enumerate(products):
-        c[i] = -p.trade_value  # negative because we minimize
-
+    c[q_cols] = -table["trade_value"]  # negative because we minimize
     # For batteries, subtract the power rate contribution (power batteries don't generate tickets)
-    for j, bat_idx in enumerate(battery_indices):
-        power_var_idx = n_products + j
-        c[power_var_idx] = products[bat_idx].trade_value  # positive (reduces objective)
+    c[pw_cols] = table["trade_value"][battery_indices]  # positive (reduces objective)
 
     # Inequality constraints: A_ub @ x <= b_ub
-    A_ub = []
-    b_ub = []
+    ub_rows = _SparseRowBuilder(n_vars)
 
     # 1. Mining rate constraints
     # sum(prod_rate_i * ore_per_unit_rate_i) <= mining_rate
-    ore_types = ["originium_ore", "amethyst_ore", "ferrium_ore", "cuprium_ore"]
-    for ore_type in ore_types:
+    mining_rows = {}
+    for ore_type in ORE_TYPES:
         mining_rate = region.mining_rates.get(ore_type, 0)
         if mining_rate > 0:
-            row = np.zeros(n_vars)
-            for i, p in enumerate(products):
-                ore_per_rate = getattr(p, ore_type, 0.0) / p.production_rate if p.production_rate > 0 else 0
-                row[i] = ore_per_rate
-            A_ub.append(row)
-            b_ub.append(mining_rate)
+            mining_rows[ore_type] = ub_rows.add_row(q_cols, table.per_rate(ore_type), mining_rate)
 
     # 2. Power balance constraint
     # sum(prod_rate_i * power_i / prod_rate) + buffer <= sum(power_rate_j * battery_power_j)
     # Note: For products that consume xiranite (like LC Wuling Battery), the power_consumption
     # already includes xiranite production power, so we don't add it separately.
-    # However, if xiranite is sold directly, we need to add its power.
-    row = np.zeros(n_vars)
-    for i, p in enumerate(products):
-        power_per_rate = p.power_consumption / p.production_rate if p.production_rate > 0 else 0
-        row[i] = power_per_rate
-
-    for j, bat_idx in enumerate(battery_indices):
-        power_var_idx = n_products + j
-        row[power_var_idx] = -products[bat_idx].battery_power
-
-    # If xiranite is sold (as its own product), add its power consumption
-    # This is for the case where xiranite_sales > 0
-    if xiranite_idx is not None:
-        xiranite_product = products[xiranite_idx]
-        xiranite_power_per_rate = xiranite_product.power_consumption / xiranite_product.production_rate
-        row[xiranite_idx] = xiranite_power_per_rate
-
-    A_ub.append(row)
-    b_ub.append(-region.power_buffer)  # We need power_supply >= consumption + buffer
+    # Xiranite sold as its own product carries its own power_consumption like any other column.
+    power_row = ub_rows.add_row(
+        np.concatenate([q_cols, pw_cols]),
+        np.concatenate([table.per_rate("power_consumption"), -table["battery_power"][battery_indices]]),
+        0.0,  # -power_buffer, set per solve: we need power_supply >= consumption + buffer
+    )
 
     # 3. Power rate cannot exceed production rate for each battery
     # power_rate_j <= prod_rate_bat_j
-    for j, bat_idx in enumerate(battery_indices):
-        row = np.zeros(n_vars)
-        row[bat_idx] = -1  # -prod_rate
-        row[n_products + j] = 1  # +power_rate
-        A_ub.append(row)
-        b_ub.append(0)
-
-    # 4. Xiranite production limit constraint (if applicable)
-    # For products consuming xiranite: xiranite_sale + sum(consumption) <= xiranite_production_limit
-    # This is already handled by the production_limit on xiranite, but we need to account for
-    # the fact that xiranite_sale + xiranite_consumed <= limit
-    if xiranite_idx is not None and has_xiranite_consumers:
-        xiranite_product = products[xiranite_idx]
-        if xiranite_product.production_limit is not None:
-            row = np.zeros(n_vars)
-            row[xiranite_idx] = 1  # xiranite sales
-            for i, p in enumerate(products):
-                if p.xiranite_consumption > 0:
-                    xiranite_per_rate = p.xiranite_consumption / p.production_rate
-                    row[i] += xiranite_per_rate
-            A_ub.append(row)
-            b_ub.append(xiranite_product.production_limit)
+    bat_rows = np.arange(n_batteries)
+    ub_rows.add_rows(
+        np.concatenate([bat_rows, bat_rows]),
+        np.concatenate([battery_indices, pw_cols]),
+        np.concatenate([-np.ones(n_batteries), np.ones(n_batteries)]),  # -prod_rate + power_rate
+        np.zeros(n_batteries),
+    )
+
+    # 4. Machine count caps
+    # sum(prod_rate_i * machines_per_rate_i) <= max_count for each capped machine type
+    # Usage covers the whole chain, so xiranite made for batteries and xiranite
+    # sold directly share the Forge of the Sky cap
+    caps = _effective_machine_caps(region, machine_caps)
+    machine_cap_rows, machine_cap_ids = _add_machine_cap_rows(
+        ub_rows, q_cols, {mid: table.machines_per_rate(mid) for mid in caps}, caps,
+    )
 
     # 5. Sewage balance constraint
     # sum(sewage_consumption_i * rate_i / prod_rate_i) <= sum(sewage_production_i * rate_i / prod_rate_i)
     # SC Battery needs sewage from Cuprium refining byproducts of other products
-    has_sewage = any(p.sewage_consumption > 0 or p.sewage_production > 0 for p in products)
+    has_sewage = bool(np.any((table["sewage_consumption"] > 0) | (table["sewage_production"] > 0)))
     if has_sewage:
-        row = np.zeros(n_vars)
-        for i, p in enumerate(products):
-            net = (p.sewage_consumption - p.sewage_production) / p.production_rate if p.production_rate > 0 else 0
-            row[i] = net
-        A_ub.append(row)
-        b_ub.append(0)
+        net = table.per_rate("sewage_consumption") - table.per_rate("sewage_production")
+        ub_rows.add_row(q_cols, net, 0)
 
     # 6. Storage limit constraints
     # For each non-battery product: sale_rate * interval_minutes <= storage_limit
     # For batteries: (prod_rate - power_rate) * interval_minutes <= storage_limit
-    interval_minutes = min_interval_hours * 60
-    max_sale_rate = region.storage_limit / interval_minutes
-
-    for i, p in enumerate(products):
-        if p.is_battery:
-            # Battery: (prod_rate - power_rate) <= max_sale_rate
-            # => prod_rate - power_rate <= max_sale_rate
-            # We need to find which power_var corresponds to this battery
-            bat_j = battery_indices.index(i)
-            row = np.zeros(n_vars)
-            row[i] = 1  # production rate
-            row[n_products + bat_j] = -1  # minus power rate = sale rate
-            A_ub.append(row)
-            b_ub.append(max_sale_rate)
-        else:
-            # Non-battery: just bound on production rate (handled in bounds below)
-            pass
+    # max_sale_rate = storage_limit / interval_minutes is set per solve
+    # Battery: prod_rate - power_rate <= max_sale_rate
+    # Non-battery: just bound on production rate (handled in bounds below)
+    storage_rows = ub_rows.add_rows(
+        np.concatenate([bat_rows, bat_rows]),
+        np.concatenate([battery_indices, pw_cols]),
+        np.concatenate([np.ones(n_batteries), -np.ones(n_batteries)]),  # prod_rate - power_rate
+        np.zeros(n_batteries),
+    )
 
     # Bounds
+    # Storage-limited columns get upper = min(max_sale_rate, limit), set per solve
     lower_bounds = np.zeros(n_vars)
     upper_bounds = np.full(n_vars, np.inf)
+    limit = np.where(np.isnan(table.production_limit), np.inf, table.production_limit)
+
+    # Battery bounds: production can be higher than sale (some goes to power)
+    upper_bounds[battery_indices] = limit[battery_indices]
+    # Non-battery: sale rate = production rate, limited by storage.
+    storage_cols = np.flatnonzero(~table.is_battery)
+    storage_col_limits = limit[storage_cols]
+
+    A_ub, b_ub = ub_rows.tocsr()
+
+    if not use_machine_increments:
+        # Standard LP (continuous variables)
+        return PortfolioModel(
+            region=region,
+            table=table,
+            outposts=region.outposts,
+            multi_outpost=False,
+            integer=False,
+            machine_increment=machine_increment,
+            c=c,
+            A_ub=A_ub,
+            b_ub=b_ub,
+            lower=lower_bounds,
+            upper=upper_bounds,
+            integrality=np.zeros(n_vars, dtype=int),
+            col_scale=np.ones(n_vars),
+            q_cols=q_cols,
+            pw_cols=pw_cols,
+            battery_indices=battery_indices,
+            power_row=power_row,
+            storage_rows=storage_rows,
+            resource_coef=table.per_rate_matrix(RESOURCE_KEYS),
+            storage_cols=storage_cols,
+            storage_col_limits=storage_col_limits,
+            machine_cap_rows=machine_cap_rows,
+            machine_cap_ids=machine_cap_ids,
+            mining_rows=mining_rows,
+        )
 
-    for i, p in enumerate(products):
-        if p.id == "xiranite" and has_xiranite_consumers:
-            # For xiranite with consumers, production_limit is handled by constraint above.
-            # But storage limit still applies to the sales rate variable.
-            upper_bounds[i] = max_sale_rate
-        elif p.is_battery:
-            # Battery bounds: production can be higher than sale (some goes to power)
-            if p.production_limit is not None:
-                upper_bounds[i] = p.production_limit
-        else:
-            # Non-battery: sale rate = production rate, limited by storage
-            upper_storage = max_sale_rate
-            upper_limit = p.production_limit if p.production_limit is not None else np.inf
-            upper_bounds[i] = min(upper_storage, upper_limit)
-
-    # Convert to arrays
-    A_ub = np.array(A_ub) if A_ub else np.zeros((0, n_vars))
-    b_ub = np.array(b_ub) if b_ub else np.zeros(0)
-
-    # Solve using MILP or LP
-    if use_machine_increments:
-        # Use MILP with integer variables for machine counts
-        # Transform: x_i (production rate) = q_i * rate_increment_i
-        # where q_i is a non-negative integer (quarter-machine count)
-
-        # New decision variables: [q_0, ..., q_{n-1}, qp_0, ..., qp_{k-1}]
-        # where q_i = quarter-machine count for product i
-        # and qp_j = quarter-machine count for power allocation of battery j
-
-        # Power allocation is always in 0.25 increments (1 generator = 0.25 production machine)
-        # This is independent of the production machine increment
-        power_increment = 0.25
-        power_rate_increments = [p.production_rate * power_increment for p in products]
-
-        # Transform objective: c'[i] = c[i] * rate_increment[i]
-        c_milp = np.zeros(n_vars)
-        for i in range(n_products):
-            c_milp[i] = c[i] * rate_increments[i]
-        for j, bat_idx in enumerate(battery_indices):
-            # Power rate increment is always 0.25 (generator granularity)
-            c_milp[n_products + j] = c[n_products + j] * power_rate_increments[bat_idx]
-
-        # Transform constraints: A_ub_milp[i] = A_ub[i] * rate_increment
-        A_ub_milp = np.zeros_like(A_ub)
-        for row_idx in range(len(A_ub)):
-            for i in range(n_products):
-                A_ub_milp[row_idx, i] = A_ub[row_idx, i] * rate_increments[i]
-            for j, bat_idx in enumerate(battery_indices):
-                # Power allocation always uses 0.25 increment
-                A_ub_milp[row_idx, n_products + j] = A_ub[row_idx, n_products + j] * power_rate_increments[bat_idx]
-
-        # Transform bounds
-        lower_bounds_milp = np.zeros(n_vars)
-        upper_bounds_milp = np.zeros(n_vars)
-        for i in range(n_products):
-            lower_bounds_milp[i] = 0
-            if np.isinf(upper_bounds[i]):
-                upper_bounds_milp[i] = 10000  # Large upper bound for integers
-            else:
-                # Use floor to ensure we don't exceed storage limits
-                upper_bounds_milp[i] = np.floor(upper_bounds[i] / rate_increments[i])
-        for j, bat_idx in enumerate(battery_indices):
-            lower_bounds_milp[n_products + j] = 0
-            # Power upper bound: production (in production increments) converted to power increments
-            # power_rate <= production_rate
-            # power_units * power_increment <= prod_units * machine_increment
-            # power_units <= prod_units * machine_increment / power_increment
-            upper_bounds_milp[n_products + j] = upper_bounds_milp[bat_idx] * machine_increment / power_increment
-
-        # All variables are integers
-        integrality = np.ones(n_vars, dtype=int)
-
-        # Use scipy.optimize.milp
-        constraints = LinearConstraint(A_ub_milp, -np.inf, b_ub)
-        bounds_milp = Bounds(lower_bounds_milp, upper_bounds_milp)
+    # Use MILP with integer variables for machine counts
+    # Transform: x_i (production rate) = q_i * rate_increment_i
+    # where q_i is a non-negative integer (quarter-machine count)
 
-        result = milp(
-            c_milp,
-            constraints=constraints,
-            bounds=bounds_milp,
-            integrality=integrality,
-        )
+    # New decision variables: [q_0, ..., q_{n-1}, qp_0, ..., qp_{k-1}]
+    # where q_i = quarter-machine count for product i
+    # and qp_j = quarter-machine count for power allocation of battery j
 
-        # Transform solution back to rates
-        if result.success:
-            x = np.zeros(n_vars)
-            for i in range(n_products):
-                x[i] = result.x[i] * rate_increments[i]
-            for j, bat_idx in enumerate(battery_indices):
-                # Power allocation uses 0.25 increment
-                x[n_products + j] = result.x[n_products + j] * power_rate_increments[bat_idx]
-        else:
-            x = None
-    else:
-        # Use standard LP (continuous variables)
-        bounds = [(lower_bounds[i], upper_bounds[i] if not np.isinf(upper_bounds[i]) else None)
-                  for i in range(n_vars)]
+    # Power allocation is always in 0.25 increments (1 generator = 0.25 production machine)
+    # This is independent of the production machine increment
+    power_increment = 0.25
 
-        result = linprog(
-            c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method="highs"
-        )
-        x = result.x if result.success else None
+    # Rate (/min) represented by one unit of each variable: the MILP is the LP
+    # with columns scaled by D = diag(col_scale), i.e. x = D q
+    col_scale = np.ones(n_vars)
+    col_scale[q_cols] = rate_increments
+    col_scale[pw_cols] = table["production_rate"][battery_indices] * power_increment
+
+    # Transform objective and constraints: c' = D c, A' = A D
+    c_milp = c * col_scale
+    A_ub_milp = A_ub @ sparse.diags(col_scale)
+
+    # Transform bounds (storage-limited columns are floored per solve)
+    lower_bounds_milp = np.zeros(n_vars)
+    # Unlimited columns stay unbounded here; solve() derives their bounds from the rows
+    upper_bounds_milp = np.full(n_vars, np.inf)
+    finite = ~np.isinf(upper_bounds)
+    upper_bounds_milp[finite] = np.floor(upper_bounds[finite] / col_scale[finite])
+    # Power upper bound: production (in production increments) converted to power increments
+    # power_rate <= production_rate
+    # power_units * power_increment <= prod_units * machine_increment
+    # power_units <= prod_units * machine_increment / power_increment
+    upper_bounds_milp[pw_cols] = upper_bounds_milp[battery_indices] * machine_increment / power_increment
+
+    return PortfolioModel(
+        region=region,
+        table=table,
+        outposts=region.outposts,
+        multi_outpost=False,
+        integer=True,
+        machine_increment=machine_increment,
+        c=c_milp,
+        A_ub=A_ub_milp.tocsr(),
+        b_ub=b_ub,
+        lower=lower_bounds_milp,
+        upper=upper_bounds_milp,
+        # All variables are integers
+        integrality=np.ones(n_vars, dtype=int),
+        col_scale=col_scale,
+        q_cols=q_cols,
+        pw_cols=pw_cols,
+        battery_indices=battery_indices,
+        power_row=power_row,
+        storage_rows=storage_rows,
+        resource_coef=table.per_rate_matrix(RESOURCE_KEYS),
+        storage_cols=storage_cols,
+        storage_col_limits=storage_col_limits,
+        machine_cap_rows=machine_cap_rows,
+        machine_cap_ids=machine_cap_ids,
+        mining_rows=mining_rows,
+    )
 
-    if not result.success or x is None:
-        return LPResult(
-            success=False,
-            message=result.message if hasattr(result, 'message') else "Optimization failed",
-            ticket_rate=0,
-            production_rates={},
-            ore_consumption={},
-            power_consumption=0,
-            power_supply=0,
-            power_balance=0,
-            battery_for_power={},
-            battery_for_sale={},
-        )
 
-    # Extract solution
-    production_rates = {}
-    for i, p in enumerate(products):
-        if x[i] > 1e-6:
-            production_rates[p.id] = x[i]
-
-    # Battery allocation
-    battery_for_power = {}
-    battery_for_sale = {}
-    for j, bat_idx in enumerate(battery_indices):
-        p = products[bat_idx]
-        prod_rate = x[bat_idx]
-        power_rate = x[n_products + j]
-        if prod_rate > 1e-6:
-            battery_for_power[p.id] = power_rate
-            battery_for_sale[p.id] = prod_rate - power_rate
-
-    # Calculate totals
-    total_ticket_rate = -result.fun
-
-    ore_consumption = {}
-    for ore_type in ore_types:
-        total = 0.0
-        for i, p in enumerate(products):
-            ore_per_rate = getattr(p, ore_type, 0.0) / p.production_rate if p.production_rate > 0 else 0
-            total += x[i] * ore_per_rate
-        if total > 1e-6:
-            ore_consumption[ore_type] = total
-
-    power_consumption = 0.0
-    for i, p in enumerate(products):
-        power_per_rate = p.power_consumption / p.production_rate if p.production_rate > 0 else 0
-        power_consumption += x[i] * power_per_rate
-        # Note: For products consuming xiranite, the power_consumption already includes
-        # xiranite production, so we don't add it separately here.
-
-    power_supply = 0.0
-    for j, bat_idx in enumerate(battery_indices):
-        power_rate = x[n_products + j]
-        power_supply += power_rate * products[bat_idx].battery_power
-
-    # Storage analysis for given interval
-    interval_minutes = min_interval_hours * 60
-    storage_analysis = {}
-    for i, p in enumerate(products):
-        if x[i] > 1e-6:
-            rate = x[i]
-            # For batteries, only the sale portion counts for storage
-            if p.is_battery and p.id in battery_for_sale:
-                rate = battery_for_sale[p.id]
-
-            production = rate * interval_minutes
-            storage_loss = max(0, production - region.storage_limit)
-            storage_analysis[p.id] = {
-                "production": production,
-                "storage_loss": storage_loss,
-                "effective": min(production, region.storage_limit),
-                "loss_percent": storage_loss / production * 100 if production > 0 else 0,
-            }
+def solve_portfolio(
+    region: RegionData,
+    min_interval_hours: float,
+    use_machine_increments: bool = True,
+    machine_increment: float = 0.25,
+    bonus_rate: float = 1.0,
+    include_event_items: bool = True,
+    machine_caps: dict[str, float] | None = None,
+    **solve_options: Any,
+) -> LPResult:
+    """
+    Solve the production portfolio optimization problem using MILP.
 
-    # Analyze outpost ticket limits
-    outpost_analysis = analyze_outpost_tickets(
-        region.outposts,
-        total_ticket_rate,
-        min_interval_hours,
-        bonus_rate=1.0,  # No bonus assumed; user can check with bonus separately
-    )
+    Compiles the model with ``compile_portfolio`` and solves it once. Callers
+    running many scenarios should compile once and call ``PortfolioModel.solve``.
 
-    return LPResult(
-        success=True,
-        message="Optimal solution found",
-        ticket_rate=total_ticket_rate,
-        production_rates=production_rates,
-        ore_consumption=ore_consumption,
-        power_consumption=power_consumption,
-        power_supply=power_supply,
-        power_balance=power_supply - power_consumption - region.power_buffer,
-        battery_for_power=battery_for_power,
-        battery_for_sale=battery_for_sale,
-        storage_analysis=storage_analysis,
-        outpost_analysis=outpost_analysis,
+    Args:
+        region: Region data with products and constraints
+        min_interval_hours: Minimum trade interval in hours
+        use_machine_increments: If True, use MILP with 0.25 machine increments
+        machine_increment: Machine count increment (default 0.25)
+        machine_caps: Machine count caps overriding region.machine_caps
+        solve_options: fast, time_limit, mip_rel_gap, node_limit for ``PortfolioModel.solve``
+    """
+    model = compile_portfolio(
+        region,
+        use_machine_increments=use_machine_increments,
+        machine_increment=machine_increment,
+        machine_caps=machine_caps,
     )
+    return model.solve(min_interval_hours, **solve_options)
 
 
-# =============================================================================
-# Output Formatting
-# =============================================================================
+def _in_region(entry: dict[str, Any], region_id: str) -> bool:
+    """recipes.json entries without a "region" tag are available everywhere."""
+    return entry.get("region", region_id) == region_id
 
-def format_output(region: RegionData, result: LPResult, interval_hours: float) -> str:
-    """Format the optimization result in markdown."""
 
-    lines = []
+def compile_portfolio_recipes(
+    region: RegionData,
+    machine_increment: float = 0.25,
+    integer: bool = True,
+    multi_outpost: bool = False,
+    include_event_items: bool = True,
+    cardiac_remediation_level: int = 2,
+    machine_caps: dict[str, float] | None = None,
+) -> PortfolioModel:
+    """
+    Build the recipe-level model once; see ``PortfolioModel.solve``.
+
+    Instead of one column of precomputed chain figures per product, every
+    recipes.json recipe available in the region gets a machine-count column
+    and every item a balance row, so intermediates and byproducts (xiranite,
+    sewage, liquid xiranite, ...) are shared between products and
+    alternative recipes (carbon from jincao or yazhen) are chosen by the
+    solver.
+
+    Variables:
+        q[i]:    withdrawal rate of sellable product i for sale or power (/min)
+        pw[b]:   rate of battery b burned for power (/min)
+        s[i,j]:  sale rate at outpost j (multi-outpost layout only)
+        m[r]:    machines running recipe r (integer, machine_increment unit)
+        u[k]:    supply of raw ore, fluid or plant k (/min)
+
+    Constraints:
+        Balance:       q_i + Σr in_ir × m_r - Σr out_ir × m_r - u_i ≤ 0  (surplus is discarded)
+        Mining:        u_ore ≤ ore_rate, u_pa ≤ pa_supply
+        Limit:         Σr out_ir × m_r ≤ production_limit_i
+        Machines:      Σ{r on machine type t} m_r ≤ max_count_t
+        Power:         Σr power_r × m_r + Σk raw_power_k × u_k + buffer ≤ Σb battery_power_b × pw_b
+        Battery split: pw_b ≤ q_b
+        plus the sale, storage and outpost-cap rows of the aggregated layouts.
+    """
+    from scipy import sparse
+    from verify_power import RecipeGraph
+
+    recipes = region.recipes
+    graph = RecipeGraph(recipes)
+    table = region.product_table
+    if not include_event_items:
+        table = table.subset(np.array([pid != "xiranite_gourd" for pid in table.ids], dtype=bool))
+    outposts = _outposts_at_level(region.outposts, cardiac_remediation_level) if multi_outpost else region.outposts
+
+    recipe_ids = [rid for rid, r in recipes.get("recipes", {}).items() if _in_region(r, region.id)]
+    machines = recipes.get("machines", {})
+    item_info = recipes.get("items", {})
+
+    # Item x recipe flow (items/min per machine), over all region recipes including alternatives
+    f_rows, f_cols, f_vals = [], [], []
+    for r, rid in enumerate(recipe_ids):
+        recipe = recipes["recipes"][rid]
+        per_min = 60 / recipe["time_sec"]
+        for item, count in recipe.get("outputs", {}).items():
+            f_rows.append(graph.index[item]); f_cols.append(r); f_vals.append(count * per_min)
+        for item, count in recipe.get("inputs", {}).items():
+            f_rows.append(graph.index[item]); f_cols.append(r); f_vals.append(-count * per_min)
+    n_items = len(graph.items)
+    n_r = len(recipe_ids)
+    flow = sparse.coo_matrix((f_vals, (f_rows, f_cols)), shape=(n_items, n_r)).tocsr()
+    gross_output = flow.maximum(0)
+
+    # Raw supplies: ores and mined fluids capped by mining_rates, water and plants unlimited
+    raw_items = np.array([
+        i for i, item in enumerate(graph.items)
+        if graph.item_types[i].startswith("raw_") and _in_region(item_info.get(item, {}), region.id)
+    ], dtype=int)
+    raw_upper = np.array([
+        region.mining_rates.get(graph.items[i], 0)
+        if graph.item_types[i] == "raw_ore" or graph.items[i] in region.mining_rates else np.inf
+        for i in raw_items
+    ], dtype=float)
+
+    n = len(table)
+    product_items = np.array([graph.index[pid] for pid in table.ids], dtype=int)
+    battery_indices = table.battery_indices
+    n_batteries = len(battery_indices)
+    trade_value = table["trade_value"]
+    sale_i, sale_j = np.nonzero(table.sold) if multi_outpost else (np.zeros(0, dtype=int),) * 2
+
+    # Variable layout: [q_0..q_{n-1}, pw, s (multi-outpost), m, u]
+    n_s = len(sale_i)
+    q_cols = np.arange(n)
+    pw_cols = n + np.arange(n_batteries)
+    s_cols = n + n_batteries + np.arange(n_s)
+    m_cols = n + n_batteries + n_s + np.arange(n_r)
+    u_cols = n + n_batteries + n_s + n_r + np.arange(len(raw_items))
+    n_vars = n + n_batteries + n_s + n_r + len(raw_items)
+
+    c = np.zeros(n_vars)
+    if multi_outpost:
+        c[s_cols] = -trade_value[sale_i]
+    else:
+        # Single pool: everything withdrawn is sold except batteries burned for power
+        c[q_cols] = -trade_value
+        c[pw_cols] = trade_value[battery_indices]
+
+    ub_rows = _SparseRowBuilder(n_vars)
+
+    # 1. Item balance: withdrawal + consumption ≤ production + supply
+    balance_items = np.union1d(np.unique(flow.nonzero()[0]), product_items)
+    local = np.full(n_items, -1)
+    local[balance_items] = np.arange(len(balance_items))
+    fc = flow.tocoo()
+    ub_rows.add_rows(
+        np.concatenate([local[fc.row], local[product_items], local[raw_items]]),
+        np.concatenate([m_cols[fc.col], q_cols, u_cols]),
+        np.concatenate([-fc.data, np.ones(n), -np.ones(len(raw_items))]),
+        np.zeros(len(balance_items)),
+    )
+
+    # 2. Production limits on gross output
+    for i in np.flatnonzero(~np.isnan(table.production_limit)):
+        row = gross_output.getrow(product_items[i])
+        ub_rows.add_row(m_cols[row.indices], row.data, table.production_limit[i])
+
+    # 2b. Machine counts per machine type (e.g. Forge of the Sky)
+    recipe_machine = np.array([recipes["recipes"][rid]["machine"] for rid in recipe_ids])
+    caps = _effective_machine_caps(region, machine_caps)
+    machine_cap_rows, machine_cap_ids = _add_machine_cap_rows(
+        ub_rows, m_cols, {mid: (recipe_machine == mid).astype(float) for mid in caps}, caps,
+    )
+
+    # 3. Power balance (rhs = -power_buffer, set per solve)
+    recipe_power = np.array(
+        [machines.get(recipes["recipes"][rid]["machine"], {}).get("power", 0) for rid in recipe_ids], dtype=float,
+    )
+    raw_power = graph.raw_power[raw_items]
+    battery_power = table["battery_power"][battery_indices]
+    power_row = ub_rows.add_row(
+        np.concatenate([m_cols, u_cols, pw_cols]),
+        np.concatenate([recipe_power, raw_power, -battery_power]),
+        0.0,
+    )
+
+    # 4. Battery split: pw ≤ q
+    bat_rows = np.arange(n_batteries)
+    ub_rows.add_rows(
+        np.concatenate([bat_rows, bat_rows]),
+        np.concatenate([pw_cols, q_cols[battery_indices]]),
+        np.concatenate([np.ones(n_batteries), -np.ones(n_batteries)]),
+        np.zeros(n_batteries),
+    )
+
+    cap_rows = np.zeros(0, dtype=int)
+    cap_per_h = np.zeros(0)
+    cap_outpost_ids = []
+    storage_cols = np.zeros(0, dtype=int)
+    if multi_outpost:
+        # 5. Sales ≤ withdrawal: Σj s_ij + pw_i ≤ q_i
+        ub_rows.add_rows(
+            np.concatenate([sale_i, np.arange(n), battery_indices]),
+            np.concatenate([s_cols, q_cols, pw_cols]),
+            np.concatenate([np.ones(n_s), -np.ones(n), np.ones(n_batteries)]),
+            np.zeros(n),
+        )
+        # 6. Storage cap per (product, outpost) (rhs set per solve)
+        storage_rows = ub_rows.add_rows(np.arange(n_s), s_cols, np.ones(n_s), np.zeros(n_s))
+        # 7. Outpost ticket accumulation cap (rhs = rate_j × bonus / 60, set per solve)
+        all_caps = np.array([o.get("ticket_rate", 0) for o in outposts], dtype=float)
+        capped = np.flatnonzero(all_caps > 0)
+        cap_row_of = np.full(len(outposts), -1)
+        cap_row_of[capped] = np.arange(len(capped))
+        in_capped = all_caps[sale_j] > 0
+        cap_rows = ub_rows.add_rows(
+            cap_row_of[sale_j[in_capped]], s_cols[in_capped], trade_value[sale_i[in_capped]],
+            np.zeros(len(capped)),
+        )
+        cap_per_h = all_caps[capped]
+        cap_outpost_ids = [outposts[j]["id"] for j in capped]
+    else:
+        # 5. Storage: batteries q - pw ≤ max_sale_rate (rows), others q ≤ max_sale_rate (bounds)
+        storage_rows = ub_rows.add_rows(
+            np.concatenate([bat_rows, bat_rows]),
+            np.concatenate([q_cols[battery_indices], pw_cols]),
+            np.concatenate([np.ones(n_batteries), -np.ones(n_batteries)]),
+            np.zeros(n_batteries),
+        )
+        storage_cols = q_cols[~table.is_battery]
+
+    lower = np.zeros(n_vars)
+    upper = np.full(n_vars, np.inf)
+    upper[u_cols] = raw_upper
+
+    integrality = np.zeros(n_vars, dtype=int)
+    col_scale = np.ones(n_vars)
+    if integer:
+        integrality[m_cols] = 1
+        col_scale[m_cols] = machine_increment
+        # Generators come in 0.25-machine steps of battery output, as in the aggregated models
+        power_increment = 0.25
+        integrality[pw_cols] = 1
+        col_scale[pw_cols] = table["production_rate"][battery_indices] * power_increment
+
+    # Resource totals come from machines and raw supply, not from per-product figures
+    resource_cols = np.concatenate([m_cols, u_cols])
+    resource_coef = np.zeros((len(RESOURCE_KEYS), len(resource_cols)))
+    raw_ids = [graph.items[i] for i in raw_items]
+    for k, key in enumerate(RESOURCE_KEYS[:-1]):
+        if key in raw_ids:
+            resource_coef[k, n_r + raw_ids.index(key)] = 1.0
+    resource_coef[-1] = np.concatenate([recipe_power, raw_power])
+
+    A_ub, b_ub = ub_rows.tocsr()
+    if integer:
+        A_ub = A_ub @ sparse.diags(col_scale)
+        c = c * col_scale
+    return PortfolioModel(
+        region=region,
+        table=table,
+        outposts=outposts,
+        multi_outpost=multi_outpost,
+        integer=integer,
+        machine_increment=machine_increment,
+        c=c,
+        A_ub=A_ub.tocsr(),
+        b_ub=b_ub,
+        lower=lower,
+        upper=upper,
+        integrality=integrality,
+        col_scale=col_scale,
+        q_cols=q_cols,
+        pw_cols=pw_cols,
+        battery_indices=battery_indices,
+        power_row=power_row,
+        storage_rows=storage_rows,
+        resource_coef=resource_coef,
+        s_cols=s_cols,
+        sale_i=sale_i,
+        sale_j=sale_j,
+        cap_rows=cap_rows,
+        cap_per_h=cap_per_h,
+        storage_cols=storage_cols,
+        storage_col_limits=np.full(len(storage_cols), np.inf),
+        m_cols=m_cols,
+        recipe_ids=recipe_ids,
+        resource_cols=resource_cols,
+        machine_cap_rows=machine_cap_rows,
+        machine_cap_ids=machine_cap_ids,
+        cap_outpost_ids=cap_outpost_ids,
+        mining_cols={
+            graph.items[i]: int(col)
+            for i, col, cap in zip(raw_items, u_cols, raw_upper) if np.isfinite(cap) and cap > 0
+        },
+    )
+
+
+# =============================================================================
+# Scenarios
+# =============================================================================
+
+@dataclass(frozen=True)
+class Scenario:
+    """One solver invocation; fields mirror the CLI flags."""
+    region: str
+    interval_hours: float
+    increment: int = 4  # machine increment divisor (-i)
+    bonus_rate: float = 1.30
+    cardiac_level: int = 2
+    power_buffer: float | None = None  # None = region default
+    include_event_items: bool = True
+    recipe_level: bool = False  # per-recipe machine variables (--recipe-level)
+    machine_caps: tuple[tuple[str, float], ...] = ()  # (machine_id, count) overrides (--machine-cap)
+    fast: bool = False  # round the LP relaxation instead of branch-and-bound (--fast)
+    time_limit: float | None = None  # MILP limits (--time-limit, --mip-gap, --node-limit)
+    mip_rel_gap: float | None = None
+    node_limit: int | None = None
+    sensitivity: bool = False  # shadow prices and ranges (--sensitivity)
+    mining_rates: tuple[tuple[str, float], ...] = ()  # (resource key, /min) overrides of region.mining_rates
+    storage_limit: float | None = None  # None = region default
+
+    @property
+    def multi_outpost(self) -> bool:
+        # Multi-outpost solver for Wuling, legacy single-outpost for Valley IV
+        return self.region.lower() == "wuling"
+
+    def compile_key(self) -> tuple:
+        """Parameters that change the shape of the compiled model."""
+        if self.multi_outpost:
+            key = (self.region.lower(), self.increment, self.include_event_items, self.cardiac_level)
+        else:
+            key = (self.region.lower(), self.increment)
+        return key + (self.recipe_level, self.machine_caps)
+
+    def solve_options(self) -> dict[str, Any]:
+        """Keyword arguments for ``PortfolioModel.solve`` besides the scenario values."""
+        return {
+            "fast": self.fast,
+            "time_limit": self.time_limit,
+            "mip_rel_gap": self.mip_rel_gap,
+            "node_limit": self.node_limit,
+            "sensitivity": self.sensitivity,
+            "mining_rates": dict(self.mining_rates) or None,
+            "storage_limit": self.storage_limit,
+        }
+
+
+class ModelCache:
+    """
+    Loads each region once and keeps one compiled PortfolioModel per
+    ``Scenario.compile_key()``, so repeated scenarios only pay for the solve.
+    """
+
+    def __init__(self, base_path: Path, result_cache: ResultCache | None = None):
+        self.base_path = base_path
+        self.result_cache = result_cache
+        self._regions: dict[str, RegionData] = {}
+        self._models: dict[tuple, PortfolioModel] = {}
+
+    def region(self, region_id: str) -> RegionData:
+        key = region_id.lower()
+        if key not in self._regions:
+            self._regions[key] = load_region_data(region_id, self.base_path)
+        return self._regions[key]
+
+    def model(self, scenario: Scenario) -> PortfolioModel:
+        key = scenario.compile_key()
+        if key not in self._models:
+            region = self.region(scenario.region)
+            machine_increment = 1.0 / scenario.increment
+            machine_caps = dict(scenario.machine_caps)
+            if scenario.recipe_level:
+                self._models[key] = compile_portfolio_recipes(
+                    region,
+                    machine_increment=machine_increment,
+                    multi_outpost=scenario.multi_outpost,
+                    include_event_items=scenario.include_event_items,
+                    cardiac_remediation_level=scenario.cardiac_level,
+                    machine_caps=machine_caps,
+                )
+            elif scenario.multi_outpost:
+                self._models[key] = compile_portfolio_multi_outpost(
+                    region,
+                    machine_increment=machine_increment,
+                    include_event_items=scenario.include_event_items,
+                    cardiac_remediation_level=scenario.cardiac_level,
+                    machine_caps=machine_caps,
+                )
+            else:
+                self._models[key] = compile_portfolio(
+                    region, machine_increment=machine_increment, machine_caps=machine_caps,
+                )
+        return self._models[key]
+
+    def solve(self, scenario: Scenario) -> LPResult:
+        key = None
+        if self.result_cache is not None:
+            key = self.result_cache.key(self.region(scenario.region), scenario)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return cached
+
+        model = self.model(scenario)
+        if scenario.multi_outpost:
+            result = model.solve(
+                scenario.interval_hours,
+                bonus_rate=scenario.bonus_rate,
+                power_buffer=scenario.power_buffer,
+                **scenario.solve_options(),
+            )
+        else:
+            result = model.solve(
+                scenario.interval_hours, power_buffer=scenario.power_buffer, **scenario.solve_options(),
+            )
+
+        # A limit-stopped incumbent depends on machine speed; don't pin it in the cache
+        if key is not None and result.success and not result.limit_reached:
+            self.result_cache.put(key, result)
+        return result
+
+
+# Per-process cache for sweep workers (set by _init_sweep_worker)
+_WORKER_CACHE: ModelCache | None = None
+
+
+def _init_sweep_worker(base_path: Path, cache_dir: Path | None = None) -> None:
+    global _WORKER_CACHE
+    result_cache = ResultCache(cache_dir, base_path) if cache_dir is not None else None
+    _WORKER_CACHE = ModelCache(base_path, result_cache)
+
+
+def _sweep_worker(scenario: Scenario) -> tuple[Scenario, LPResult, float]:
+    t0 = time.perf_counter()
+    result = _WORKER_CACHE.solve(scenario)
+    return scenario, result, (time.perf_counter() - t0) * 1000
+
+
+def run_sweep(
+    scenarios: list[Scenario],
+    base_path: Path,
+    workers: int | None = None,
+    cache_dir: Path | None = None,
+) -> Iterator[tuple[Scenario, LPResult, float]]:
+    """
+    Solve scenarios in a process pool and yield ``(scenario, result, solve_ms)``
+    in input order as soon as each is available.
+
+    Each worker imports scipy and loads region data once, and reuses compiled
+    models across scenarios with the same compile key. Scenarios are sorted by
+    compile key before chunking so a chunk rarely needs more than one model.
+    With ``cache_dir`` set, workers share the on-disk ResultCache.
+    """
+    order = sorted(range(len(scenarios)), key=lambda k: scenarios[k].compile_key())
+    if workers == 1:
+        _init_sweep_worker(base_path, cache_dir)
+        for scenario in scenarios:
+            yield _sweep_worker(scenario)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(scenarios) // (workers * 4))
+    done: dict[int, tuple[Scenario, LPResult, float]] = {}
+    next_k = 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_sweep_worker, initargs=(base_path, cache_dir),
+    ) as pool:
+        for k, item in zip(order, pool.map(_sweep_worker, [scenarios[k] for k in order], chunksize=chunksize)):
+            done[k] = item
+            while next_k in done:
+                yield done.pop(next_k)
+                next_k += 1
+
+
+# =============================================================================
+# Upgrade Planning
+# =============================================================================
+
+@dataclass
+class Upgrade:
+    """
+    One candidate change to a scenario, e.g. a facility expansion.
+
+    ``mining_rates``, ``machine_caps``, ``storage_limit`` and ``power_buffer``
+    are deltas added to the scenario's current values; ``cardiac_level`` is
+    the level to build to.
+    """
+    name: str
+    mining_rates: dict[str, float] = field(default_factory=dict)  # resource key -> +/min
+    machine_caps: dict[str, float] = field(default_factory=dict)  # machine id -> +count
+    storage_limit: float = 0.0
+    power_buffer: float = 0.0  # extra unit/sec the upgrade itself draws
+    cardiac_level: int | None = None
+    note: str = ""
+
+    def apply(self, scenario: Scenario, region: RegionData) -> Scenario:
+        """Return ``scenario`` with this upgrade applied on top of it."""
+        mining_rates = dict(scenario.mining_rates)
+        for key, delta in self.mining_rates.items():
+            if key not in region.mining_rates:
+                raise ValueError(f"{self.name}: unknown mining_rates key {key}")
+            mining_rates[key] = mining_rates.get(key, region.mining_rates[key]) + delta
+
+        machine_caps = dict(scenario.machine_caps)
+        for machine_id, delta in self.machine_caps.items():
+            current = machine_caps.get(machine_id, region.machine_caps.get(machine_id))
+            if current is None:
+                raise ValueError(f"{self.name}: {machine_id} has no max_count to raise")
+            machine_caps[machine_id] = current + delta
+
+        storage_limit = scenario.storage_limit
+        if self.storage_limit:
+            storage_limit = (storage_limit if storage_limit is not None else region.storage_limit) + self.storage_limit
+        power_buffer = scenario.power_buffer
+        if self.power_buffer:
+            power_buffer = (power_buffer if power_buffer is not None else region.power_buffer) + self.power_buffer
+
+        return replace(
+            scenario,
+            mining_rates=tuple(sorted(mining_rates.items())),
+            machine_caps=tuple(sorted(machine_caps.items())),
+            storage_limit=storage_limit,
+            power_buffer=power_buffer,
+            cardiac_level=scenario.cardiac_level if self.cardiac_level is None else self.cardiac_level,
+        )
+
+
+def load_upgrades(path: Path) -> list[Upgrade]:
+    """
+    Read candidate upgrades from a JSON file of the form
+    ``{"upgrades": [{"name": ..., "mining_rates": {...}, ...}, ...]}``.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    known = set(Upgrade.__dataclass_fields__)
+    upgrades = []
+    for entry in data.get("upgrades", []):
+        unknown = sorted(set(entry) - known)
+        if unknown:
+            raise ValueError(f"{entry.get('name', '?')}: unknown field(s) {', '.join(unknown)}")
+        upgrades.append(Upgrade(**entry))
+    names = [u.name for u in upgrades]
+    if len(set(names)) != len(names):
+        raise ValueError("upgrade names must be unique")
+    return upgrades
+
+
+@dataclass
+class UpgradeScore:
+    name: str
+    ticket_rate: float | None  # None = solve failed
+    delta: float | None  # vs. the round's base rate
+    message: str = ""
+
+
+@dataclass
+class UpgradeRound:
+    """Every remaining candidate evaluated on top of ``applied``."""
+    applied: list[str]  # upgrades applied before this round, in order
+    base_rate: float
+    scores: list[UpgradeScore]  # best first; failed solves last
+
+
+def rank_upgrades(
+    base: Scenario,
+    upgrades: list[Upgrade],
+    region: RegionData,
+    base_path: Path,
+    greedy: int = 0,
+    workers: int | None = None,
+    cache_dir: Path | None = None,
+) -> list[UpgradeRound]:
+    """
+    Rank each upgrade by its ticket-rate gain over ``base``.
+
+    The first round scores every candidate alone. With ``greedy`` > 0 the best
+    candidate with a positive gain is applied and the remaining ones are
+    re-scored on top of it, for up to ``greedy`` further rounds; the rounds'
+    winners form the greedy upgrade sequence.
+
+    All rounds share one process pool, so workers compile each model once
+    (candidates that only move right-hand sides reuse the base model).
+    """
+    def solve_all(batch: list[Scenario]) -> list[LPResult]:
+        if pool is None:
+            return [_sweep_worker(s)[1] for s in batch]
+        chunksize = max(1, len(batch) // (workers * 4))
+        return [item[1] for item in pool.map(_sweep_worker, batch, chunksize=chunksize)]
+
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers == 1:
+        _init_sweep_worker(base_path, cache_dir)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker, initargs=(base_path, cache_dir))
+
+    rounds: list[UpgradeRound] = []
+    try:
+        current = base
+        applied: list[str] = []
+        remaining = list(upgrades)
+        results = solve_all([current] + [u.apply(current, region) for u in remaining])
+        if not results[0].success:
+            raise ValueError(f"base scenario failed: {results[0].message}")
+        base_rate = results[0].ticket_rate
+        results = results[1:]
+        while True:
+            scores = [
+                UpgradeScore(u.name, r.ticket_rate, r.ticket_rate - base_rate)
+                if r.success else UpgradeScore(u.name, None, None, r.message)
+                for u, r in zip(remaining, results)
+            ]
+            scores.sort(key=lambda sc: -sc.delta if sc.delta is not None else float("inf"))
+            rounds.append(UpgradeRound(list(applied), base_rate, scores))
+            if len(rounds) > greedy or not scores or scores[0].delta is None or scores[0].delta <= 1e-6:
+                break
+            best = next(u for u in remaining if u.name == scores[0].name)
+            current = best.apply(current, region)
+            applied.append(best.name)
+            base_rate = scores[0].ticket_rate
+            remaining.remove(best)
+            results = solve_all([u.apply(current, region) for u in remaining]) if remaining else []
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return rounds
+
+
+# =============================================================================
+# Result Cache
+# =============================================================================
+
+# Bump when the cached payload layout changes
+RESULT_CACHE_VERSION = 1
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def lp_result_from_dict(data: dict[str, Any]) -> LPResult:
+    """Inverse of ``dataclasses.asdict`` for LPResult."""
+    data = dict(data)
+    if data.get("outpost_analysis") is not None:
+        data["outpost_analysis"] = OutpostTicketAnalysis(**data["outpost_analysis"])
+    return LPResult(**data)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _region_payload(region: RegionData) -> dict[str, Any]:
+    """Region fields that determine a solve (derived/file-backed fields are excluded)."""
+    payload = asdict(region)
+    payload.pop("product_table", None)
+    payload.pop("recipes", None)  # covered by the recipes.json digest
+    return payload
+
+
+def _file_digest(path: Path) -> str:
+    """SHA-256 of ``path`` ("" if missing), recomputed whenever its mtime or size changes."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return ""
+    return _file_digest_cached(path, st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest_cached(path: Path, mtime_ns: int, size: int) -> str:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of solver results.
+
+    Entries are keyed on a hash of the loaded RegionData (including product
+    specs), recipes.json, the solver source and every scenario parameter, so
+    editing any data file simply produces new keys. Each entry is one JSON file;
+    hits refresh the file's mtime and ``put`` evicts least-recently-used entries
+    once the directory exceeds ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: Path, base_path: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+
+    def key(self, region: RegionData, scenario: Scenario) -> str:
+        payload = {
+            "version": RESULT_CACHE_VERSION,
+            "solver": _file_digest(Path(__file__).resolve()),
+            "recipes": _file_digest(self.base_path / "recipes.json"),
+            "region": _region_payload(region),
+            "scenario": asdict(scenario),
+        }
+        blob = json.dumps(payload, sort_keys=True, default=_json_default)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> LPResult | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)  # LRU: mark as recently used
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return lp_result_from_dict(data)
+
+    def put(self, key: str, result: LPResult) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(result), f, default=_json_default)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+
+# =============================================================================
+# Solver Service
+# =============================================================================
+
+# JSON request keys accepted by ``serve`` (CLI flags, dashes as underscores) -> Scenario field, type
+_REQUEST_FIELDS: dict[str, tuple[str, type]] = {
+    "region": ("region", str),
+    "interval": ("interval_hours", float),
+    "increment": ("increment", int),
+    "bonus": ("bonus_rate", float),
+    "cardiac_level": ("cardiac_level", int),
+    "power_buffer": ("power_buffer", float),
+    "recipe_level": ("recipe_level", bool),
+    "fast": ("fast", bool),
+    "time_limit": ("time_limit", float),
+    "mip_gap": ("mip_rel_gap", float),
+    "node_limit": ("node_limit", int),
+    "sensitivity": ("sensitivity", bool),
+}
+
+
+def scenario_from_request(data: dict[str, Any]) -> Scenario:
+    """
+    Scenario for a JSON request whose keys mirror the CLI flags, e.g.
+    ``{"region": "wuling", "interval": 24, "no_gourd": true, "machine_cap": {"forge_of_the_sky": 12}}``.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("request must be a JSON object")
+    unknown = sorted(set(data) - set(_REQUEST_FIELDS) - {"no_gourd", "machine_cap"})
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    if "region" not in data or "interval" not in data:
+        raise ValueError("region and interval are required")
+    kwargs: dict[str, Any] = {}
+    for key, (name, kind) in _REQUEST_FIELDS.items():
+        value = data.get(key)
+        if value is None:
+            continue
+        if kind is bool and not isinstance(value, bool):
+            raise ValueError(f"{key} must be true or false")
+        kwargs[name] = kind(value)
+    kwargs["region"] = kwargs["region"].lower()
+    if kwargs.get("increment", 4) not in (1, 2, 3, 4):
+        raise ValueError("increment must be 1, 2, 3 or 4")
+    if kwargs.get("cardiac_level", 2) not in (1, 2):
+        raise ValueError("cardiac_level must be 1 or 2")
+    if kwargs.get("fast") and kwargs.get("recipe_level"):
+        raise ValueError("fast is not supported with recipe_level")
+    kwargs["include_event_items"] = not data.get("no_gourd", False)
+    kwargs["machine_caps"] = tuple(sorted(
+        (str(machine_id), float(count)) for machine_id, count in dict(data.get("machine_cap", {})).items()
+    ))
+    return Scenario(**kwargs)
+
+
+class SolverService:
+    """
+    Thread-safe front end to a ModelCache for ``solve_portfolio.py serve``.
+
+    Finished ``--json`` payloads are kept, already encoded, in a bounded
+    in-memory LRU; identical concurrent requests wait on the one solve in
+    flight instead of starting their own. Solves and region lookups run one
+    at a time under one lock since the ModelCache they fill is shared.
+    """
+
+    def __init__(self, cache: ModelCache, memo_size: int = 1024, latency_window: int = 1000):
+        self.cache = cache
+        self.memo_size = memo_size
+        self._memo: collections.OrderedDict[Scenario, bytes] = collections.OrderedDict()
+        self._inflight: dict[Scenario, Future] = {}
+        self._lock = threading.Lock()
+        self._solve_lock = threading.Lock()
+        self.sources: collections.Counter[str] = collections.Counter()
+        self.latencies_ms: collections.deque[float] = collections.deque(maxlen=latency_window)
+
+    def validate(self, scenario: Scenario) -> None:
+        """Raise ValueError for an unknown region or machine id."""
+        with self._solve_lock:
+            try:
+                region = self.cache.region(scenario.region)
+            except FileNotFoundError as e:
+                raise ValueError(f"unknown region {scenario.region}") from e
+        unknown = sorted(set(dict(scenario.machine_caps)) - set(region.recipes.get("machines", {})))
+        if unknown:
+            raise ValueError(f"unknown machine(s) in machine_cap: {', '.join(unknown)}")
+
+    def preload(self, scenarios: list[Scenario]) -> None:
+        """Compile and solve ``scenarios`` once so the first requests find warm models."""
+        for scenario in scenarios:
+            self.solve(scenario)
+
+    def solve(self, scenario: Scenario) -> tuple[bytes, str]:
+        """
+        Return the encoded ``--json`` payload and where it came from:
+        ``"memo"``, ``"coalesced"`` (waited on an identical request) or ``"solved"``.
+        """
+        with self._lock:
+            body = self._memo.get(scenario)
+            if body is not None:
+                self._memo.move_to_end(scenario)
+                return body, "memo"
+            future = self._inflight.get(scenario)
+            owner = future is None
+            if owner:
+                future = self._inflight[scenario] = Future()
+        if not owner:
+            return future.result(), "coalesced"
+
+        try:
+            with self._solve_lock:
+                result = self.cache.solve(scenario)
+            body = json.dumps(result_to_dict(result), default=_json_default).encode()
+        except Exception as e:
+            with self._lock:
+                del self._inflight[scenario]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # Limit-stopped incumbents depend on machine speed; solve those again next time
+            if result.success and not result.limit_reached:
+                self._memo[scenario] = body
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+            del self._inflight[scenario]
+        future.set_result(body)
+        return body, "solved"
+
+    def record(self, source: str, latency_ms: float) -> None:
+        with self._lock:
+            self.sources[source] += 1
+            self.latencies_ms.append(latency_ms)
+
+    def stats(self) -> dict[str, Any]:
+        """Request counts by source and latency percentiles over the recent window."""
+        with self._lock:
+            latencies = sorted(self.latencies_ms)
+            sources = dict(self.sources)
+            memo_entries = len(self._memo)
+
+        def percentile(q: float) -> float | None:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {
+            "requests": sum(sources.values()),
+            "sources": sources,
+            "memo_entries": memo_entries,
+            "latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+                           "max": latencies[-1] if latencies else None},
+        }
+
+
+def serve(service: SolverService, host: str = "127.0.0.1", port: int = 8765,
+          socket_path: Path | None = None, quiet: bool = False) -> None:
+    """
+    Answer ``POST /solve`` (JSON scenario -> ``--json`` payload) and
+    ``GET /stats`` over localhost HTTP, or HTTP on a Unix socket if
+    ``socket_path`` is given, until interrupted.
+
+    Every response carries ``Server-Timing: <source>;dur=<ms>``; unless
+    ``quiet``, one line per request is logged to stderr.
+    """
+    import http.server
+    import socketserver
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: bytes, timing: str | None = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if timing:
+                self.send_header("Server-Timing", timing)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, message: str) -> None:
+            self._reply(status, json.dumps({"error": message}).encode())
+
+        def do_GET(self) -> None:
+            if self.path == "/stats":
+                self._reply(200, json.dumps(service.stats()).encode())
+            else:
+                self._error(404, f"no such endpoint {self.path}")
+
+        def do_POST(self) -> None:
+            t0 = time.perf_counter()
+            if self.path != "/solve":
+                self._error(404, f"no such endpoint {self.path}")
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                scenario = scenario_from_request(json.loads(self.rfile.read(length) or b"null"))
+                service.validate(scenario)
+            except (ValueError, TypeError) as e:
+                self._error(400, str(e))
+                return
+            try:
+                body, source = service.solve(scenario)
+            except Exception as e:  # a solver crash must not take the service down
+                self._error(500, f"{type(e).__name__}: {e}")
+                return
+            latency_ms = (time.perf_counter() - t0) * 1000
+            service.record(source, latency_ms)
+            self._reply(200, body, f"{source};dur={latency_ms:.2f}")
+            if not quiet:
+                print(f"{scenario.region} {scenario.interval_hours:g}h -i {scenario.increment} "
+                      f"{source} {latency_ms:.1f} ms", file=sys.stderr, flush=True)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass  # do_POST logs its own line with the latency
+
+    # The default listen backlog of 5 resets connections under a burst of clients
+    if socket_path is not None:
+        class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        socket_path.unlink(missing_ok=True)
+        server = UnixServer(str(socket_path), Handler)
+        where = f"unix:{socket_path}"
+    else:
+        class TCPServer(http.server.ThreadingHTTPServer):
+            request_queue_size = 128
+
+        server = TCPServer((host, port), Handler)
+        where = f"http://{host}:{server.server_address[1]}"
+    print(f"Serving on {where} (POST /solve, GET /stats)", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            socket_path.unlink(missing_ok=True)
+
+
+# =============================================================================
+# Async Solver
+# =============================================================================
+
+class SolverBusy(RuntimeError):
+    """Raised by ``SolverPool.solve_async`` when too many distinct solves are queued."""
+
+
+class SolverPool:
+    """
+    asyncio front end to a process pool of sweep workers, for callers that
+    must not block their event loop on ``milp``.
+
+    At most ``workers`` solves are submitted to the pool at a time; further
+    distinct scenarios wait for a slot, and once ``max_queued`` are waiting
+    new ones are rejected with SolverBusy. Requests for a scenario that is
+    already queued or running share its result. Use from a single event loop::
+
+        async with SolverPool(base_path, workers=4) as pool:
+            result = await pool.solve_async(Scenario("wuling", 24.0), timeout=5.0)
+    """
+
+    def __init__(
+        self,
+        base_path: Path,
+        workers: int | None = None,
+        max_queued: int = 256,
+        cache_dir: Path | None = None,
+        timeout: float | None = None,
+    ):
+        import asyncio
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_sweep_worker, initargs=(base_path, cache_dir),
+        )
+        self._slots = asyncio.Semaphore(self.workers)
+        self._queued: set[asyncio.Task] = set()  # waiting for a slot
+        self._inflight: dict[Scenario, asyncio.Task] = {}
+        self._waiters: collections.Counter[asyncio.Task] = collections.Counter()
+
+    async def __aenter__(self) -> SolverPool:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Cancel queued solves and wait, off the event loop, for running ones to finish."""
+        import asyncio
+
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+        await asyncio.to_thread(self._pool.shutdown, wait=True, cancel_futures=True)
+
+    @property
+    def pending(self) -> int:
+        """Distinct scenarios queued or running."""
+        return len(self._inflight)
+
+    async def solve_async(self, scenario: Scenario, timeout: float | None = None) -> LPResult:
+        """
+        Solve ``scenario`` in the pool and return its LPResult.
+
+        ``timeout`` (seconds, default ``self.timeout``) covers both the wait
+        for a slot and the solve, and raises TimeoutError. Cancelling or
+        timing out only abandons this request: the shared solve is cancelled
+        once no request waits on it, but a worker already running HiGHS
+        finishes first, so bound runaway solves with ``scenario.time_limit``.
+        """
+        import asyncio
+
+        task = self._inflight.get(scenario)
+        if task is None:
+            if len(self._queued) >= self.max_queued:
+                raise SolverBusy(f"{len(self._queued)} solves already queued")
+            task = asyncio.ensure_future(self._run(scenario))
+            self._inflight[scenario] = task
+            self._queued.add(task)
+            task.add_done_callback(lambda t: self._forget(scenario, t))
+        self._waiters[task] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout if timeout is None else timeout)
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] <= 0:
+                del self._waiters[task]
+                if not task.done():
+                    # Nobody waits on it any more; don't let new requests join a cancelled solve
+                    self._forget(scenario, task)
+                    task.cancel()
+
+    def _forget(self, scenario: Scenario, task: Any) -> None:
+        if self._inflight.get(scenario) is task:
+            del self._inflight[scenario]
+        self._queued.discard(task)
+
+    async def _run(self, scenario: Scenario) -> LPResult:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        await self._slots.acquire()
+        self._queued.discard(asyncio.current_task())
+
+        def release(_: Future) -> None:
+            # The slot is held until the worker is free again, even if the caller gave up
+            try:
+                loop.call_soon_threadsafe(self._slots.release)
+            except RuntimeError:  # event loop already closed
+                pass
+
+        try:
+            future = self._pool.submit(_sweep_worker, scenario)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(release)
+        _, result, _ = await asyncio.wrap_future(future)
+        return result
+
+
+# =============================================================================
+# Output Formatting
+# =============================================================================
+
+def result_to_dict(result: LPResult) -> dict[str, Any]:
+    """Convert a result to the ``--json`` payload."""
+    outpost_data = None
+    if result.outpost_analysis:
+        oa = result.outpost_analysis
+        outpost_data = {
+            "total_accumulated": oa.total_accumulated,
+            "total_limit": oa.total_limit,
+            "available_tickets": oa.available_tickets,
+            "produced_tickets": oa.produced_tickets,
+            "effective_tickets": oa.effective_tickets,
+            "effective_rate": oa.effective_rate,
+            "is_limited": oa.is_limited,
+            "limit_ratio": oa.limit_ratio,
+            "outpost_details": oa.outpost_details,
+        }
+    return {
+        "success": result.success,
+        "message": result.message,
+        "ticket_rate": result.ticket_rate,
+        "production_rates": result.production_rates,
+        "ore_consumption": result.ore_consumption,
+        "power_consumption": result.power_consumption,
+        "power_supply": result.power_supply,
+        "power_balance": result.power_balance,
+        "battery_for_power": result.battery_for_power,
+        "battery_for_sale": result.battery_for_sale,
+        "storage_analysis": result.storage_analysis,
+        "outpost_analysis": outpost_data,
+        **({"recipe_machines": result.recipe_machines} if result.recipe_machines else {}),
+        **({"machine_usage": result.machine_usage} if result.machine_usage else {}),
+        "dual_bound": result.dual_bound,
+        "mip_gap": result.mip_gap,
+        "mip_node_count": result.mip_node_count,
+        "wall_time_ms": result.wall_time_ms,
+        "limit_reached": result.limit_reached,
+        **({"sensitivity_rate": result.sensitivity_rate, "sensitivity": result.sensitivity}
+           if result.sensitivity else {}),
+    }
+
+
+def format_output(region: RegionData, result: LPResult, interval_hours: float) -> str:
+    """Format the optimization result in markdown."""
+
+    lines = []
     lines.append(f"# {region.name_en} ({region.name_ja}) - Optimal Portfolio")
     lines.append("")
     lines.append(f"## Sale Interval: {interval_hours}h")
@@ -1182,10 +3769,9 @@ def format_output(region: RegionData, result: LPResult, interval_hours: float) -
         "ferrium_ore": ("Ferrium", "青鉄鉱"),
         "cuprium_ore": ("Cuprium", "赤銅鉱"),
     }
+    table = region.product_table
     for ore_type, (en_name, _ja_name) in ore_attr_map.items():
-        if region.mining_rates.get(ore_type, 0) > 0 or any(
-            getattr(p, ore_type, 0) > 0 for p in region.products
-        ):
+        if region.mining_rates.get(ore_type, 0) > 0 or np.any(table[ore_type] > 0):
             ore_display.append((ore_type, en_name))
 
     ore_headers = " | ".join(name for _, name in ore_display)
@@ -1195,32 +3781,27 @@ def format_output(region: RegionData, result: LPResult, interval_hours: float) -
 
     products_by_id = {p.id: p for p in region.products}
 
-    ore_totals = {ore_type: 0.0 for ore_type, _ in ore_display}
-    total_power = 0.0
-    total_machines = 0.0
-
-    for prod_id, rate in sorted(result.production_rates.items()):
+    # Per-row figures come straight from the product table columns
+    produced = sorted(result.production_rates.items())
+    rows = np.array([table.index(prod_id) for prod_id, _ in produced], dtype=int)
+    rates = np.array([rate for _, rate in produced], dtype=float)
+    scales = rates / table["production_rate"][rows]  # machine count = rate / rate_per_machine
+    powers = table["power_consumption"][rows] * scales
+    ore_values = np.array(
+        [table[ore_type][rows] * scales for ore_type, _ in ore_display], dtype=float,
+    ).reshape(len(ore_display), len(rows))
+    total_power = float(powers.sum())
+    total_machines = float(scales.sum())
+
+    for k, (prod_id, rate) in enumerate(produced):
         p = products_by_id[prod_id]
-        scale = rate / p.production_rate
-        machines = scale  # machine count = rate / rate_per_machine
-
-        power = p.power_consumption * scale
-        total_power += power
-        total_machines += machines
-
-        ore_values = []
-        for ore_type, _ in ore_display:
-            val = getattr(p, ore_type, 0.0) * scale
-            ore_totals[ore_type] += val
-            ore_values.append(f"{val:.0f}" if val > 0 else "-")
-
-        ore_cells = " | ".join(ore_values)
-        lines.append(f"| {p.name_en} | {machines:.2f} | {rate:.2f} | {ore_cells} | {power:.0f} | {p.trade_value} |")
+        ore_cells = " | ".join(f"{val:.0f}" if val > 0 else "-" for val in ore_values[:, k])
+        lines.append(f"| {p.name_en} | {scales[k]:.2f} | {rate:.2f} | {ore_cells} | {powers[k]:.0f} | {p.trade_value} |")
 
     # Totals row
     ore_total_strs = []
-    for ore_type, _ in ore_display:
-        total = ore_totals[ore_type]
+    for o, (ore_type, _) in enumerate(ore_display):
+        total = float(ore_values[o].sum())
         surplus = region.mining_rates.get(ore_type, 0) - total
         ore_total_strs.append(f"**{total:.0f}** (surplus {surplus:.0f})")
     ore_total_cells = " | ".join(ore_total_strs)
@@ -1228,6 +3809,26 @@ def format_output(region: RegionData, result: LPResult, interval_hours: float) -
     lines.append(f"| **Total** | **{total_machines:.2f}** | | {ore_total_cells} | **{total_power:.0f}** | |")
     lines.append("")
 
+    # Recipe-level model: the production table above shows standalone chain figures;
+    # the machines actually share intermediates and byproducts
+    if result.recipe_machines:
+        machines = region.recipes.get("machines", {})
+        lines.append("## Recipe Machines")
+        lines.append("")
+        lines.append("| Recipe | Machine | Count | Power (unit/sec) |")
+        lines.append("|--------|---------|-------|------------------|")
+        total_recipe_power = 0.0
+        for recipe_id, count in result.recipe_machines.items():
+            machine_id = region.recipes["recipes"][recipe_id]["machine"]
+            machine = machines.get(machine_id, {})
+            power = machine.get("power", 0) * count
+            total_recipe_power += power
+            lines.append(f"| {recipe_id} | {machine.get('name_en', machine_id)} | {count:.2f} | {power:.0f} |")
+        lines.append(f"| **Total** | | | **{total_recipe_power:.0f}** |")
+        lines.append("")
+        lines.append("Processing power only; Summary includes mining, farming and water.")
+        lines.append("")
+
     # Power allocation
     lines.append("## Power Allocation")
     lines.append("")
@@ -1253,8 +3854,37 @@ def format_output(region: RegionData, result: LPResult, interval_hours: float) -
     lines.append(f"| Power Consumption | {result.power_consumption:.0f} unit/sec |")
     lines.append(f"| Power Buffer | {region.power_buffer:.0f} unit/sec |")
     lines.append(f"| **Power Balance** | **{result.power_balance:+.0f} unit/sec** |")
+    machines = region.recipes.get("machines", {})
+    for machine_id, usage in result.machine_usage.items():
+        name = machines.get(machine_id, {}).get("name_en", machine_id)
+        lines.append(f"| {name} | {usage['used']:.2f} / {usage['cap']:.0f} machines |")
+    if result.dual_bound is not None and (result.limit_reached or result.mip_gap > 1e-6):
+        lines.append(f"| Dual Bound | {result.dual_bound:.2f} tickets/min (gap {result.mip_gap:.2%}) |")
+    if result.limit_reached:
+        lines.append(f"| Solver | {result.message} ({result.mip_node_count} nodes, {result.wall_time_ms:.0f} ms) |")
     lines.append("")
 
+    # Shadow prices (--sensitivity)
+    if result.sensitivity:
+        lines.append("## Sensitivity")
+        lines.append("")
+        lines.append("| Parameter | Value | Marginal (tickets/min per unit) | Valid Range |")
+        lines.append("|-----------|-------|---------------------------------|-------------|")
+
+        def bound(v: float) -> str:
+            return "∞" if v == np.inf else "-∞" if v == -np.inf else f"{round(v, 1) + 0.0:,.1f}"
+
+        for entry in result.sensitivity:
+            lo, hi = entry["range"]
+            lines.append(f"| {entry['parameter']} | {entry['value']:,.1f} | {entry['marginal']:+.4f} "
+                         f"| {bound(lo)} – {bound(hi)} |")
+        lines.append("")
+        lines.append(f"Prices from the LP over the chosen products ({result.sensitivity_rate:.2f} tickets/min); "
+                     f"each holds while its parameter stays in range. Units: /min for mining rates, "
+                     f"unit/sec for power_buffer, items for storage_limit, tickets/h for ticket_rate, "
+                     f"machines for max_count.")
+        lines.append("")
+
     # Ticket breakdown
     lines.append("## Ticket Breakdown")
     lines.append("")
@@ -1390,13 +4020,1036 @@ def format_output(region: RegionData, result: LPResult, interval_hours: float) -
     return "\n".join(lines)
 
 
+def format_curve(region: RegionData, curve: IntervalCurve) -> str:
+    """Format an interval curve in markdown: one row per piece, with the portfolio changes."""
+    names = {p.id: p.name_en for p in region.products}
+    segments = curve.segments
+    lines = []
+    lines.append(f"# {region.name_en} ({region.name_ja}) - Ticket Rate vs Sale Interval")
+    lines.append("")
+    lines.append(f"## {segments[0].hours_from:g}h – {segments[-1].hours_to:g}h")
+    lines.append("")
+    lines.append("| Interval (h) | Tickets/min | ticket_rate(h) | Portfolio |")
+    lines.append("|--------------|-------------|----------------|-----------|")
+    previous: list[str] = []
+    for seg in segments:
+        start, end = seg.rate(seg.hours_from), seg.rate(seg.hours_to)
+        rate = f"{start:.2f}" if abs(end - start) < 5e-3 else f"{start:.2f} → {end:.2f}"
+        form = f"{seg.base:.2f}" if abs(seg.coef) < 1e-9 else f"{seg.base:.2f} + {seg.coef:.1f} / h"
+        if not previous:
+            portfolio = ", ".join(names.get(p, p) for p in seg.products)
+        else:
+            changes = [f"+{names.get(p, p)}" for p in seg.products if p not in previous]
+            changes += [f"−{names.get(p, p)}" for p in previous if p not in seg.products]
+            portfolio = ", ".join(changes) or "(same products, new machine counts)"
+        previous = seg.products
+        lines.append(f"| {seg.hours_from:.2f} – {seg.hours_to:.2f} | {rate} | {form} | {portfolio} |")
+    lines.append("")
+    lines.append(
+        "ticket_rate(h) is exact on each row. A row starts where the optimal portfolio or the "
+        "binding constraints change; Portfolio lists the products added (+) and dropped (−) there."
+    )
+    lines.append("")
+    lines.append(f"{curve.solves} MILP solves, {curve.wall_time_ms:.0f} ms")
+    return "\n".join(lines)
+
+
+def format_heatmap(region: RegionData, heatmap: MiningHeatmap, interval_hours: float, grid_path: Path | None = None) -> str:
+    """Markdown summary of a mining-rate heatmap, in the style of docs/optimization_solved_*."""
+    resource_ja = {
+        "originium_ore": "源石鉱",
+        "amethyst_ore": "紫晶鉱",
+        "ferrium_ore": "青鉄鉱",
+        "cuprium_ore": "赤銅鉱",
+        "precipitation_acid": "沈殿酸",
+    }
+    names = {p.id: p.name_ja for p in region.products}
+    x_name = resource_ja.get(heatmap.x_key, heatmap.x_key)
+    y_name = resource_ja.get(heatmap.y_key, heatmap.y_key)
+    xs, ys = heatmap.x_values, heatmap.y_values
+    rate = np.array([[np.nan if v is None else v for v in row] for row in heatmap.ticket_rate])
+    owner = np.array([[-1 if v is None else v for v in row] for row in heatmap.portfolio])
+    n_points = rate.size
+    n_interpolated = int(np.sum(heatmap.interpolated))
+
+    # Portfolios by grid area; the most common get letters on the map
+    counts = np.bincount(owner[owner >= 0], minlength=len(heatmap.portfolios))
+    ranked = [int(k) for k in np.argsort(-counts, kind="stable") if counts[k] > 0]
+    symbols = {k: chr(ord("A") + n) for n, k in enumerate(ranked[:26])}
+
+    lines = []
+    lines.append(f"# 採掘レート感度マップ：{region.name_ja}")
+    lines.append("")
+    lines.append(
+        f"MILPソルバーによる取引券レート（券/min）。売却間隔 {interval_hours:g}時間。"
+        f"横軸 {x_name} {xs[0]:g}–{xs[-1]:g}/min（現在 {region.mining_rates.get(heatmap.x_key, 0):g}）、"
+        f"縦軸 {y_name} {ys[0]:g}–{ys[-1]:g}/min（現在 {region.mining_rates.get(heatmap.y_key, 0):g}）。"
+    )
+    lines.append("")
+    pinned = n_points - heatmap.solves - n_interpolated
+    note = f"格子 {len(xs)}×{len(ys)} = {n_points:,} 点のうち {heatmap.solves:,} 点を求解、{pinned:,} 点は単調性による上下界の一致から確定"
+    if n_interpolated:
+        note += f"、{n_interpolated:,} 点は双線形補間"
+    lines.append(note + f"（{heatmap.wall_time_ms / 1000:.1f}秒）。")
+    if grid_path is not None:
+        lines.append(f"全格子: `{grid_path}`")
+    lines.append("")
+
+    # Rate table on at most 9×9 sampled grid points, high y first
+    xi = np.unique(np.linspace(0, len(xs) - 1, min(len(xs), 9)).round().astype(int))
+    yi = np.unique(np.linspace(0, len(ys) - 1, min(len(ys), 9)).round().astype(int))[::-1]
+    lines.append("## 取引券レート（券/min）")
+    lines.append("")
+    lines.append(f"| {y_name} \\ {x_name} | " + " | ".join(f"{xs[i]:g}" for i in xi) + " |")
+    lines.append("|---|" + "--:|" * len(xi))
+    for j in yi:
+        cells = ["-" if np.isnan(rate[j, i]) else f"{rate[j, i]:,.1f}" for i in xi]
+        lines.append(f"| {ys[j]:g} | " + " | ".join(cells) + " |")
+    lines.append("")
+
+    lines.append("## ポートフォリオ")
+    lines.append("")
+    lines.append("| 記号 | 製品 | 格子点 | 券/min |")
+    lines.append("|---|---|--:|--:|")
+    for k in ranked[:26]:
+        values = rate[owner == k]
+        products = "、".join(names.get(p, p) for p in heatmap.portfolios[k])
+        lines.append(f"| {symbols[k]} | {products} | {counts[k]} | {values.min():,.1f}–{values.max():,.1f} |")
+    if len(ranked) > 26:
+        rest = sum(int(counts[k]) for k in ranked[26:])
+        lines.append(f"| · | その他 {len(ranked) - 26} 構成 | {rest} | |")
+    lines.append("")
+
+    # Map at up to 40 columns, high y first
+    lines.append("## 構成マップ")
+    lines.append("")
+    mi = np.unique(np.linspace(0, len(xs) - 1, min(len(xs), 40)).round().astype(int))
+    mj = np.unique(np.linspace(0, len(ys) - 1, min(len(ys), 40)).round().astype(int))[::-1]
+    width = max(len(f"{ys[j]:g}") for j in mj)
+    lines.append("```")
+    for j in mj:
+        row = "".join(symbols.get(int(owner[j, i]), "-" if owner[j, i] < 0 else "·") for i in mi)
+        lines.append(f"{ys[j]:>{width}g} | {row}")
+    lines.append(f"{'':>{width}}   {xs[0]:<g}{xs[-1]:>{max(1, len(mi) - len(f'{xs[0]:g}'))}g}")
+    lines.append("```")
+    lines.append("")
+    lines.append(f"縦軸 {y_name}、横軸 {x_name}（/min）。`-` は実行可能な構成なし、`·` はその他の構成。")
+    return "\n".join(lines)
+
+
+def format_upgrades(region: RegionData, rounds: list[UpgradeRound], upgrades: list[Upgrade], interval_hours: float) -> str:
+    """Format an upgrade ranking in markdown, followed by the greedy sequence if one was run."""
+    notes = {u.name: u.note for u in upgrades}
+    first = rounds[0]
+    lines = []
+    lines.append(f"# {region.name_en} ({region.name_ja}) - Upgrade Ranking ({interval_hours}h)")
+    lines.append("")
+    lines.append(f"Base: **{first.base_rate:.2f} tickets/min**")
+    lines.append("")
+    lines.append("| Rank | Upgrade | Tickets/min | Δ/min | Δ% | Note |")
+    lines.append("|-----:|---------|------------:|------:|---:|------|")
+    for rank, sc in enumerate(first.scores, 1):
+        if sc.delta is None:
+            lines.append(f"| - | {sc.name} | failed: {sc.message} | | | {notes[sc.name]} |")
+            continue
+        pct = sc.delta / first.base_rate * 100 if first.base_rate else 0.0
+        lines.append(f"| {rank} | {sc.name} | {sc.ticket_rate:.2f} | {sc.delta:+.2f} | {pct:+.1f}% | {notes[sc.name]} |")
+
+    if len(rounds) > 1:
+        lines.append("")
+        lines.append("## Greedy Sequence")
+        lines.append("")
+        lines.append("| Step | Upgrade | Tickets/min | Δ/min | Total Δ/min |")
+        lines.append("|-----:|---------|------------:|------:|------------:|")
+        for step, (prev, cur) in enumerate(zip(rounds, rounds[1:]), 1):
+            lines.append(
+                f"| {step} | {cur.applied[-1]} | {cur.base_rate:.2f} | {cur.base_rate - prev.base_rate:+.2f} "
+                f"| {cur.base_rate - first.base_rate:+.2f} |"
+            )
+        last = rounds[-1]
+        if last.scores and (last.scores[0].delta or 0) <= 1e-6:
+            lines.append("")
+            lines.append("Stopped: no remaining upgrade raises the ticket rate.")
+    lines.append("")
+    lines.append("Δ is the change in tickets/min; each greedy step re-ranks the remaining upgrades "
+                 "on top of the ones already applied.")
+    return "\n".join(lines)
+
+
+def format_evaluation(
+    region: RegionData,
+    names: list[str],
+    evaluation: PortfolioEvaluation,
+    optimum: float | None,
+    interval_hours: float,
+    top: int | None = None,
+) -> str:
+    """Format evaluated portfolios in markdown, feasible ones first, best rate first."""
+    order = np.lexsort((-evaluation.ticket_rate, ~evaluation.feasible))
+    lines = []
+    lines.append(f"# {region.name_en} ({region.name_ja}) - Portfolio Evaluation ({interval_hours}h)")
+    lines.append("")
+    if optimum is not None:
+        lines.append(f"Solver optimum: **{optimum:.2f} tickets/min**")
+        lines.append("")
+    lines.append("| Portfolio | Tickets/min | Gap | Gap % | Storage loss | Cap loss | Violations |")
+    lines.append("|-----------|------------:|----:|------:|-------------:|---------:|------------|")
+    for k in order[:top]:
+        rate = evaluation.ticket_rate[k]
+        gap = pct = ""
+        if optimum is not None:
+            gap = f"{optimum - rate:+.2f}"
+            pct = f"{(optimum - rate) / optimum * 100:+.1f}%" if optimum else ""
+        violated = [
+            f"{cid} {evaluation.slack[k, c]:+,.1f}"
+            for c, cid in enumerate(evaluation.constraint_ids)
+            if not evaluation.feasible[k] and evaluation.slack[k, c] < 0
+        ]
+        lines.append(
+            f"| {names[k]} | {rate:.2f} | {gap} | {pct} | {evaluation.storage_loss[k]:.2f} "
+            f"| {evaluation.cap_loss[k]:.2f} | {', '.join(violated) or '-'} |"
+        )
+    if top is not None and top < len(order):
+        lines.append(f"| … {len(order) - top} more | | | | | | |")
+    lines.append("")
+    lines.append(
+        f"{int(evaluation.feasible.sum())} of {len(names)} portfolios feasible. Gap is the solver "
+        "optimum minus the portfolio's rate; losses are tickets/min produced but not sold "
+        "(storage_limit, outpost accumulation caps). Violations list limit − usage in the "
+        "constraint's unit (/min, unit/sec, machines)."
+    )
+    return "\n".join(lines)
+
+
+def format_simulation(
+    region: RegionData,
+    interval_hours: float,
+    planned: float,
+    names: list[str],
+    named: SaleSimulation,
+    sampled: SaleSimulation | None = None,
+    pattern: str = "",
+) -> str:
+    """Format simulated sale schedules in markdown: one row per named schedule, percentiles for samples."""
+    minutes = named.horizon_hours * 60
+    lines = []
+    lines.append(f"# {region.name_en} ({region.name_ja}) - Sale Simulation")
+    lines.append("")
+    lines.append(f"Portfolio solved for {interval_hours:g}h: **{planned:.2f} tickets/min** planned, "
+                 f"{named.offered_rate:.2f}/min into storage. Horizon {named.horizon_hours:g}h.")
+    lines.append("")
+    lines.append("| Schedule | Sales | Tickets/min | vs plan | Storage waste/min | Pool overflow/min | Unsold at end |")
+    lines.append("|----------|------:|------------:|--------:|------------------:|------------------:|--------------:|")
+    for k, name in enumerate(names):
+        rate = named.realized_rate[k]
+        pct = f"{(rate - planned) / planned * 100:+.1f}%" if planned else ""
+        lines.append(
+            f"| {name} | {named.sales[k]} | {rate:.2f} | {pct} | {named.storage_waste[k].sum() / minutes:.2f} "
+            f"| {named.pool_overflow[k] / minutes:.2f} | {named.end_stock[k]:,.0f} |"
+        )
+    if sampled is not None and len(sampled.sales):
+        rate = sampled.realized_rate
+        waste = sampled.storage_waste.sum(axis=1) / minutes
+        overflow = sampled.pool_overflow / minutes
+        lines.append("")
+        lines.append(f"## {pattern} ({len(rate):,} samples)")
+        lines.append("")
+        lines.append("| Statistic | Sales | Tickets/min | vs plan | Storage waste/min | Pool overflow/min |")
+        lines.append("|-----------|------:|------------:|--------:|------------------:|------------------:|")
+        rows = [("mean", np.mean)] + [(f"p{q}", functools.partial(np.percentile, q=q)) for q in (10, 50, 90)]
+        for label, stat in rows:
+            r = float(stat(rate))
+            pct = f"{(r - planned) / planned * 100:+.1f}%" if planned else ""
+            lines.append(f"| {label} | {float(stat(sampled.sales)):.1f} | {r:.2f} | {pct} "
+                         f"| {float(stat(waste)):.2f} | {float(stat(overflow)):.2f} |")
+        mean_waste = sampled.storage_waste.mean(axis=0) / minutes
+        wasted = [k for k in np.argsort(-mean_waste) if mean_waste[k] > 0.005][:5]
+        if wasted:
+            lines.append("")
+            lines.append("Largest storage waste (mean tickets/min): " + ", ".join(
+                f"{sampled.stream_ids[k]} {mean_waste[k]:.2f}" for k in wasted
+            ))
+    lines.append("")
+    lines.append(
+        "Percentiles are taken per column. Tickets/min is realized sales over the whole horizon; "
+        "storage waste is product lost over storage_limit, pool overflow is outpost accumulation "
+        "lost at ticket_max, and unsold stock at the end is neither."
+    )
+    return "\n".join(lines)
+
+
 # =============================================================================
 # Main
 # =============================================================================
 
-def main():
+def _parse_bool(value: str) -> bool:
+    lowered = value.lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise argparse.ArgumentTypeError(f"expected a boolean, got {value!r}")
+
+
+def _parse_machine_cap(value: str) -> tuple[str, float]:
+    machine_id, sep, count = value.partition("=")
+    try:
+        if not sep or not machine_id:
+            raise ValueError
+        return machine_id, float(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MACHINE=COUNT, got {value!r}") from None
+
+
+def _add_machine_cap_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--machine-cap",
+        type=_parse_machine_cap,
+        action="append",
+        default=[],
+        metavar="MACHINE=COUNT",
+        help="Override a machine type's max count from recipes.json "
+             "(repeatable, e.g. forge_of_the_sky=12 for Forge Expansion IV)",
+    )
+
+
+def _add_fast_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Round the LP relaxation onto the machine grid instead of running branch-and-bound; "
+             "reports the LP bound and the gap to it (not with --recipe-level)",
+    )
+
+
+def _add_limit_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--time-limit", type=float, default=None, metavar="SECONDS",
+        help="MILP wall-time limit per solve; the best solution found so far is returned",
+    )
+    parser.add_argument(
+        "--mip-gap", type=float, default=None, metavar="FRACTION",
+        help="Stop once the relative gap to the dual bound is below FRACTION (HiGHS default 1e-4)",
+    )
+    parser.add_argument(
+        "--node-limit", type=int, default=None,
+        help="Maximum branch-and-bound nodes per solve",
+    )
+
+
+def _add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run the solver; do not read or write the result cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Result cache directory (default: $ENDFIELD_CACHE_DIR or <repo>/.cache/results)",
+    )
+
+
+def _resolve_cache_dir(cache_dir: Path | None, base_path: Path) -> Path:
+    if cache_dir is not None:
+        return cache_dir
+    env_dir = os.environ.get("ENDFIELD_CACHE_DIR")
+    if env_dir:
+        return Path(env_dir)
+    return base_path / ".cache" / "results"
+
+
+def sweep_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py sweep``: solve a scenario grid in parallel."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py sweep",
+        description="Solve a grid of scenarios in a process pool, streaming one row per scenario",
+    )
+    parser.add_argument("region", nargs="+", help="Region ID(s) (valley_iv, wuling)")
+    parser.add_argument(
+        "--interval", type=float, nargs="+", required=True,
+        help="Minimum trade interval(s) in hours",
+    )
+    parser.add_argument(
+        "-i", "--increment", type=int, nargs="+", choices=[1, 2, 3, 4], default=[4],
+        help="Machine increment divisor(s) (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, nargs="+", default=[1.30],
+        help="Outpost accumulation bonus multiplier(s) (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, nargs="+", choices=[1, 2], default=[2],
+        help="Cardiac Remediation Station level(s) (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, nargs="+", default=[None],
+        help="Power buffer override(s) in unit/sec (default: region value)",
+    )
+    parser.add_argument(
+        "--no-gourd", type=_parse_bool, nargs="*", default=[False],
+        help="Exclude Xiranite Gourd; pass 'false true' to sweep both (bare flag = true)",
+    )
+    parser.add_argument(
+        "--recipe-level", action="store_true",
+        help="Use the recipe-level model (one machine variable per recipe)",
+    )
+    _add_machine_cap_argument(parser)
+    _add_fast_argument(parser)
+    _add_limit_arguments(parser)
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Worker processes (default: CPU count; 1 = solve in-process)",
+    )
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Stream JSON lines (scenario + --json payload) instead of a markdown table",
+    )
+    _add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    no_gourd_values = args.no_gourd or [True]
+    if args.fast and args.recipe_level:
+        parser.error("--fast is not supported with --recipe-level")
+
+    base_path = Path(__file__).resolve().parent.parent
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    with open(base_path / "recipes.json", "r", encoding="utf-8") as f:
+        unknown = sorted(set(dict(machine_caps)) - set(json.load(f).get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+    # Compile-key fields outermost so input order matches the pool's chunking order
+    scenarios = [
+        Scenario(
+            region=region_id,
+            interval_hours=interval,
+            increment=increment,
+            bonus_rate=bonus,
+            cardiac_level=level,
+            power_buffer=buffer,
+            include_event_items=not no_gourd,
+            recipe_level=args.recipe_level,
+            machine_caps=machine_caps,
+            fast=args.fast,
+            time_limit=args.time_limit,
+            mip_rel_gap=args.mip_gap,
+            node_limit=args.node_limit,
+        )
+        for region_id, increment, no_gourd, level, buffer, bonus, interval in itertools.product(
+            args.region, args.increment, no_gourd_values, args.cardiac_level,
+            args.power_buffer, args.bonus, args.interval,
+        )
+    ]
+
+    if not args.json:
+        print(f"# Scenario Sweep ({len(scenarios)} scenarios)")
+        print("")
+        print("| Region | Interval | Inc | Bonus | Cardiac | Buffer | Gourd | Tickets/min | 支援成果券/min | Power Balance | Solve (ms) |")
+        print("|--------|----------|-----|-------|---------|--------|-------|-------------|----------------|---------------|------------|")
+
+    t0 = time.perf_counter()
+    cache_dir = None if args.no_cache else _resolve_cache_dir(args.cache_dir, base_path)
+    for scenario, result, solve_ms in run_sweep(scenarios, base_path, workers=args.workers, cache_dir=cache_dir):
+        if args.json:
+            row = {"scenario": asdict(scenario), "solve_ms": solve_ms, **result_to_dict(result)}
+            print(json.dumps(row), flush=True)
+            continue
+        buffer = "default" if scenario.power_buffer is None else f"{scenario.power_buffer:.0f}"
+        gourd = "yes" if scenario.include_event_items else "no"
+        if result.success:
+            gap = ""
+            if result.limit_reached or (result.mip_gap or 0) > 1e-6:
+                gap = f" (gap {result.mip_gap:.1%})"
+            values = (f"{result.ticket_rate:.2f}{gap} | {result.secondary_currency_rate:.2f} "
+                      f"| {result.power_balance:+.0f}")
+        else:
+            values = f"failed: {result.message} | | "
+        print(f"| {scenario.region} | {scenario.interval_hours}h | {scenario.increment} "
+              f"| {scenario.bonus_rate:.2f} | {scenario.cardiac_level} | {buffer} | {gourd} "
+              f"| {values} | {solve_ms:.1f} |", flush=True)
+
+    if not args.json:
+        print("")
+        print(f"Total wall time: {time.perf_counter() - t0:.2f}s")
+
+
+def curve_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py curve``: exact ticket rate over a range of intervals."""
     parser = argparse.ArgumentParser(
-        description="Solve Endfield production portfolio optimization"
+        prog="solve_portfolio.py curve",
+        description="Piecewise ticket_rate(interval) between two sale intervals, solving only at breakpoints",
+    )
+    parser.add_argument("region", help="Region ID (valley_iv, wuling)")
+    parser.add_argument("min_interval", type=float, help="Shortest sale interval in hours")
+    parser.add_argument("max_interval", type=float, help="Longest sale interval in hours")
+    parser.add_argument(
+        "-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+        help="Machine increment divisor (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, default=1.30,
+        help="Outpost accumulation bonus multiplier (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, choices=[1, 2], default=2,
+        help="Cardiac Remediation Station level (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, default=None,
+        help="Override default power buffer (unit/sec)",
+    )
+    parser.add_argument(
+        "--no-gourd", action="store_true",
+        help="Exclude Xiranite Gourd (event-limited item) from optimization",
+    )
+    parser.add_argument(
+        "--recipe-level", action="store_true",
+        help="Use the recipe-level model (one machine variable per recipe)",
+    )
+    _add_machine_cap_argument(parser)
+    parser.add_argument("--json", action="store_true", help="Output in JSON format")
+    args = parser.parse_args(argv)
+    if not 0 < args.min_interval < args.max_interval:
+        parser.error("expected 0 < min_interval < max_interval")
+
+    base_path = Path(__file__).resolve().parent.parent
+    cache = ModelCache(base_path)
+    try:
+        region = cache.region(args.region)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+
+    scenario = Scenario(
+        region=args.region,
+        interval_hours=args.max_interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        recipe_level=args.recipe_level,
+        machine_caps=machine_caps,
+    )
+    try:
+        curve = cache.model(scenario).interval_curve(
+            args.min_interval,
+            args.max_interval,
+            bonus_rate=args.bonus if scenario.multi_outpost else 1.0,
+            power_buffer=args.power_buffer,
+        )
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(asdict(curve), indent=2))
+    else:
+        print(format_curve(region, curve))
+
+
+def heatmap_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py heatmap``: ticket rate over two mining rates."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py heatmap",
+        description="Ticket rate over a grid of two mining rates, refined only where the optimum changes",
+    )
+    parser.add_argument("region", help="Region ID (valley_iv, wuling)")
+    parser.add_argument("x_key", help="Horizontal mining_rates key (e.g. cuprium_ore)")
+    parser.add_argument("x_min", type=float)
+    parser.add_argument("x_max", type=float)
+    parser.add_argument("y_key", help="Vertical mining_rates key (e.g. precipitation_acid)")
+    parser.add_argument("y_min", type=float)
+    parser.add_argument("y_max", type=float)
+    parser.add_argument(
+        "--steps", type=int, nargs="+", default=[17],
+        help="Grid points per axis, or X Y (default: 17)",
+    )
+    parser.add_argument("--interval", type=float, default=24.0, help="Minimum trade interval in hours (default: 24)")
+    parser.add_argument(
+        "-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+        help="Machine increment divisor (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, default=1.30,
+        help="Outpost accumulation bonus multiplier (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, choices=[1, 2], default=2,
+        help="Cardiac Remediation Station level (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, default=None,
+        help="Override default power buffer (unit/sec)",
+    )
+    parser.add_argument(
+        "--no-gourd", action="store_true",
+        help="Exclude Xiranite Gourd (event-limited item) from optimization",
+    )
+    parser.add_argument(
+        "--recipe-level", action="store_true",
+        help="Use the recipe-level model (one machine variable per recipe)",
+    )
+    _add_machine_cap_argument(parser)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.0,
+        help="Interpolate cells whose centre is within this relative error of the bilinear fit "
+             "(default: 0 = every point exact)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, default=None,
+        help="Also write the full grid to this file (JSON)",
+    )
+    args = parser.parse_args(argv)
+    if len(args.steps) > 2 or min(args.steps) < 2:
+        parser.error("--steps takes one or two values of at least 2")
+    nx, ny = args.steps[0], args.steps[-1]
+
+    base_path = Path(__file__).resolve().parent.parent
+    cache = ModelCache(base_path)
+    try:
+        region = cache.region(args.region)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+
+    scenario = Scenario(
+        region=args.region,
+        interval_hours=args.interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        recipe_level=args.recipe_level,
+        machine_caps=machine_caps,
+    )
+    try:
+        heatmap = cache.model(scenario).mining_heatmap(
+            args.interval,
+            args.x_key,
+            np.linspace(args.x_min, args.x_max, nx).tolist(),
+            args.y_key,
+            np.linspace(args.y_min, args.y_max, ny).tolist(),
+            bonus_rate=args.bonus if scenario.multi_outpost else 1.0,
+            power_buffer=args.power_buffer,
+            tolerance=args.tolerance,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scenario": asdict(scenario), **asdict(heatmap)}, f, separators=(",", ":"))
+    print(format_heatmap(region, heatmap, args.interval, args.output))
+
+
+def upgrades_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py upgrades``: rank candidate upgrades by ticket gain."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py upgrades",
+        description="Rank candidate upgrades (mining, machine caps, storage, power, cardiac level) "
+                    "by the ticket rate they add",
+    )
+    parser.add_argument("region", help="Region ID (valley_iv, wuling)")
+    parser.add_argument("candidates", type=Path, help="Upgrade candidates (JSON, see wuling_upgrades.json)")
+    parser.add_argument("--interval", type=float, default=24.0, help="Minimum trade interval in hours (default: 24)")
+    parser.add_argument(
+        "-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+        help="Machine increment divisor (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, default=1.30,
+        help="Outpost accumulation bonus multiplier (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, choices=[1, 2], default=2,
+        help="Cardiac Remediation Station level (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, default=None,
+        help="Override default power buffer (unit/sec)",
+    )
+    parser.add_argument(
+        "--no-gourd", action="store_true",
+        help="Exclude Xiranite Gourd (event-limited item) from optimization",
+    )
+    parser.add_argument(
+        "--recipe-level", action="store_true",
+        help="Use the recipe-level model (one machine variable per recipe)",
+    )
+    _add_machine_cap_argument(parser)
+    _add_fast_argument(parser)
+    _add_limit_arguments(parser)
+    parser.add_argument(
+        "--greedy", type=int, default=0, metavar="K",
+        help="Also build a greedy sequence of up to K upgrades, re-ranking after each pick",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Worker processes (default: CPU count; 1 = solve in-process)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output the rounds as JSON")
+    _add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.fast and args.recipe_level:
+        parser.error("--fast is not supported with --recipe-level")
+
+    base_path = Path(__file__).resolve().parent.parent
+    cache = ModelCache(base_path)
+    try:
+        region = cache.region(args.region)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+    try:
+        upgrades = load_upgrades(args.candidates)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(f"{args.candidates}: {e}")
+    if not upgrades:
+        parser.error(f"{args.candidates}: no upgrades")
+
+    base = Scenario(
+        region=args.region,
+        interval_hours=args.interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        recipe_level=args.recipe_level,
+        machine_caps=machine_caps,
+        fast=args.fast,
+        time_limit=args.time_limit,
+        mip_rel_gap=args.mip_gap,
+        node_limit=args.node_limit,
+    )
+    # Catch bad candidates here rather than inside a worker
+    model = cache.model(base)
+    for u in upgrades:
+        try:
+            u.apply(base, region)
+        except ValueError as e:
+            parser.error(str(e))
+        for key in u.mining_rates:
+            if key not in model.mining_rows and key not in model.mining_cols:
+                parser.error(f"{u.name}: {key} is not a mining constraint of the {args.region} model")
+
+    t0 = time.perf_counter()
+    cache_dir = None if args.no_cache else _resolve_cache_dir(args.cache_dir, base_path)
+    try:
+        rounds = rank_upgrades(
+            base, upgrades, region, base_path, greedy=args.greedy, workers=args.workers, cache_dir=cache_dir,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps({"scenario": asdict(base), "rounds": [asdict(r) for r in rounds]}, indent=2))
+        return
+    print(format_upgrades(region, rounds, upgrades, args.interval))
+    print("")
+    print(f"Total wall time: {time.perf_counter() - t0:.2f}s")
+
+
+def evaluate_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py evaluate``: score user portfolios against the optimum."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py evaluate",
+        description="Check given portfolios (machine counts) against every constraint and "
+                    "compare their ticket rate with the solver optimum",
+    )
+    parser.add_argument("region", help="Region ID (valley_iv, wuling)")
+    parser.add_argument("portfolios", type=Path, help="Portfolios (JSON, see valley4_portfolios.json)")
+    parser.add_argument("--interval", type=float, default=24.0, help="Minimum trade interval in hours (default: 24)")
+    parser.add_argument(
+        "-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+        help="Machine increment divisor of the optimum to compare with (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, default=1.30,
+        help="Outpost accumulation bonus multiplier (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, choices=[1, 2], default=2,
+        help="Cardiac Remediation Station level (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, default=None,
+        help="Override default power buffer (unit/sec)",
+    )
+    parser.add_argument(
+        "--no-gourd", action="store_true",
+        help="Exclude Xiranite Gourd (event-limited item) from optimization",
+    )
+    _add_machine_cap_argument(parser)
+    parser.add_argument("--top", type=int, default=None, help="Show only the best N portfolios")
+    parser.add_argument("--json", action="store_true", help="Output one JSON object per portfolio")
+    _add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    base_path = Path(__file__).resolve().parent.parent
+    cache_dir = None if args.no_cache else _resolve_cache_dir(args.cache_dir, base_path)
+    cache = ModelCache(base_path, ResultCache(cache_dir, base_path) if cache_dir is not None else None)
+    try:
+        region = cache.region(args.region)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+
+    scenario = Scenario(
+        region=args.region,
+        interval_hours=args.interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        machine_caps=machine_caps,
+    )
+    model = cache.model(scenario)
+    try:
+        names, machines, power_machines = load_portfolios(args.portfolios, region, model.table)
+    except (OSError, ValueError) as e:
+        parser.error(f"{args.portfolios}: {e}")
+
+    evaluation = model.evaluate(
+        machines,
+        power_machines,
+        args.interval,
+        bonus_rate=args.bonus if scenario.multi_outpost else 1.0,
+        power_buffer=args.power_buffer,
+    )
+    result = cache.solve(scenario)
+    optimum = result.ticket_rate if result.success else None
+
+    if args.json:
+        for k, name in enumerate(names):
+            row = {
+                "name": name,
+                "ticket_rate": float(evaluation.ticket_rate[k]),
+                "gap": None if optimum is None else optimum - float(evaluation.ticket_rate[k]),
+                "feasible": bool(evaluation.feasible[k]),
+                "storage_loss": float(evaluation.storage_loss[k]),
+                "cap_loss": float(evaluation.cap_loss[k]),
+                "slack": dict(zip(evaluation.constraint_ids, evaluation.slack[k].tolist())),
+            }
+            print(json.dumps(row))
+        return
+    print(format_evaluation(region, names, evaluation, optimum, args.interval, top=args.top))
+
+
+def simulate_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py simulate``: replay the optimum against sale schedules."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py simulate",
+        description="Solve a scenario, then replay its portfolio sale by sale against real or "
+                    "randomized sale schedules, tracking storage and outpost ticket pools",
+    )
+    parser.add_argument("region", help="Region ID (valley_iv, wuling)")
+    parser.add_argument("interval", type=float, help="Sale interval the portfolio is solved for, in hours")
+    parser.add_argument("--days", type=float, default=7.0, help="Simulated horizon in days (default: 7)")
+    parser.add_argument("--schedule", type=Path, default=None,
+                        help="Sale schedules (JSON, see wuling_schedules.json)")
+    parser.add_argument("--logins", type=float, nargs="+", default=None,
+                        help="Sample a daily pattern selling at these hours of day, e.g. --logins 8 22")
+    parser.add_argument("--jitter", type=float, default=1.0, help="Std. deviation of login times in hours (default: 1)")
+    parser.add_argument("--skip", type=float, default=0.0, help="Probability of missing a login (default: 0)")
+    parser.add_argument("--samples", type=int, default=10000, help="Sampled schedules (default: 10000)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument(
+        "-i", "--increment", type=int, choices=[1, 2, 3, 4], default=4,
+        help="Machine increment divisor (default: 4)",
+    )
+    parser.add_argument(
+        "--bonus", type=float, default=1.30,
+        help="Outpost accumulation bonus multiplier (default: 1.30)",
+    )
+    parser.add_argument(
+        "--cardiac-level", type=int, choices=[1, 2], default=2,
+        help="Cardiac Remediation Station level (Wuling only, default: 2)",
+    )
+    parser.add_argument(
+        "--power-buffer", type=float, default=None,
+        help="Override default power buffer (unit/sec)",
+    )
+    parser.add_argument(
+        "--no-gourd", action="store_true",
+        help="Exclude Xiranite Gourd (event-limited item) from optimization",
+    )
+    _add_machine_cap_argument(parser)
+    parser.add_argument("--json", action="store_true", help="Output one JSON object per schedule")
+    _add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.days <= 0 or args.interval <= 0:
+        parser.error("interval and --days must be positive")
+    if not 0 <= args.skip < 1:
+        parser.error("--skip must be in [0, 1)")
+
+    base_path = Path(__file__).resolve().parent.parent
+    cache_dir = None if args.no_cache else _resolve_cache_dir(args.cache_dir, base_path)
+    cache = ModelCache(base_path, ResultCache(cache_dir, base_path) if cache_dir is not None else None)
+    try:
+        region = cache.region(args.region)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+
+    scenario = Scenario(
+        region=args.region,
+        interval_hours=args.interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        machine_caps=machine_caps,
+    )
+    result = cache.solve(scenario)
+    if not result.success:
+        print(f"Optimization failed: {result.message}", file=sys.stderr)
+        sys.exit(1)
+    model = cache.model(scenario)
+    horizon = args.days * 24
+
+    names = [f"every {args.interval:g}h"]
+    regular = np.arange(args.interval, horizon + 1e-9, args.interval)
+    rows = [regular]
+    if args.schedule is not None:
+        try:
+            file_names, file_times = load_schedules(args.schedule)
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.schedule}: {e}")
+        names += file_names
+        rows += [t[~np.isnan(t)] for t in file_times]
+    times = np.full((len(rows), max(len(r) for r in rows)), np.nan)
+    for k, row in enumerate(rows):
+        times[k, :len(row)] = row
+    named = model.simulate(result, times, horizon, bonus_rate=args.bonus)
+
+    sampled = None
+    pattern = ""
+    if args.logins:
+        t0 = time.perf_counter()
+        samples = login_schedules(int(np.ceil(args.days)), args.logins, args.jitter, args.skip,
+                                  args.samples, args.seed)
+        sampled = model.simulate(result, samples, horizon, bonus_rate=args.bonus)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        pattern = (f"Logins at {', '.join(f'{h:g}:00' for h in args.logins)} ±{args.jitter:g}h, "
+                   f"{args.skip:.0%} missed")
+        print(f"Simulated {args.samples:,} schedules in {elapsed_ms:.0f} ms", file=sys.stderr)
+
+    if args.json:
+        for sim, labels in [(named, names), (sampled, None)]:
+            if sim is None:
+                continue
+            for k in range(len(sim.sales)):
+                print(json.dumps({
+                    "schedule": labels[k] if labels else f"sample {k}",
+                    "sales": int(sim.sales[k]),
+                    "ticket_rate": float(sim.realized_rate[k]),
+                    "sold_by_outpost": dict(zip(sim.group_ids, sim.sold[k].tolist())),
+                    "storage_waste": float(sim.storage_waste[k].sum()),
+                    "pool_overflow": float(sim.pool_overflow[k]),
+                    "end_stock": float(sim.end_stock[k]),
+                }))
+        return
+    print(format_simulation(region, args.interval, result.ticket_rate, names, named, sampled, pattern))
+
+
+def serve_main(argv: list[str]) -> None:
+    """Entry point for ``solve_portfolio.py serve``: a long-running solver with preloaded models."""
+    parser = argparse.ArgumentParser(
+        prog="solve_portfolio.py serve",
+        description="Serve JSON solve requests over localhost HTTP or a Unix socket, keeping compiled "
+                    "models in memory. POST /solve takes the CLI flags as JSON keys "
+                    '(e.g. {"region": "wuling", "interval": 24, "no_gourd": true}) and returns the '
+                    "--json payload; GET /stats reports request counts and latency percentiles.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765; 0 = any free port)")
+    parser.add_argument("--socket", type=Path, default=None, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument(
+        "--preload", nargs="*", default=["valley_iv", "wuling"],
+        help="Regions whose default model is compiled and solved at startup (default: valley_iv wuling)",
+    )
+    parser.add_argument("--memo-size", type=int, default=1024, help="Results kept in memory (default: 1024)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log one line per request")
+    _add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    base_path = Path(__file__).resolve().parent.parent
+    result_cache = None
+    if not args.no_cache:
+        result_cache = ResultCache(_resolve_cache_dir(args.cache_dir, base_path), base_path)
+    service = SolverService(ModelCache(base_path, result_cache), memo_size=args.memo_size)
+
+    t0 = time.perf_counter()
+    try:
+        service.preload([Scenario(region=region_id.lower(), interval_hours=24.0) for region_id in args.preload])
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading region data: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.preload:
+        print(f"Preloaded {', '.join(args.preload)} in {(time.perf_counter() - t0) * 1000:.0f} ms",
+              file=sys.stderr)
+    serve(service, host=args.host, port=args.port, socket_path=args.socket, quiet=args.quiet)
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "sweep":
+        sweep_main(argv[1:])
+        return
+    if argv and argv[0] == "curve":
+        curve_main(argv[1:])
+        return
+    if argv and argv[0] == "heatmap":
+        heatmap_main(argv[1:])
+        return
+    if argv and argv[0] == "upgrades":
+        upgrades_main(argv[1:])
+        return
+    if argv and argv[0] == "evaluate":
+        evaluate_main(argv[1:])
+        return
+    if argv and argv[0] == "simulate":
+        simulate_main(argv[1:])
+        return
+    if argv and argv[0] == "serve":
+        serve_main(argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Solve Endfield production portfolio optimization",
+        epilog="Run 'solve_portfolio.py sweep -h' to solve a scenario grid in parallel, "
+               "'solve_portfolio.py curve -h' for the exact ticket rate over a range of intervals, "
+               "'solve_portfolio.py heatmap -h' for the ticket rate over two mining rates, "
+               "'solve_portfolio.py upgrades -h' to rank candidate upgrades, "
+               "'solve_portfolio.py evaluate -h' to score given portfolios, "
+               "'solve_portfolio.py simulate -h' to replay the optimum against sale schedules, or "
+               "'solve_portfolio.py serve -h' to run a long-lived solver service.",
     )
     parser.add_argument(
         "region",
@@ -1443,15 +5096,37 @@ def main():
         default=2,
         help="Cardiac Remediation Station level (Wuling only, default: 2)",
     )
+    parser.add_argument(
+        "--recipe-level",
+        action="store_true",
+        help="Model every recipe's machine count instead of per-product chain totals "
+             "(shares intermediates and byproducts between products)",
+    )
+    _add_machine_cap_argument(parser)
+    _add_fast_argument(parser)
+    _add_limit_arguments(parser)
+    parser.add_argument(
+        "--sensitivity",
+        action="store_true",
+        help="Report marginal tickets/min per unit of each mining rate, power buffer, storage limit, "
+             "outpost ticket rate and machine cap, with the range each holds over",
+    )
+    _add_cache_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.fast and args.recipe_level:
+        parser.error("--fast is not supported with --recipe-level")
 
     # Find base path (assumes script is in scripts/ subdirectory)
     script_path = Path(__file__).resolve()
     base_path = script_path.parent.parent
 
+    result_cache = None
+    if not args.no_cache:
+        result_cache = ResultCache(_resolve_cache_dir(args.cache_dir, base_path), base_path)
+    cache = ModelCache(base_path, result_cache)
     try:
-        region = load_region_data(args.region, base_path)
+        region = cache.region(args.region)
     except (FileNotFoundError, ValueError) as e:
         print(f"Error loading region data: {e}", file=sys.stderr)
         sys.exit(1)
@@ -1460,51 +5135,31 @@ def main():
     if args.power_buffer is not None:
         region.power_buffer = args.power_buffer
 
-    # Calculate machine increment from CLI argument
-    machine_increment = 1.0 / args.increment
-
-    # Use multi-outpost solver for Wuling, legacy single-outpost for Valley IV
-    if args.region.lower() == "wuling":
-        result = solve_portfolio_multi_outpost(
-            region, args.interval,
-            machine_increment=machine_increment,
-            bonus_rate=args.bonus,
-            include_event_items=not args.no_gourd,
-            cardiac_remediation_level=args.cardiac_level,
-        )
-    else:
-        result = solve_portfolio(region, args.interval, machine_increment=machine_increment)
+    machine_caps = tuple(sorted(dict(args.machine_cap).items()))
+    unknown = sorted(set(dict(machine_caps)) - set(region.recipes.get("machines", {})))
+    if unknown:
+        parser.error(f"unknown machine(s) in --machine-cap: {', '.join(unknown)}")
+
+    scenario = Scenario(
+        region=args.region,
+        interval_hours=args.interval,
+        increment=args.increment,
+        bonus_rate=args.bonus,
+        cardiac_level=args.cardiac_level,
+        power_buffer=args.power_buffer,
+        include_event_items=not args.no_gourd,
+        recipe_level=args.recipe_level,
+        machine_caps=machine_caps,
+        fast=args.fast,
+        time_limit=args.time_limit,
+        mip_rel_gap=args.mip_gap,
+        node_limit=args.node_limit,
+        sensitivity=args.sensitivity,
+    )
+    result = cache.solve(scenario)
 
     if args.json:
-        outpost_data = None
-        if result.outpost_analysis:
-            oa = result.outpost_analysis
-            outpost_data = {
-                "total_accumulated": oa.total_accumulated,
-                "total_limit": oa.total_limit,
-                "available_tickets": oa.available_tickets,
-                "produced_tickets": oa.produced_tickets,
-                "effective_tickets": oa.effective_tickets,
-                "effective_rate": oa.effective_rate,
-                "is_limited": oa.is_limited,
-                "limit_ratio": oa.limit_ratio,
-                "outpost_details": oa.outpost_details,
-            }
-        output = {
-            "success": result.success,
-            "message": result.message,
-            "ticket_rate": result.ticket_rate,
-            "production_rates": result.production_rates,
-            "ore_consumption": result.ore_consumption,
-            "power_consumption": result.power_consumption,
-            "power_supply": result.power_supply,
-            "power_balance": result.power_balance,
-            "battery_for_power": result.battery_for_power,
-            "battery_for_sale": result.battery_for_sale,
-            "storage_analysis": result.storage_analysis,
-            "outpost_analysis": outpost_data,
-        }
-        print(json.dumps(output, indent=2))
+        print(json.dumps(result_to_dict(result), indent=2))
     else:
         print(format_output(region, result, args.interval))
 
@@ -1,36 +1,16 @@
 #!/usr/bin/env python3
 """Verify power consumption calculations for Valley IV products.
 
-Traces through production chains to calculate total power consumption
-including mining, farming, and processing.
+Solves production chains from recipes.json to calculate total power
+consumption including mining, farming, and processing.
 """
 
 import json
 from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
 
-@dataclass
-class Machine:
-    name: str
-    power: int
-
-
-MACHINES = {
-    "shredding_unit": Machine("Shredding Unit", 5),
-    "refining_unit": Machine("Refining Unit", 5),
-    "moulding_unit": Machine("Moulding Unit", 10),
-    "fitting_unit": Machine("Fitting Unit", 20),
-    "grinding_unit": Machine("Grinding Unit", 50),
-    "filling_unit": Machine("Filling Unit", 20),
-    "packaging_unit": Machine("Packaging Unit", 20),
-    "forge_of_the_sky": Machine("Forge of the Sky", 50),
-    "reactor_crucible": Machine("Reactor Crucible", 50),
-    "gearing_unit": Machine("Gearing Unit", 10),
-    "purification_unit": Machine("Purification Unit", 50),
-    "expanded_crucible": Machine("Expanded Crucible", 100),
-    "acid_resistant_pump_mk2": Machine("Acid Resistant Pump Mk II", 20),
-}
 
 # Mining power per ore/min
 # Electric Mining Rig: 5 power, 20/min
@@ -72,143 +52,157 @@ def load_recipes():
         return json.load(f)
 
 
-def calculate_production_chain(
-    recipes: dict,
-    target_item: str,
-    target_rate_per_min: float,
-    power_breakdown: dict = None,
-    byproduct_credits: dict = None,
-) -> tuple[float, dict, dict]:
+def find_recipe(recipes: dict, item: str) -> dict | None:
+    """
+    Find the recipe producing ``item``.
+
+    Recipes are keyed by id, which is usually the output item. Items with
+    alternative recipes (e.g. carbon_from_jincao / carbon_from_yazhen) fall
+    back to the first recipe listing the item as its first output.
     """
-    Calculate total power and resource consumption for producing an item.
+    recipe_data = recipes.get("recipes", {})
+    if item in recipe_data:
+        return recipe_data[item]
+    for recipe in recipe_data.values():
+        outputs = recipe.get("outputs", {})
+        if outputs and next(iter(outputs)) == item:
+            return recipe
+    return None
 
-    Args:
-        byproduct_credits: dict {item_id: rate_per_min} of byproducts already
-                          accumulated from upstream recipes; used to offset demand.
 
-    Returns:
-        (total_power_per_sec, ore_consumption_per_min, plant_consumption_per_min)
-        Note: ore_consumption may include "precipitation_acid", "clean_water"
-              as raw fluids.
+@dataclass
+class ChainResult:
     """
-    if power_breakdown is None:
-        power_breakdown = {}
-    if byproduct_credits is None:
-        byproduct_credits = {}
+    Net requirements for a batch of demand vectors (one column per demand).
 
-    ore_consumption = {}
-    plant_consumption = {}
-    total_power = 0.0
-
-    # Apply byproduct credit to reduce demand
-    if target_item in byproduct_credits and byproduct_credits[target_item] > 0:
-        credit = byproduct_credits[target_item]
-        used = min(credit, target_rate_per_min)
-        byproduct_credits[target_item] = credit - used
-        target_rate_per_min -= used
-        if target_rate_per_min <= 1e-9:
-            return 0.0, ore_consumption, plant_consumption
-
-    # Check if this is a raw material
-    items = recipes.get("items", {})
-    item_info = items.get(target_item, {})
-    item_type = item_info.get("type", "")
-
-    if item_type == "raw_ore":
-        # Ore - add mining power
-        mining_power = MINING_POWER_PER_UNIT.get(target_item, 0) * target_rate_per_min
-        ore_consumption[target_item] = target_rate_per_min
-        # Cuprium ore needs clean water for hydro mining
-        if target_item == "cuprium_ore":
-            water_rate = CUPRIUM_WATER_PER_ORE * target_rate_per_min
-            sub_power, _, _ = calculate_production_chain(
-                recipes, "clean_water", water_rate, power_breakdown, byproduct_credits
-            )
-            mining_power += sub_power
-        return mining_power, ore_consumption, plant_consumption
-
-    if item_type == "raw_fluid":
-        # Raw fluid - mining via pump
-        mining_power = MINING_POWER_PER_UNIT.get(target_item, 0) * target_rate_per_min
-        ore_consumption[target_item] = target_rate_per_min
-        if target_item == "clean_water":
-            # Use existing CLEAN_WATER_POWER_PER_UNIT
-            mining_power = CLEAN_WATER_POWER_PER_UNIT * target_rate_per_min
-            ore_consumption.pop(target_item, None)  # not really an ore
-        return mining_power, ore_consumption, plant_consumption
-
-    if item_type == "raw_plant":
-        # Plant - add farming power + water cost (Planting Unit drinks water)
-        farming_power = FARMING_POWER_PER_UNIT * target_rate_per_min
-        plant_consumption[target_item] = target_rate_per_min
-        # plants need water (1 water per plant)
-        water_rate = PLANT_WATER_PER_UNIT * target_rate_per_min
-        sub_power, _, _ = calculate_production_chain(
-            recipes, "clean_water", water_rate, power_breakdown, byproduct_credits
-        )
-        farming_power += sub_power
-        return farming_power, ore_consumption, plant_consumption
+    ``machines`` is indexed like RecipeGraph.recipe_ids; ``supply`` and
+    ``production`` like RecipeGraph.items. ``supply`` is the external input
+    each demand needs: mined ores and fluids, farmed plants, and byproduct-only
+    items such as sewage (negative = surplus left over by the chain).
+    """
+    machines: np.ndarray         # (n_recipes, k) machines running each recipe
+    supply: np.ndarray           # (n_items, k) net external supply per minute
+    production: np.ndarray       # (n_items, k) gross recipe output per minute
+    power: np.ndarray            # (k,) unit/sec including mining and farming
+    machine_count: np.ndarray    # (n_machine_types, k) machines by machine type
+    machine_power: np.ndarray    # (n_machine_types, k) processing power by machine type
 
-    # Find recipe for this item
-    recipe_data = recipes.get("recipes", {})
-    recipe = recipe_data.get(target_item)
-
-    if not recipe:
-        # No recipe found - might be raw material
-        print(f"Warning: No recipe found for {target_item}")
-        return 0.0, ore_consumption, plant_consumption
-
-    machine_name = recipe["machine"]
-    time_sec = recipe["time_sec"]
-    inputs = recipe.get("inputs", {})
-    outputs = recipe.get("outputs", {target_item: 1})
-    output_count = outputs.get(target_item, 1)
-
-    # Calculate machine throughput and count
-    output_per_sec = output_count / time_sec
-    output_per_min = output_per_sec * 60
-
-    machines_needed = target_rate_per_min / output_per_min
-    machine = MACHINES.get(machine_name)
-
-    if machine:
-        machine_power = machines_needed * machine.power
-        total_power += machine_power
-
-        # Track breakdown
-        if machine_name not in power_breakdown:
-            power_breakdown[machine_name] = 0
-        power_breakdown[machine_name] += machine_power
-
-    # Add byproducts to credits pool (other than target_item)
-    for byproduct, byproduct_count in outputs.items():
-        if byproduct == target_item:
-            continue
-        byproduct_rate = (byproduct_count / output_count) * target_rate_per_min
-        byproduct_credits[byproduct] = byproduct_credits.get(byproduct, 0) + byproduct_rate
 
-    # Recursively process inputs
-    for input_item, input_count in inputs.items():
-        # How much of this input do we need per minute?
-        input_per_output = input_count / output_count
-        input_rate_per_min = input_per_output * target_rate_per_min
+class RecipeGraph:
+    """
+    Item x recipe flow matrix built once from recipes.json.
 
-        sub_power, sub_ore, sub_plant = calculate_production_chain(
-            recipes, input_item, input_rate_per_min, power_breakdown, byproduct_credits
-        )
+    Every craftable item gets exactly one recipe (``find_recipe``), so the
+    craftable rows of the flow matrix form a square system
+    ``B @ machines = demand`` that is factorized once and solved for any
+    number of demand vectors. Multi-output recipes (cuprium, xircon_effluent,
+    hetonite, ...) are netted exactly instead of depending on visit order.
+    """
 
-        total_power += sub_power
+    def __init__(self, recipes: dict):
+        from scipy import sparse
+        from scipy.sparse.linalg import splu
+
+        items = list(recipes.get("items", {}))
+        recipe_data = recipes.get("recipes", {})
+        for recipe in recipe_data.values():
+            for item in list(recipe.get("inputs", {})) + list(recipe.get("outputs", {})):
+                if item not in items:
+                    items.append(item)
+        self.items = items
+        self.index = {item: i for i, item in enumerate(items)}
+        self.item_types = [recipes.get("items", {}).get(item, {}).get("type", "") for item in items]
+
+        crafted = [(item, find_recipe(recipes, item)) for item in items]
+        crafted = [(item, recipe) for item, recipe in crafted if recipe is not None]
+        recipe_ids = {id(r): rid for rid, r in recipe_data.items()}
+        self.recipe_ids = [recipe_ids[id(recipe)] for _, recipe in crafted]
+        self.craft_rows = np.array([self.index[item] for item, _ in crafted], dtype=int)
+
+        machine_data = recipes.get("machines", {})
+        self.machine_types = sorted({recipe["machine"] for _, recipe in crafted})
+        machine_index = {m: i for i, m in enumerate(self.machine_types)}
+
+        # flow[i, r]: net items/min of item i from one machine running recipe r
+        rows, cols, vals = [], [], []
+        machine_cols = []
+        for r, (_, recipe) in enumerate(crafted):
+            per_min = 60 / recipe["time_sec"]
+            for item, count in recipe.get("outputs", {}).items():
+                rows.append(self.index[item]); cols.append(r); vals.append(count * per_min)
+            for item, count in recipe.get("inputs", {}).items():
+                rows.append(self.index[item]); cols.append(r); vals.append(-count * per_min)
+            machine_cols.append(machine_index[recipe["machine"]])
+        n_recipes = len(crafted)
+        self.flow = sparse.csc_matrix((vals, (rows, cols)), shape=(len(items), n_recipes))
+        self._lu = splu(self.flow[self.craft_rows].tocsc())
+
+        # machine_of[m, r] = 1 if recipe r runs on machine type m
+        self.machine_of = sparse.csr_matrix(
+            (np.ones(n_recipes), (machine_cols, np.arange(n_recipes))),
+            shape=(len(self.machine_types), n_recipes),
+        )
+        self.type_power = np.array(
+            [machine_data.get(m, {}).get("power", 0) for m in self.machine_types], dtype=float,
+        )
 
-        for ore, amount in sub_ore.items():
-            ore_consumption[ore] = ore_consumption.get(ore, 0) + amount
+        # Power per unit/min of external supply; water for hydro mining and planting included
+        self.raw_power = np.zeros(len(items))
+        for i, (item, item_type) in enumerate(zip(items, self.item_types)):
+            if item_type == "raw_plant":
+                self.raw_power[i] = FARMING_POWER_PER_UNIT + PLANT_WATER_PER_UNIT * CLEAN_WATER_POWER_PER_UNIT
+            elif item == "clean_water":
+                self.raw_power[i] = CLEAN_WATER_POWER_PER_UNIT
+            elif item_type in ("raw_ore", "raw_fluid"):
+                self.raw_power[i] = MINING_POWER_PER_UNIT.get(item, 0.0)
+        if "cuprium_ore" in self.index:
+            self.raw_power[self.index["cuprium_ore"]] += CUPRIUM_WATER_PER_ORE * CLEAN_WATER_POWER_PER_UNIT
+
+    def demand(self, targets: list[tuple[str, float]]) -> np.ndarray:
+        """Demand matrix (n_items, len(targets)) with one (item, rate/min) per column."""
+        d = np.zeros((len(self.items), len(targets)))
+        for k, (item, rate) in enumerate(targets):
+            d[self.index[item], k] = rate
+        return d
+
+    def solve(self, demand: np.ndarray) -> ChainResult:
+        """Net requirements for each column of ``demand`` (items/min), in one sparse solve."""
+        demand = np.asarray(demand, dtype=float).reshape(len(self.items), -1)
+        machines = self._lu.solve(demand[self.craft_rows])
+        flow = self.flow @ machines
+        supply = demand - flow
+        supply[self.craft_rows] = 0.0
+        production = self.flow.maximum(0) @ machines
+        machine_count = self.machine_of @ machines
+        machine_power = self.type_power[:, None] * machine_count
+        # Surplus (negative supply) returns nothing: byproducts are not credited power
+        power = machine_power.sum(axis=0) + self.raw_power @ np.maximum(supply, 0.0)
+        return ChainResult(machines, supply, production, power, machine_count, machine_power)
+
+
+def _raw_consumption(graph: RecipeGraph, result: ChainResult, k: int) -> tuple[dict, dict]:
+    """(ore_consumption, plant_consumption) dicts for demand column ``k``."""
+    ore_consumption = {}
+    plant_consumption = {}
+    for i in np.flatnonzero(np.abs(result.supply[:, k]) > 1e-9):
+        item, item_type = graph.items[i], graph.item_types[i]
+        if item_type == "raw_plant":
+            plant_consumption[item] = float(result.supply[i, k])
+        elif item_type in ("raw_ore", "raw_fluid") and item != "clean_water":
+            ore_consumption[item] = float(result.supply[i, k])
+    return ore_consumption, plant_consumption
 
-        for plant, amount in sub_plant.items():
-            plant_consumption[plant] = plant_consumption.get(plant, 0) + amount
 
-    return total_power, ore_consumption, plant_consumption
+def _power_breakdown(graph: RecipeGraph, result: ChainResult, k: int) -> dict:
+    """Processing power by machine type for demand column ``k``."""
+    return {
+        machine: float(result.machine_power[m, k])
+        for m, machine in enumerate(graph.machine_types)
+        if result.machine_power[m, k] > 0
+    }
 
 
-def verify_wuling(recipes):
+def verify_wuling(recipes, graph: RecipeGraph):
     """Verify Wuling v1.2 product power and consumption."""
     print("\n" + "=" * 110)
     print("WULING v1.2 PRODUCT VERIFICATION")
@@ -229,17 +223,13 @@ def verify_wuling(recipes):
         ("hetonite_part", 6),
         ("xiranite_gourd", 6),
     ]
+    result = graph.solve(graph.demand(products))
+    items = recipes.get("items", {})
 
-    for product_id, rate in products:
-        power_breakdown = {}
-        byproduct_credits = {}
-        power, ore, plant = calculate_production_chain(
-            recipes, product_id, rate, power_breakdown, byproduct_credits
-        )
-
-        items = recipes.get("items", {})
-        item_info = items.get(product_id, {})
-        name = item_info.get("name_ja", product_id)
+    for k, (product_id, rate) in enumerate(products):
+        power = result.power[k]
+        ore, plant = _raw_consumption(graph, result, k)
+        name = items.get(product_id, {}).get("name_ja", product_id)
 
         orig = ore.get("originium_ore", 0)
         fer = ore.get("ferrium_ore", 0)
@@ -251,27 +241,25 @@ def verify_wuling(recipes):
 
     print("=" * 110)
     print("\nDetailed breakdown for new v1.2 products:\n")
-    for product_id in ["heavy_xiranite", "hetonite_part", "xiranite_gourd"]:
-        rate = 6
-        power_breakdown = {}
-        byproduct_credits = {}
-        power, ore, plant = calculate_production_chain(
-            recipes, product_id, rate, power_breakdown, byproduct_credits
-        )
-        items = recipes.get("items", {})
+    for k, (product_id, rate) in enumerate(products):
+        if product_id not in ("heavy_xiranite", "hetonite_part", "xiranite_gourd"):
+            continue
+        ore, plant = _raw_consumption(graph, result, k)
         name = items.get(product_id, {}).get("name_ja", product_id)
         print(f"{name} @ {rate}/min:")
-        print(f"  Power: {power:.1f} unit/sec")
-        print(f"  Raw materials: {dict((k, round(v, 1)) for k, v in ore.items())}")
-        print(f"  Plants: {dict((k, round(v, 1)) for k, v in plant.items())}")
+        print(f"  Power: {result.power[k]:.1f} unit/sec")
+        print(f"  Raw materials: {dict((key, round(v, 1)) for key, v in ore.items())}")
+        print(f"  Plants: {dict((key, round(v, 1)) for key, v in plant.items())}")
         print(f"  Power by machine:")
-        for m, p in sorted(power_breakdown.items(), key=lambda x: -x[1]):
+        for m, p in sorted(_power_breakdown(graph, result, k).items(), key=lambda x: -x[1]):
             print(f"    {m}: {p:.1f}")
         print()
 
 
 def main():
     recipes = load_recipes()
+    graph = RecipeGraph(recipes)
+    items = recipes.get("items", {})
 
     products = [
         ("origocrust", 30),
@@ -289,23 +277,23 @@ def main():
         ("sc_valley_battery", 6),
         ("hc_valley_battery", 6),
     ]
+    result = graph.solve(graph.demand(products))
+    power_by_product = dict(zip((pid for pid, _ in products), result.power))
 
     print("=" * 100)
     print(f"{'Product':<25} {'Rate':<8} {'Power':>10} {'Orig Ore':>10} {'Ame Ore':>10} {'Fer Ore':>10} {'Plants':>10}")
     print("=" * 100)
 
-    for product_id, rate in products:
-        power_breakdown = {}
-        power, ore, plant = calculate_production_chain(recipes, product_id, rate, power_breakdown)
+    for k, (product_id, rate) in enumerate(products):
+        power = result.power[k]
+        ore, plant = _raw_consumption(graph, result, k)
 
         orig = ore.get("originium_ore", 0)
         ame = ore.get("amethyst_ore", 0)
         fer = ore.get("ferrium_ore", 0)
         plant_total = sum(plant.values())
 
-        items = recipes.get("items", {})
-        item_info = items.get(product_id, {})
-        name = item_info.get("name_ja", product_id)
+        name = items.get(product_id, {}).get("name_ja", product_id)
 
         print(f"{name:<25} {rate:<8} {power:>10.1f} {orig:>10.0f} {ame:>10.0f} {fer:>10.0f} {plant_total:>10.0f}")
 
@@ -314,14 +302,15 @@ def main():
 
     # Detailed breakdown for カプセルⅢ
     print("蕎花カプセルⅢ @ 6/min:")
-    power_breakdown = {}
-    power, ore, plant = calculate_production_chain(recipes, "buck_capsule_a", 6, power_breakdown)
+    k = next(k for k, (pid, _) in enumerate(products) if pid == "buck_capsule_a")
+    power = result.power[k]
+    ore, plant = _raw_consumption(graph, result, k)
 
     print(f"  Total power: {power:.1f} unit/sec")
     print(f"  Ore: originium={ore.get('originium_ore', 0):.0f}, amethyst={ore.get('amethyst_ore', 0):.0f}, ferrium={ore.get('ferrium_ore', 0):.0f}")
     print(f"  Plants: {plant}")
     print("  Power breakdown by machine:")
-    for machine, pwr in sorted(power_breakdown.items(), key=lambda x: -x[1]):
+    for machine, pwr in sorted(_power_breakdown(graph, result, k).items(), key=lambda x: -x[1]):
         print(f"    {machine}: {pwr:.1f} unit/sec")
 
     # Calculate mining portion
@@ -352,17 +341,13 @@ def main():
     ]
 
     for product_id, rate, opt_sample, opt_solved in comparisons:
-        power_breakdown = {}
-        power, _, _ = calculate_production_chain(recipes, product_id, rate, power_breakdown)
-
-        items = recipes.get("items", {})
-        item_info = items.get(product_id, {})
-        name = item_info.get("name_ja", product_id)
+        power = power_by_product[product_id]
+        name = items.get(product_id, {}).get("name_ja", product_id)
 
         diff = power - opt_sample
         print(f"{name:<25} {power:>12.1f} {opt_sample:>12} {opt_solved:>12} {diff:>+18.1f}")
 
-    verify_wuling(recipes)
+    verify_wuling(recipes, graph)
 
 
 if __name__ == "__main__":